@@ -0,0 +1,4 @@
+import time
+
+# Início da importação da aplicação, para medir o tempo de inicialização dos workers
+INICIO_IMPORTACAO = time.perf_counter()
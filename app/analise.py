@@ -0,0 +1,222 @@
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, limite: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: escolhe 'limite' pontos da série (x crescente)
+    que preservam a forma visual do gráfico. Retorna os índices escolhidos.
+
+    O primeiro e o último ponto são sempre mantidos; os demais são divididos em
+    limite - 2 buckets e, em cada um, fica o ponto que forma o maior triângulo com
+    o ponto escolhido no bucket anterior e a média do bucket seguinte. As médias
+    e as áreas são calculadas de forma vetorizada; só a passagem pelos buckets é
+    sequencial, pois cada escolha depende da anterior.
+    """
+    n = len(x)
+    if limite >= n or limite < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # limite - 1 bordas delimitam os limite - 2 buckets no intervalo [1, n - 1)
+    bordas = np.linspace(1, n - 1, limite - 1).astype(np.int64)
+    tamanhos = np.diff(bordas)
+    medias_x = np.add.reduceat(x[1:n - 1], bordas[:-1] - 1) / tamanhos
+    medias_y = np.add.reduceat(y[1:n - 1], bordas[:-1] - 1) / tamanhos
+    # O "bucket seguinte" do último bucket é o último ponto
+    medias_x = np.append(medias_x[1:], x[n - 1])
+    medias_y = np.append(medias_y[1:], y[n - 1])
+
+    indices = np.empty(limite, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    anterior = 0
+    for bucket in range(limite - 2):
+        inicio, fim = bordas[bucket], bordas[bucket + 1]
+        ax, ay = x[anterior], y[anterior]
+        areas = np.abs(
+            (ax - medias_x[bucket]) * (y[inicio:fim] - ay) - (ax - x[inicio:fim]) * (medias_y[bucket] - ay)
+        )
+        anterior = inicio + int(np.argmax(areas))
+        indices[bucket + 1] = anterior
+    return indices
+
+
+def reduzir_serie(serie, max_pontos: int):
+    """
+    Reduz uma série de linhas (periodo, valor) a no máximo 'max_pontos' por LTTB,
+    usando a data do período como eixo x. Séries menores voltam inalteradas.
+    """
+    total = len(serie)
+    if total <= max_pontos:
+        return serie
+    x = np.fromiter((ponto.periodo.toordinal() for ponto in serie), dtype=np.float64, count=total)
+    y = np.fromiter((ponto.valor for ponto in serie), dtype=np.float64, count=total)
+    return [serie[indice] for indice in lttb(x, y, max_pontos)]
+
+
+def postos(valores: np.ndarray) -> np.ndarray:
+    """ Postos (1..n) dos valores, com a média dos postos para os empates, como no Spearman. """
+    valores = np.asarray(valores)
+    n = len(valores)
+    ordem = np.argsort(valores, kind="mergesort")
+    ordenados = valores[ordem]
+    inicio_empate = np.r_[True, ordenados[1:] != ordenados[:-1]]
+    inicios = np.flatnonzero(inicio_empate)
+    fins = np.r_[inicios[1:], n]
+    resultado = np.empty(n, dtype=np.float64)
+    resultado[ordem] = ((inicios + fins + 1) / 2)[np.cumsum(inicio_empate) - 1]
+    return resultado
+
+
+def _pearson(x: np.ndarray, y: np.ndarray):
+    dx, dy = x - x.mean(), y - y.mean()
+    denominador = np.sqrt(np.dot(dx, dx) * np.dot(dy, dy))
+    return float(np.dot(dx, dy) / denominador) if denominador > 0 else None
+
+
+def correlacao(x: np.ndarray, y: np.ndarray):
+    """
+    Coeficientes de Pearson e de Spearman e a reta de mínimos quadrados y = a·x + b.
+    Os valores ficam None quando não há pontos suficientes ou uma das variáveis é constante.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) < 2:
+        return {"pearson": None, "spearman": None, "regressao": None}
+
+    pearson = _pearson(x, y)
+    regressao = None
+    dx = x - x.mean()
+    variancia_x = np.dot(dx, dx)
+    if variancia_x > 0:
+        inclinacao = float(np.dot(dx, y - y.mean()) / variancia_x)
+        regressao = {
+            "inclinacao": inclinacao,
+            "intercepto": float(y.mean() - inclinacao * x.mean()),
+            "r2": pearson ** 2 if pearson is not None else 0.0,
+        }
+    return {"pearson": pearson, "spearman": _pearson(postos(x), postos(y)), "regressao": regressao}
+
+
+def resumir_idade_falhas(linhas, largura_faixa: int):
+    """
+    Resume as linhas (idade_veiculo_anos, nome_empresa, total_falhas) de cada veículo:
+    correlação entre idade e falhas e totais por faixa de idade e empresa. Tudo é
+    calculado de forma vetorizada sobre o resultado da consulta.
+    """
+    total = len(linhas)
+    idades = np.fromiter((linha.idade_veiculo_anos for linha in linhas), dtype=np.int64, count=total)
+    falhas = np.fromiter((linha.total_falhas for linha in linhas), dtype=np.int64, count=total)
+    empresas, codigos = np.unique(np.array([linha.nome_empresa for linha in linhas], dtype=object), return_inverse=True)
+
+    inicios = (idades // largura_faixa) * largura_faixa
+    chaves, grupo = np.unique(inicios * len(empresas) + codigos, return_inverse=True)
+    veiculos_por_grupo = np.bincount(grupo, minlength=len(chaves))
+    falhas_por_grupo = np.bincount(grupo, weights=falhas, minlength=len(chaves))
+
+    faixas = [
+        {
+            "idade_inicio": int(chave // len(empresas)),
+            "idade_fim": int(chave // len(empresas)) + largura_faixa - 1,
+            "nome_empresa": empresas[chave % len(empresas)],
+            "total_veiculos": int(veiculos),
+            "total_falhas": int(soma),
+            "media_falhas": float(soma / veiculos),
+        }
+        for chave, veiculos, soma in zip(chaves, veiculos_por_grupo, falhas_por_grupo)
+    ]
+    return {"total_veiculos": total, **correlacao(idades, falhas), "faixas": faixas}
+
+
+# Percentis informados para cada métrica no resumo da análise de eficiência
+PERCENTIS_EFICIENCIA = (10, 25, 50, 75, 90)
+
+# Quadrantes, por (acima do corte em passageiros/km, acima do corte em passageiros/minuto)
+QUADRANTES_EFICIENCIA = {
+    (True, True): "alta_km_alta_minuto",
+    (True, False): "alta_km_baixa_minuto",
+    (False, True): "baixa_km_alta_minuto",
+    (False, False): "baixa_km_baixa_minuto",
+}
+
+
+def _fora_das_cercas(valores: np.ndarray) -> np.ndarray:
+    """ Marca os valores fora das cercas de Tukey (1,5 × o intervalo interquartil). """
+    q1, q3 = np.percentile(valores, [25, 75])
+    amplitude = 1.5 * (q3 - q1)
+    return (valores < q1 - amplitude) | (valores > q3 + amplitude)
+
+
+def classificar_eficiencia(linhas, percentil_corte: float = 50):
+    """
+    Classifica as linhas (passageiros_por_km, passageiros_por_minuto, total_passageiros)
+    nos quadrantes definidos pelo percentil de corte de cada métrica (a mediana, por
+    padrão) e resume cada quadrante. As linhas fora das cercas de Tukey em qualquer
+    das métricas são os outliers. Devolve o resumo e, separadamente, as linhas com o
+    quadrante de cada uma, na ordem recebida.
+    """
+    total = len(linhas)
+    por_km = np.fromiter((linha.passageiros_por_km for linha in linhas), dtype=np.float64, count=total)
+    por_minuto = np.fromiter((linha.passageiros_por_minuto for linha in linhas), dtype=np.float64, count=total)
+    passageiros = np.fromiter((linha.total_passageiros for linha in linhas), dtype=np.float64, count=total)
+    if total == 0:
+        resumo = {
+            "total_linhas": 0, "percentil_corte": percentil_corte,
+            "corte_passageiros_por_km": None, "corte_passageiros_por_minuto": None,
+            "percentis": [], "quadrantes": [], "outliers": [],
+        }
+        return resumo, []
+
+    corte_km = float(np.percentile(por_km, percentil_corte))
+    corte_minuto = float(np.percentile(por_minuto, percentil_corte))
+    # Código do quadrante: 2 bits, (acima em passageiros/km, acima em passageiros/minuto)
+    codigos = (por_km > corte_km).astype(np.int64) * 2 + (por_minuto > corte_minuto)
+    nomes = [QUADRANTES_EFICIENCIA[(bool(codigo & 2), bool(codigo & 1))] for codigo in range(4)]
+
+    contagem = np.bincount(codigos, minlength=4)
+    soma_passageiros = np.bincount(codigos, weights=passageiros, minlength=4)
+    soma_km = np.bincount(codigos, weights=por_km, minlength=4)
+    soma_minuto = np.bincount(codigos, weights=por_minuto, minlength=4)
+    quadrantes = [
+        {
+            "quadrante": nomes[codigo],
+            "total_linhas": int(contagem[codigo]),
+            "total_passageiros": int(soma_passageiros[codigo]),
+            "media_passageiros_por_km": float(soma_km[codigo] / contagem[codigo]),
+            "media_passageiros_por_minuto": float(soma_minuto[codigo] / contagem[codigo]),
+        }
+        for codigo in range(3, -1, -1) if contagem[codigo]
+    ]
+
+    valores_km = np.percentile(por_km, PERCENTIS_EFICIENCIA)
+    valores_minuto = np.percentile(por_minuto, PERCENTIS_EFICIENCIA)
+    percentis = [
+        {"percentil": p, "passageiros_por_km": float(km), "passageiros_por_minuto": float(minuto)}
+        for p, km, minuto in zip(PERCENTIS_EFICIENCIA, valores_km, valores_minuto)
+    ]
+
+    classificadas = [
+        {
+            "id_linha": linha.id_linha,
+            "cod_linha": linha.cod_linha,
+            "nome_linha": linha.nome_linha,
+            "passageiros_por_km": linha.passageiros_por_km,
+            "passageiros_por_minuto": linha.passageiros_por_minuto,
+            "total_passageiros": linha.total_passageiros,
+            "quadrante": nomes[codigo],
+        }
+        for linha, codigo in zip(linhas, codigos)
+    ]
+    outliers = np.flatnonzero(_fora_das_cercas(por_km) | _fora_das_cercas(por_minuto))
+
+    resumo = {
+        "total_linhas": total,
+        "percentil_corte": percentil_corte,
+        "corte_passageiros_por_km": corte_km,
+        "corte_passageiros_por_minuto": corte_minuto,
+        "percentis": percentis,
+        "quadrantes": quadrantes,
+        "outliers": [classificadas[indice] for indice in outliers],
+    }
+    return resumo, classificadas
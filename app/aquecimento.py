@@ -0,0 +1,196 @@
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app.cache import ao_mudar_versao, versao_dados
+from app.database import sessao_leitura, settings
+from app.periodos import PERIODOS_PADRAO, resolver_periodo
+from app.queries import (
+    bairros as queries_bairros,
+    concessionarias as queries_concessionarias,
+    empresas as queries_empresas,
+    geral as queries_geral,
+    linhas as queries_linhas,
+    ocorrencias as queries_ocorrencias,
+    veiculos as queries_veiculos,
+)
+from app.queries.versao import get_ultima_data_carregada
+
+logger = logging.getLogger(__name__)
+
+# Limite padrão dos rankings nos routers: é o que os dashboards pedem na prática
+_LIMITE_RANKING = 10
+
+_visualizacoes = Counter()
+_trava_visualizacoes = threading.Lock()
+
+estado = {"status": "pendente", "versao": None, "total": 0, "concluidas": 0, "falhas": 0, "duracao_segundos": None}
+_trava_execucao = threading.Lock()
+_reexecutar = threading.Event()
+
+
+def registrar_visualizacao(tipo: str, id_entidade: int):
+    """ Conta a abertura do dashboard de uma entidade, para priorizar o aquecimento. """
+    with _trava_visualizacoes:
+        _visualizacoes[(tipo, id_entidade)] += 1
+
+
+def _mais_vistos(tipo: str, n: int):
+    with _trava_visualizacoes:
+        return [id_ for (t, id_), _ in _visualizacoes.most_common() if t == tipo][:n]
+
+
+def _executar(tarefas):
+    """ Executa as tarefas (função com cache, argumentos) com concorrência limitada no pool. """
+    def executar(funcao, args):
+        with sessao_leitura() as db:
+            return funcao.recalcular(db, *args)
+
+    resultados = {}
+    with ThreadPoolExecutor(
+        max_workers=settings.aquecimento_concorrencia, thread_name_prefix="aquecimento"
+    ) as executor:
+        futuros = {executor.submit(executar, funcao, args): (funcao, args) for funcao, args in tarefas}
+        for futuro in as_completed(futuros):
+            try:
+                resultados[futuros[futuro]] = futuro.result()
+            except Exception:
+                estado["falhas"] += 1
+                funcao, args = futuros[futuro]
+                logger.exception("Aquecimento: falha em %s%s", funcao.__name__, args)
+            estado["concluidas"] += 1
+            if estado["concluidas"] % 25 == 0 or estado["concluidas"] == estado["total"]:
+                logger.info("Aquecimento: %d/%d consultas concluídas", estado["concluidas"], estado["total"])
+    return resultados
+
+
+def _tarefas_rankings(inicio, fim):
+    tarefas = [(queries_geral.get_kpis_gerais, (inicio, fim))]
+    tarefas += [(queries_linhas.get_ranking_linhas, (m, inicio, fim, _LIMITE_RANKING))
+                for m in ("passageiros", "viagens", "ocorrencias")]
+    tarefas += [(queries_bairros.get_ranking_bairros, (m, inicio, fim, _LIMITE_RANKING))
+                for m in ("linhas", "ocorrencias", "pontos")]
+    tarefas += [(queries_veiculos.get_ranking_veiculos, (m, inicio, fim, _LIMITE_RANKING))
+                for m in ("passageiros", "ocorrencias", "km_percorrido")]
+    tarefas += [(queries_ocorrencias.get_ranking_ocorrencias_por_entidade, (e, inicio, fim, _LIMITE_RANKING))
+                for e in ("empresa", "concessionaria", "linha")]
+    tarefas += [
+        (queries_ocorrencias.get_ranking_ocorrencias_por_justificativa, (inicio, fim, _LIMITE_RANKING)),
+        (queries_empresas.get_ranking_empresas, (inicio, fim)),
+        (queries_concessionarias.get_ranking_concessionarias, (inicio, fim)),
+    ]
+    return tarefas
+
+
+def _tarefas_dashboards(inicio, fim, rankings):
+    """
+    Dashboards das N entidades mais vistas de cada tipo. Enquanto não há visualizações
+    suficientes (ex.: logo após o deploy), completa com as primeiras dos rankings.
+    """
+    n = settings.aquecimento_top_n
+
+    def completar(tipo, ids_ranking):
+        ids = _mais_vistos(tipo, n)
+        return ids + [id_ for id_ in ids_ranking if id_ not in ids][: n - len(ids)]
+
+    def ranking(funcao, *args):
+        return rankings.get((funcao, args)) or []
+
+    linhas = completar("linha", [r.id for r in ranking(
+        queries_linhas.get_ranking_linhas, "passageiros", inicio, fim, _LIMITE_RANKING)])
+    veiculos = completar("veiculo", [r.id_veiculo for r in ranking(
+        queries_veiculos.get_ranking_veiculos, "passageiros", inicio, fim, _LIMITE_RANKING)])
+    bairros = completar("bairro", [r.id for r in ranking(
+        queries_bairros.get_ranking_bairros, "linhas", inicio, fim, _LIMITE_RANKING)])
+    justificativas = completar("justificativa", [r.id for r in ranking(
+        queries_ocorrencias.get_ranking_ocorrencias_por_justificativa, inicio, fim, _LIMITE_RANKING)])
+    empresas = completar("empresa", [r.id_empresa for r in ranking(
+        queries_empresas.get_ranking_empresas, inicio, fim)])
+    concessionarias = completar("concessionaria", [r.id_concessionaria for r in ranking(
+        queries_concessionarias.get_ranking_concessionarias, inicio, fim)])
+
+    return (
+        [(queries_linhas.get_dashboard_linha, (id_, inicio, fim)) for id_ in linhas]
+        + [(queries_veiculos.get_dashboard_veiculo, (id_, inicio, fim)) for id_ in veiculos]
+        + [(queries_bairros.get_dashboard_bairro, (id_, inicio, fim)) for id_ in bairros]
+        + [(queries_ocorrencias.get_dashboard_justificativa, (id_, inicio, fim)) for id_ in justificativas]
+        + [(queries_empresas.get_dashboard_empresa, (id_, inicio, fim)) for id_ in empresas]
+        + [(queries_concessionarias.get_dashboard_concessionaria, (id_, inicio, fim)) for id_ in concessionarias]
+    )
+
+
+def aquecer():
+    """
+    Pré-calcula, para as janelas padrão (último mês, ano corrente e últimos 12 meses),
+    os KPIs, todos os rankings e os dashboards das entidades mais vistas, gravando
+    os resultados no cache. Só uma execução roda por vez; um pedido que chega durante
+    a execução faz o aquecimento rodar de novo ao final.
+    """
+    if not _trava_execucao.acquire(blocking=False):
+        _reexecutar.set()
+        return
+    try:
+        while True:
+            _reexecutar.clear()
+            try:
+                _aquecer()
+            except Exception:
+                estado["status"] = "falhou"
+                logger.exception("Falha no aquecimento do cache")
+            if not _reexecutar.is_set():
+                break
+    finally:
+        _trava_execucao.release()
+
+
+def _aquecer():
+    inicio_execucao = time.monotonic()
+    with sessao_leitura() as db:
+        referencia = get_ultima_data_carregada(db)
+        versao = versao_dados(db)
+    if referencia is None:
+        logger.info("Aquecimento: nenhuma viagem carregada, nada a fazer")
+        return
+
+    janelas = [resolver_periodo(nome, referencia) for nome in PERIODOS_PADRAO]
+    estado.update(status="executando", versao=versao, total=0, concluidas=0, falhas=0, duracao_segundos=None)
+    logger.info("Aquecimento iniciado para a versão %s (janelas: %s)", versao, janelas)
+
+    tarefas = [tarefa for inicio, fim in janelas for tarefa in _tarefas_rankings(inicio, fim)]
+    estado["total"] = len(tarefas)
+    rankings = _executar(tarefas)
+
+    tarefas = [tarefa for inicio, fim in janelas for tarefa in _tarefas_dashboards(inicio, fim, rankings)]
+    estado["total"] += len(tarefas)
+    _executar(tarefas)
+
+    estado.update(status="concluido", duracao_segundos=round(time.monotonic() - inicio_execucao, 2))
+    logger.info(
+        "Aquecimento concluído em %.1fs: %d consultas, %d falhas",
+        estado["duracao_segundos"], estado["concluidas"], estado["falhas"],
+    )
+
+
+def iniciar_aquecimento():
+    """ Dispara o aquecimento em uma thread de fundo, sem bloquear quem chamou. """
+    if settings.aquecimento_habilitado:
+        threading.Thread(target=aquecer, name="aquecimento-cache", daemon=True).start()
+
+
+# Cada nova carga de dados (mudança de versão) dispara um novo aquecimento
+ao_mudar_versao(lambda versao: iniciar_aquecimento())
+
+
+def monitorar_versao(parar: threading.Event):
+    """
+    Consulta a versão dos dados periodicamente, para que uma carga nova seja
+    percebida (e o cache reaquecido) mesmo sem requisições chegando.
+    """
+    while not parar.wait(settings.versao_dados_ttl_segundos):
+        try:
+            with sessao_leitura() as db:
+                versao_dados(db)
+        except Exception:
+            logger.exception("Falha ao consultar a versão dos dados")
@@ -0,0 +1,174 @@
+import functools
+import inspect
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.orm import Session
+
+from app.database import sessao_leitura, settings
+from app.queries.versao import get_versao_dados
+
+logger = logging.getLogger(__name__)
+
+
+class CacheLRU:
+    """ Dicionário limitado, seguro entre threads, que descarta o item usado há mais tempo. """
+
+    def __init__(self, max_itens: int):
+        self.max_itens = max_itens
+        self._itens = OrderedDict()
+        self._trava = threading.Lock()
+
+    def get(self, chave):
+        with self._trava:
+            valor = self._itens.get(chave)
+            if valor is not None:
+                self._itens.move_to_end(chave)
+            return valor
+
+    def set(self, chave, valor):
+        with self._trava:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._trava:
+            self._itens.clear()
+
+
+_versao = {"valor": None, "anterior": None, "lida_em": 0.0}
+_trava_versao = threading.Lock()
+_ao_mudar_versao = []
+
+
+def ao_mudar_versao(callback):
+    """
+    Registra uma função chamada com a nova versão sempre que versao_dados detecta
+    uma mudança (ex.: fim de uma carga do ETL). A primeira leitura não conta como mudança.
+    """
+    _ao_mudar_versao.append(callback)
+    return callback
+
+
+def versao_dados(db: Session) -> str:
+    """
+    Retorna um identificador da versão atual dos dados, que muda a cada carga.
+    O valor é consultado no banco no máximo uma vez a cada versao_dados_ttl_segundos.
+    """
+    with _trava_versao:
+        agora = time.monotonic()
+        if _versao["valor"] is not None and agora - _versao["lida_em"] <= settings.versao_dados_ttl_segundos:
+            return _versao["valor"]
+        marcadores = get_versao_dados(db)
+        versao = "-".join(str(valor) for valor in marcadores)
+        mudou = _versao["anterior"] is not None and versao != _versao["anterior"]
+        _versao.update(valor=versao, anterior=versao, lida_em=agora)
+
+    if mudou:
+        for callback in _ao_mudar_versao:
+            try:
+                callback(versao)
+            except Exception:
+                logger.exception("Falha ao notificar a mudança de versão dos dados")
+    return versao
+
+
+def invalidar_versao_dados():
+    """ Força a próxima chamada de versao_dados a consultar o banco. """
+    with _trava_versao:
+        _versao["valor"] = None
+
+
+def argumentos_normalizados(assinatura: inspect.Signature, db, args, kwargs) -> tuple:
+    """
+    Normaliza os argumentos de uma chamada f(db, ...) para uma tupla posicional,
+    com os valores padrão aplicados e sem a sessão. Assim, chamadas equivalentes
+    (posicionais ou nomeadas) geram a mesma chave de cache.
+    """
+    argumentos = assinatura.bind(db, *args, **kwargs)
+    argumentos.apply_defaults()
+    return tuple(argumentos.arguments.values())[1:]
+
+
+class _EntradaCache:
+    def __init__(self, valor, versao: str):
+        self.valor = valor
+        self.versao = versao
+        self.calculada_em = time.monotonic()
+
+
+cache_resultados = CacheLRU(settings.cache_resultados_max_itens)
+
+# Executor dedicado às atualizações em segundo plano: o recálculo de uma entrada
+# vencida nunca ocupa a thread de uma requisição.
+_executor_atualizacao = ThreadPoolExecutor(
+    max_workers=settings.cache_atualizacao_workers, thread_name_prefix="cache-atualizacao"
+)
+_em_atualizacao = set()
+_trava_atualizacao = threading.Lock()
+
+
+def _atualizar_em_segundo_plano(funcao, chave, args):
+    with _trava_atualizacao:
+        if chave in _em_atualizacao:
+            return
+        _em_atualizacao.add(chave)
+
+    def atualizar():
+        try:
+            with sessao_leitura() as db:
+                valor = funcao(db, *args)
+                cache_resultados.set(chave, _EntradaCache(valor, versao_dados(db)))
+        except Exception:
+            logger.exception("Falha ao atualizar em segundo plano a entrada de cache %s", chave[0])
+        finally:
+            with _trava_atualizacao:
+                _em_atualizacao.discard(chave)
+
+    _executor_atualizacao.submit(atualizar)
+
+
+def cache_swr(funcao):
+    """
+    Decorator de cache stale-while-revalidate para funções de consulta no formato
+    f(db, *parametros). Uma entrada vencida (pelo TTL ou por mudança na versão dos
+    dados) continua sendo servida enquanto um recálculo roda no executor dedicado,
+    até o limite de cache_staleness_maximo_segundos; acima dele, o resultado é
+    recalculado na própria requisição.
+    A função decorada ganha o atributo 'recalcular(db, ...)', que calcula e grava
+    a entrada imediatamente (usado pelo aquecimento do cache).
+    """
+    nome = f"{funcao.__module__}.{funcao.__name__}"
+    assinatura = inspect.signature(funcao)
+
+    @functools.wraps(funcao)
+    def wrapper(db, *args, **kwargs):
+        argumentos = argumentos_normalizados(assinatura, db, args, kwargs)
+        chave = (nome, argumentos)
+        versao = versao_dados(db)
+        entrada = cache_resultados.get(chave)
+        if entrada is not None:
+            idade = time.monotonic() - entrada.calculada_em
+            if idade <= settings.cache_ttl_segundos and entrada.versao == versao:
+                return entrada.valor
+            if idade <= settings.cache_staleness_maximo_segundos:
+                _atualizar_em_segundo_plano(funcao, chave, argumentos)
+                return entrada.valor
+
+        valor = funcao(db, *argumentos)
+        cache_resultados.set(chave, _EntradaCache(valor, versao))
+        return valor
+
+    def recalcular(db, *args, **kwargs):
+        argumentos = argumentos_normalizados(assinatura, db, args, kwargs)
+        valor = funcao(db, *argumentos)
+        cache_resultados.set((nome, argumentos), _EntradaCache(valor, versao_dados(db)))
+        return valor
+
+    wrapper.recalcular = recalcular
+    return wrapper
@@ -0,0 +1,66 @@
+import re
+from typing import Dict
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.database import settings
+
+# Parâmetros no estilo do text() do SQLAlchemy (:nome), sem confundir com casts (::TEXT)
+_PARAMETRO = re.compile(r"(?<![:\w]):([a-zA-Z_]\w*)")
+
+# Chave, em connection.info, com os nomes das consultas já preparadas naquela conexão
+_CHAVE_PREPARADAS = "consultas_preparadas"
+
+_catalogo: Dict[str, "Consulta"] = {}
+
+
+class Consulta:
+    """
+    Uma consulta do catálogo. O SQL é compilado uma única vez, na importação do
+    módulo, e executado no Postgres como prepared statement nomeado: o PREPARE
+    acontece na primeira execução em cada conexão do pool e as seguintes só
+    enviam EXECUTE com os parâmetros, sem repetir o parse e o planejamento.
+    A política de plano genérico/customizado vem de settings.plan_cache_mode.
+    """
+
+    def __init__(self, nome: str, sql: str):
+        if nome in _catalogo:
+            raise ValueError(f"Consulta '{nome}' já registrada no catálogo.")
+        self.nome = nome
+        self.texto = text(sql)
+
+        self.parametros = []
+        for parametro in _PARAMETRO.findall(sql):
+            if parametro not in self.parametros:
+                self.parametros.append(parametro)
+        posicoes = {parametro: indice for indice, parametro in enumerate(self.parametros, start=1)}
+        corpo = _PARAMETRO.sub(lambda m: f"${posicoes[m.group(1)]}", sql).strip().rstrip(";")
+        self.sql_prepare = f"PREPARE {nome} AS {corpo}"
+        argumentos = ", ".join(f"%({parametro})s" for parametro in self.parametros)
+        self.sql_execute = f"EXECUTE {nome}({argumentos})" if argumentos else f"EXECUTE {nome}"
+        _catalogo[nome] = self
+
+    def preparar(self, conexao):
+        """ Prepara a consulta na conexão (SQLAlchemy Connection), se ainda não estiver preparada. """
+        preparadas = conexao.connection.info.setdefault(_CHAVE_PREPARADAS, set())
+        if self.nome not in preparadas:
+            conexao.exec_driver_sql(self.sql_prepare)
+            # PREPARE não é transacional: a consulta continua preparada mesmo após um rollback
+            preparadas.add(self.nome)
+
+    def executar(self, db: Session, parametros: Dict = None):
+        parametros = parametros or {}
+        conexao = db.connection()
+        if not settings.consultas_preparadas or conexao.dialect.name != "postgresql":
+            return db.execute(self.texto, parametros)
+
+        self.preparar(conexao)
+        return conexao.exec_driver_sql(
+            self.sql_execute, {parametro: parametros[parametro] for parametro in self.parametros}
+        )
+
+
+def consultas_catalogo():
+    """ Todas as consultas registradas, por nome. """
+    return dict(_catalogo)
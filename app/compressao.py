@@ -0,0 +1,261 @@
+import gzip
+import hashlib
+import zlib
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.cache import CacheLRU, versao_dados
+from app.database import settings
+from app.memoria_compartilhada import Segmento, segmento
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele, só gzip é oferecido
+    brotli = None
+
+# Tipos de conteúdo que valem a pena comprimir. Parquet já sai comprimido (snappy)
+# e text/event-stream precisa chegar ao cliente sem buffer intermediário.
+_TIPOS_COMPRESSIVEIS = (
+    "text/csv",
+    "text/plain",
+    "text/html",
+    "application/json",
+    "application/geo+json",
+    "application/msgpack",
+    "application/vnd.apache.arrow.stream",
+    "application/vnd.apache.arrow.file",
+)
+
+
+def _codificacoes_disponiveis():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def escolher_codificacao(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Escolhe a codificação de conteúdo a partir do cabeçalho Accept-Encoding,
+    respeitando os pesos (q). Em empate, brotli é preferido a gzip.
+    """
+    if not accept_encoding:
+        return None
+
+    pesos = {}
+    for item in accept_encoding.split(","):
+        nome, *parametros = [parte.strip().lower() for parte in item.split(";")]
+        peso = 1.0
+        for parametro in parametros:
+            if parametro.startswith("q="):
+                try:
+                    peso = float(parametro[2:])
+                except ValueError:
+                    peso = 0.0
+        pesos[nome] = peso
+
+    melhor, melhor_peso = None, 0.0
+    for codificacao in _codificacoes_disponiveis():
+        peso = pesos.get(codificacao, pesos.get("*", 0.0))
+        if peso > melhor_peso:
+            melhor, melhor_peso = codificacao, peso
+    return melhor
+
+
+class _Compressor:
+    """ Compressor incremental: cada trecho sai descarregado para o cliente recebê-lo na hora. """
+
+    def __init__(self, codificacao: str, nivel: Optional[int] = None):
+        self.codificacao = codificacao
+        if codificacao == "br":
+            self._compressor = brotli.Compressor(quality=5 if nivel is None else nivel)
+        else:
+            self._compressor = zlib.compressobj(6 if nivel is None else nivel, zlib.DEFLATED, 31)
+
+    def parcial(self, dados: bytes) -> bytes:
+        if self.codificacao == "br":
+            return self._compressor.process(dados) + self._compressor.flush()
+        return self._compressor.compress(dados) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def final(self) -> bytes:
+        if self.codificacao == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def _compressivel(headers: Headers) -> bool:
+    tipo = headers.get("content-type", "").split(";")[0].strip().lower()
+    return "content-encoding" not in headers and tipo in _TIPOS_COMPRESSIVEIS
+
+
+class CompressaoMiddleware:
+    """
+    Middleware ASGI que comprime as respostas com brotli ou gzip conforme o
+    Accept-Encoding do cliente. Respostas completas abaixo de 'minimo_bytes' saem
+    sem compressão; respostas em streaming (ex.: exportações) são comprimidas
+    trecho a trecho, sem acumular o corpo em memória. Respostas que já trazem
+    Content-Encoding (ex.: as pré-comprimidas do cache) passam direto.
+    """
+
+    def __init__(self, app, minimo_bytes: int = 1024):
+        self.app = app
+        self.minimo_bytes = minimo_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        codificacao = escolher_codificacao(Headers(scope=scope).get("accept-encoding"))
+        if codificacao is None:
+            await self.app(scope, receive, send)
+            return
+
+        inicio = None
+        compressor = None
+        passar_direto = False
+
+        async def enviar(mensagem):
+            nonlocal inicio, compressor, passar_direto
+
+            if mensagem["type"] == "http.response.start":
+                inicio = mensagem
+                return
+            if passar_direto:
+                await send(mensagem)
+                return
+            if mensagem["type"] != "http.response.body":
+                # Outros tipos de mensagem (ex.: extensões ASGI) seguem sem compressão
+                passar_direto = True
+                await send(inicio)
+                await send(mensagem)
+                return
+
+            corpo = mensagem.get("body", b"")
+            mais = mensagem.get("more_body", False)
+
+            if compressor is None:
+                headers = MutableHeaders(raw=inicio["headers"])
+                if not _compressivel(headers) or (not mais and len(corpo) < self.minimo_bytes):
+                    passar_direto = True
+                    await send(inicio)
+                    await send(mensagem)
+                    return
+
+                compressor = _Compressor(codificacao)
+                headers["Content-Encoding"] = codificacao
+                headers.add_vary_header("Accept-Encoding")
+                if not mais:
+                    corpo = compressor.parcial(corpo) + compressor.final()
+                    headers["Content-Length"] = str(len(corpo))
+                    await send(inicio)
+                    await send({"type": "http.response.body", "body": corpo})
+                    return
+                if "content-length" in headers:
+                    del headers["Content-Length"]
+                await send(inicio)
+
+            dados = compressor.parcial(corpo)
+            if not mais:
+                dados += compressor.final()
+            await send({"type": "http.response.body", "body": dados, "more_body": mais})
+
+        await self.app(scope, receive, enviar)
+
+
+class RespostaPreComprimida:
+    """ Corpo JSON de uma resposta e suas variantes comprimidas, para uma versão dos dados. """
+
+    def __init__(self, versao: str, corpo: bytes):
+        self.versao = versao
+        self.etag = f'W/"{hashlib.blake2b(corpo, digest_size=12).hexdigest()}"'
+        self.corpos = {None: corpo}
+        if len(corpo) >= settings.compressao_minimo_bytes:
+            self.corpos["gzip"] = gzip.compress(corpo, compresslevel=9)
+            if brotli is not None:
+                self.corpos["br"] = brotli.compress(corpo, quality=9)
+
+    def itens(self, prefixo: str = "") -> Dict[str, bytes]:
+        """ O ETag e as variantes, por chave, para gravação em um segmento compartilhado. """
+        itens = {f"{prefixo}etag": self.etag.encode("ascii")}
+        for codificacao, corpo in self.corpos.items():
+            itens[f"{prefixo}{codificacao or 'identity'}"] = corpo
+        return itens
+
+    @classmethod
+    def do_segmento(cls, segmento: Segmento, prefixo: str = "") -> "RespostaPreComprimida":
+        """ Reconstrói a resposta gravada com itens(prefixo), com os corpos lidos do segmento sem cópia. """
+        resposta = cls.__new__(cls)
+        resposta.versao = segmento.versao
+        resposta.etag = bytes(segmento.get(f"{prefixo}etag")).decode("ascii")
+        resposta.corpos = {}
+        for codificacao in (None, "gzip", "br"):
+            corpo = segmento.get(f"{prefixo}{codificacao or 'identity'}")
+            if corpo is not None:
+                resposta.corpos[codificacao] = corpo
+        return resposta
+
+
+cache_respostas = CacheLRU(settings.cache_respostas_max_itens)
+
+# Catálogos de dimensões, iguais para todos os workers: só eles vão para segmentos de memória
+# compartilhada (um arquivo por chave). Respostas por entidade (ex.: "linhas:{cod_linha}:pontos")
+# ficam na memória do processo, limitadas por cache_respostas.
+CHAVES_COMPARTILHADAS = frozenset({
+    "linhas:filtro", "bairros:filtro", "empresas:filtro", "concessionarias:filtro", "veiculos:filtro",
+})
+
+
+@lru_cache(maxsize=None)
+def _adaptador(modelo) -> TypeAdapter:
+    return TypeAdapter(modelo)
+
+
+def preparar_resposta_pre_comprimida(db: Session, chave: str, modelo, produzir: Callable[[], Any]):
+    """
+    A resposta pré-comprimida da 'chave' na versão atual dos dados. O corpo é
+    produzido, validado pelo 'modelo' e comprimido uma única vez por versão dos
+    dados; nas CHAVES_COMPARTILHADAS, por um dos workers, em um segmento de memória
+    compartilhada que os demais só mapeiam.
+    """
+    versao = versao_dados(db)
+    entrada = cache_respostas.get(chave)
+    if entrada is None or entrada.versao != versao:
+        def construir():
+            adaptador = _adaptador(modelo)
+            dados = adaptador.validate_python(produzir(), from_attributes=True)
+            return RespostaPreComprimida(versao, adaptador.dump_json(dados))
+
+        if chave in CHAVES_COMPARTILHADAS:
+            entrada = RespostaPreComprimida.do_segmento(
+                segmento(f"resposta-{chave}", versao, lambda: construir().itens())
+            )
+        else:
+            entrada = construir()
+        cache_respostas.set(chave, entrada)
+    return entrada
+
+
+def resposta_pre_comprimida(request: Request, db: Session, chave: str, modelo, produzir: Callable[[], Any]):
+    """
+    Serve uma resposta cacheável a partir de bytes já comprimidos (ver
+    preparar_resposta_pre_comprimida); as requisições só escolhem a variante
+    pelo Accept-Encoding.
+    """
+    return responder_pre_comprimida(request, preparar_resposta_pre_comprimida(db, chave, modelo, produzir))
+
+
+def responder_pre_comprimida(request: Request, entrada: RespostaPreComprimida, media_type: str = "application/json"):
+    """ Responde com a variante de 'entrada' aceita pelo cliente, ou 304 se o ETag confere. """
+    headers = {"ETag": entrada.etag, "Vary": "Accept-Encoding"}
+    if request.headers.get("if-none-match") == entrada.etag:
+        return Response(status_code=304, headers=headers)
+
+    codificacao = escolher_codificacao(request.headers.get("accept-encoding"))
+    if codificacao not in entrada.corpos:
+        codificacao = None
+    if codificacao is not None:
+        headers["Content-Encoding"] = codificacao
+    return Response(content=entrada.corpos[codificacao], media_type=media_type, headers=headers)
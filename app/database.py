@@ -1,10 +1,86 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker
 from pydantic_settings import BaseSettings
 
+logger = logging.getLogger(__name__)
+
 
 class Settings(BaseSettings):
     database_url: str
+    # Réplicas de leitura, separadas por vírgula. Todas as consultas da API são somente leitura
+    # e vão para a réplica saudável com menos requisições em andamento; sem réplicas, vão ao primário.
+    database_replica_urls: str = ""
+    # Réplicas com atraso de replicação acima disso deixam de receber leituras até se recuperarem
+    replica_lag_maximo_segundos: float = 30
+    replica_verificacao_intervalo_segundos: float = 10
+    # Quantidade de linhas buscadas por vez do cursor no servidor nas exportações
+    exportacao_tamanho_lote: int = 50000
+    # Respostas menores que isso não são comprimidas
+    compressao_minimo_bytes: int = 1024
+    # Por quanto tempo a versão dos dados lida do banco é reaproveitada antes de ser consultada de novo
+    versao_dados_ttl_segundos: int = 30
+    cache_respostas_max_itens: int = 2048
+    # Coalescência de consultas idênticas concorrentes também entre workers (via travas de arquivo)
+    singleflight_entre_processos: bool = True
+    # Diretório das travas e resultados compartilhados (privado: do usuário do processo, modo 0700);
+    # vazio usa um subdiretório de XDG_RUNTIME_DIR ou do tmp do sistema
+    singleflight_dir: str = ""
+    # Cache de resultados com stale-while-revalidate: até cache_ttl_segundos o resultado é servido
+    # como novo; depois disso, e até cache_staleness_maximo_segundos, é servido enquanto é recalculado
+    # em segundo plano; acima desse limite, é recalculado no caminho da requisição.
+    cache_ttl_segundos: int = 300
+    cache_staleness_maximo_segundos: int = 3600
+    cache_resultados_max_itens: int = 4096
+    cache_atualizacao_workers: int = 2
+    # Aquecimento do cache na inicialização e a cada nova versão dos dados
+    aquecimento_habilitado: bool = True
+    aquecimento_concorrencia: int = 4
+    aquecimento_top_n: int = 10
+    # Prazos (statement_timeout) por grupo de endpoints; 0 desativa
+    prazo_kpis_rankings_segundos: float = 10
+    prazo_dashboards_segundos: float = 20
+    prazo_estudos_segundos: float = 30
+    # Intervalo entre as verificações de desconexão do cliente durante uma consulta
+    desconexao_verificacao_intervalo_segundos: float = 0.5
+    # Executa as consultas do catálogo (app/catalogo.py) como prepared statements no servidor.
+    # Desligue se houver um pooler em modo transação (ex.: PgBouncer) entre a API e o banco.
+    consultas_preparadas: bool = True
+    # plan_cache_mode do Postgres: auto, force_generic_plan ou force_custom_plan
+    plan_cache_mode: str = "auto"
+    # Widgets executados em paralelo por requisição do endpoint de página
+    pagina_concorrencia: int = 8
+    # Intervalo máximo sem mensagens no canal de eventos (SSE) antes de um comentário de keep-alive
+    eventos_heartbeat_segundos: float = 15
+    # Agregados recalculados em paralelo na atualização incremental (python -m app.manutencao.agregados)
+    agregados_concorrencia: int = 6
+    # id_justificativa (separados por vírgula) que o ETL classifica como falha mecânica; enquanto vazio,
+    # agg_falhas_mecanicas_diarias não é atualizada incrementalmente
+    agregados_ids_justificativa_falha_mecanica: str = ""
+    # Pontos processados por lote na reconstrução das tabelas ponte (python -m app.manutencao.pontes)
+    pontes_tamanho_lote: int = 5000
+    # Amostra estratificada (dia x linha) de fact_viagens para o modo aproximado (python -m app.manutencao.amostra)
+    amostra_fracao: float = 0.02
+    amostra_minimo_estrato: int = 2
+    # Arquivo SQLite com os dashboards de meses fechados pré-calculados (python -m app.manutencao.snapshots);
+    # vazio desativa a leitura dos snapshots
+    snapshots_arquivo: str = "snapshots.sqlite3"
+    snapshots_concorrencia: int = 4
+    # Estruturas pré-calculadas (rotas, respostas pré-comprimidas) em segmentos mapeados em memória,
+    # construídos por um worker e lidos pelos demais. O diretório precisa ser privado (do usuário do
+    # processo, modo 0700); vazio usa XDG_RUNTIME_DIR, /dev/shm ou o tmp do sistema
+    memoria_compartilhada: bool = True
+    memoria_compartilhada_dir: str = ""
+    # Prontidão (/health/ready): conexões abertas por destino de leitura antes de receber tráfego
+    # (limitado ao pool_size do engine), intervalo entre tentativas e meta de tempo de inicialização
+    prontidao_conexoes_minimas: int = 5
+    prontidao_intervalo_tentativas_segundos: float = 5
+    inicializacao_alvo_segundos: float = 10
 
     class Config:
         env_file = ".env"
@@ -12,13 +88,183 @@ class Settings(BaseSettings):
 
 settings = Settings()
 
-engine = create_engine(settings.database_url)
+
+def _argumentos_conexao(url: str):
+    # O plan_cache_mode vale para a sessão inteira de cada conexão, definido já na conexão
+    if make_url(url).get_backend_name() == "postgresql" and settings.plan_cache_mode != "auto":
+        return {"options": f"-c plan_cache_mode={settings.plan_cache_mode}"}
+    return {}
+
+
+engine = create_engine(settings.database_url, connect_args=_argumentos_conexao(settings.database_url))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+class _Destino:
+    """ Um banco que pode receber leituras (o primário ou uma réplica) e suas métricas. """
+
+    def __init__(self, nome: str, engine, replica: bool):
+        self.nome = nome
+        self.engine = engine
+        self.replica = replica
+        self.sessoes = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        # Réplicas só recebem leituras depois da primeira verificação bem-sucedida
+        self.saudavel = not replica
+        self.lag_segundos = None
+        self.em_andamento = 0
+        self.total_requisicoes = 0
+        self.falhas_verificacao = 0
+        self.ultima_verificacao = None
+        self.ultimo_erro = None
+
+    def metricas(self):
+        return {
+            "nome": self.nome,
+            "replica": self.replica,
+            "saudavel": self.saudavel,
+            "lag_segundos": self.lag_segundos,
+            "em_andamento": self.em_andamento,
+            "total_requisicoes": self.total_requisicoes,
+            "falhas_verificacao": self.falhas_verificacao,
+            "ultima_verificacao": self.ultima_verificacao,
+            "ultimo_erro": self.ultimo_erro,
+        }
+
+
+def _nome_destino(engine) -> str:
+    return f"{engine.url.host}:{engine.url.port or 5432}/{engine.url.database}"
+
+
+class RoteadorLeitura:
+    """
+    Distribui as sessões de leitura entre as réplicas pelo critério de menos
+    requisições em andamento. Réplicas que falham na verificação de saúde ou
+    cujo atraso de replicação passa do limite saem da rotação; sem nenhuma
+    réplica disponível, as leituras caem para o primário.
+    """
+
+    def __init__(self, engine_primario, urls_replicas):
+        self.primario = _Destino(_nome_destino(engine_primario), engine_primario, replica=False)
+        self.replicas = []
+        for url in urls_replicas:
+            engine_replica = create_engine(url, pool_pre_ping=True, connect_args=_argumentos_conexao(url))
+            self.replicas.append(_Destino(_nome_destino(engine_replica), engine_replica, replica=True))
+        self._trava = threading.Lock()
+
+    def _escolher(self) -> _Destino:
+        with self._trava:
+            disponiveis = [replica for replica in self.replicas if replica.saudavel]
+            destino = min(disponiveis, key=lambda r: r.em_andamento) if disponiveis else self.primario
+            destino.em_andamento += 1
+            destino.total_requisicoes += 1
+            return destino
+
+    @contextmanager
+    def sessao(self):
+        destino = self._escolher()
+        db = destino.sessoes()
+        try:
+            yield db
+        finally:
+            db.close()
+            with self._trava:
+                destino.em_andamento -= 1
+
+    def verificar(self):
+        """ Mede o atraso de replicação de cada réplica e atualiza sua disponibilidade. """
+        # Com o WAL recebido todo reaplicado e o receptor transmitindo, a réplica está em dia
+        # mesmo que o primário esteja ocioso há tempo (quando now() - pg_last_xact_replay_timestamp()
+        # cresceria à toa). Com o receptor desconectado, o LSN recebido para de avançar e o
+        # reaplicado o alcança: aí o atraso só pode ser medido pela última transação reaplicada.
+        # O status de pg_stat_wal_receiver só é visível com pg_read_all_stats; sem ele, vale a medida
+        # pela última transação, que nunca subestima o atraso.
+        query = text("""
+            SELECT CASE
+                WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+                    AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0
+                ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+            END AS lag_segundos;
+        """)
+        for replica in self.replicas:
+            try:
+                with replica.engine.connect() as conexao:
+                    lag = conexao.execute(query).scalar()
+                if lag is None:
+                    # Receptor parado e nenhuma transação reaplicada: não há como saber o atraso
+                    replica.lag_segundos = None
+                    replica.ultimo_erro = "Réplica sem transmissão de WAL e sem transações reaplicadas"
+                    saudavel = False
+                else:
+                    replica.lag_segundos = float(lag)
+                    replica.ultimo_erro = None
+                    saudavel = replica.lag_segundos <= settings.replica_lag_maximo_segundos
+            except Exception as e:
+                replica.falhas_verificacao += 1
+                replica.ultimo_erro = (str(e).splitlines() or [type(e).__name__])[0]
+                saudavel = False
+            if saudavel != replica.saudavel:
+                logger.warning("Réplica %s %s", replica.nome, "voltou à rotação" if saudavel else "saiu da rotação")
+            replica.saudavel = saudavel
+            replica.ultima_verificacao = time.time()
+
+    def monitorar(self, parar: threading.Event):
+        """ Verifica as réplicas periodicamente até 'parar' ser sinalizado. """
+        while True:
+            self.verificar()
+            if parar.wait(settings.replica_verificacao_intervalo_segundos):
+                break
+
+    def metricas(self):
+        return [self.primario.metricas()] + [replica.metricas() for replica in self.replicas]
+
+
+roteador_leitura = RoteadorLeitura(
+    engine, [url.strip() for url in settings.database_replica_urls.split(",") if url.strip()]
+)
+
+
+def sessao_leitura():
+    """ Abre uma sessão somente leitura roteada para uma réplica (ou para o primário). """
+    return roteador_leitura.sessao()
+
+
 def get_db():
-    db = SessionLocal()
-    try:
+    with sessao_leitura() as db:
         yield db
-    finally:
-        db.close()
+
+
+@event.listens_for(Session, "after_begin")
+def _aplicar_prazo(session, transaction, connection):
+    """
+    Ao iniciar a transação, aplica o prazo da sessão (session.info["prazo_ms"]) como
+    statement_timeout local à transação e guarda a conexão do driver, que é por
+    onde uma consulta em andamento pode ser cancelada.
+    """
+    session.info["conexao_dbapi"] = connection.connection.dbapi_connection
+    prazo_ms = session.info.get("prazo_ms")
+    if prazo_ms:
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(prazo_ms)}")
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _liberar_conexao(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("conexao_dbapi", None)
+
+
+def cancelar_consulta(db: Session) -> bool:
+    """
+    Cancela a consulta em andamento na sessão, se houver, pelo cancelamento do
+    driver (equivalente a pg_cancel_backend). Pode ser chamada de outra thread.
+    """
+    conexao = db.info.get("conexao_dbapi")
+    if conexao is None:
+        return False
+    db.info["cancelada_por_desconexao"] = True
+    conexao.cancel()
+    return True
+
+
+def consulta_cancelada(erro: Exception) -> bool:
+    """ Indica se o erro veio de uma consulta cancelada (statement_timeout ou cancelamento). """
+    return getattr(getattr(erro, "orig", None), "pgcode", None) == "57014"
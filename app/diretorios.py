@@ -0,0 +1,53 @@
+import logging
+import os
+import stat
+import tempfile
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Diretórios já recusados, para avisar uma única vez por diretório
+_recusados = set()
+
+
+def _bases_padrao():
+    # XDG_RUNTIME_DIR (/run/user/<uid>) já é privado do usuário; o tmp do sistema é o último recurso
+    return [os.environ.get("XDG_RUNTIME_DIR"), tempfile.gettempdir()]
+
+
+def diretorio_privado(configurado: str, nome: str, bases: Iterable[Optional[str]] = None) -> Optional[str]:
+    """
+    Diretório para arquivos compartilhados entre os workers do mesmo usuário: o
+    'configurado' ou, se vazio, o subdiretório 'nome' na primeira base existente.
+    Como o conteúdo é lido de volta pela API (pickle, corpos de resposta), o
+    diretório só é aceito se não for um link simbólico, pertencer ao usuário do
+    processo e não der acesso a mais ninguém (modo 0700); senão, retorna None e
+    quem chamou deve trabalhar só com a memória do processo.
+    """
+    if not hasattr(os, "getuid"):
+        return None
+    diretorio = configurado
+    if not diretorio:
+        base = next(base for base in [*(bases or []), *_bases_padrao()] if base and os.path.isdir(base))
+        diretorio = os.path.join(base, nome)
+
+    try:
+        os.makedirs(diretorio, mode=0o700, exist_ok=True)
+        info = os.lstat(diretorio)
+    except OSError:
+        logger.exception("Diretório compartilhado %s indisponível", diretorio)
+        return None
+    if (
+        stat.S_ISLNK(info.st_mode)
+        or not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077
+    ):
+        if diretorio not in _recusados:
+            _recusados.add(diretorio)
+            logger.warning(
+                "Diretório compartilhado %s recusado: precisa ser um diretório do usuário %d com modo 0700",
+                diretorio, os.getuid(),
+            )
+        return None
+    return diretorio
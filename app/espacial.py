@@ -0,0 +1,116 @@
+import logging
+import math
+import threading
+import time
+
+import numpy as np
+import shapely
+from shapely import STRtree
+
+from app.cache import ao_mudar_versao
+from app.database import sessao_leitura
+from app.queries.espacial import get_poligonos_bairros, get_pontos_ultimo_periodo
+
+logger = logging.getLogger(__name__)
+
+# Metros por grau de latitude (e de longitude no equador)
+_METROS_POR_GRAU = 111_320.0
+
+
+def escala_metrica(latitude_media: float) -> np.ndarray:
+    """
+    Fatores (longitude, latitude) que levam graus a metros na projeção
+    equirretangular centrada em 'latitude_media'. Na escala de uma cidade o erro
+    é desprezível, e raios, distâncias e tolerâncias ficam em metros.
+    """
+    return np.array([_METROS_POR_GRAU * math.cos(math.radians(latitude_media)), _METROS_POR_GRAU])
+
+
+class IndiceEspacial:
+    """
+    Índices STR-tree, em memória, dos pontos de ônibus do período mais recente e
+    dos polígonos dos bairros. As coordenadas são projetadas em metros
+    (escala_metrica) a partir da latitude média dos pontos.
+    """
+
+    def __init__(self, pontos, bairros):
+        latitude_media = float(np.mean([p.latitude for p in pontos])) if pontos else 0.0
+        self._escala = escala_metrica(latitude_media)
+
+        self._pontos = pontos
+        self._coordenadas = np.array([[p.longitude, p.latitude] for p in pontos], dtype=float).reshape(-1, 2)
+        self._coordenadas *= self._escala
+        self._arvore_pontos = STRtree(shapely.points(self._coordenadas))
+
+        self._bairros = bairros
+        # psycopg2 devolve colunas bytea como memoryview, que o shapely não aceita
+        poligonos = [shapely.transform(shapely.from_wkb(bytes(b.wkb)), lambda c: c * self._escala) for b in bairros]
+        shapely.prepare(poligonos)
+        self._arvore_bairros = STRtree(poligonos)
+
+    def _projetar(self, latitude: float, longitude: float):
+        return np.array([longitude, latitude]) * self._escala
+
+    def pontos_proximos(self, latitude: float, longitude: float, raio: float, limite: int):
+        """ Pontos a até 'raio' metros da coordenada, do mais próximo ao mais distante, com a distância. """
+        alvo = self._projetar(latitude, longitude)
+        indices = self._arvore_pontos.query(shapely.Point(alvo), predicate="dwithin", distance=raio)
+        distancias = np.hypot(*(self._coordenadas[indices] - alvo).T)
+        ordem = np.argsort(distancias)[:limite]
+        return [(self._pontos[indices[i]], float(distancias[i])) for i in ordem]
+
+    def bairro_do_ponto(self, latitude: float, longitude: float):
+        """ Bairro cujo polígono contém a coordenada (incluindo a borda), ou None. """
+        indices = self._arvore_bairros.query(shapely.Point(self._projetar(latitude, longitude)), predicate="intersects")
+        return self._bairros[min(indices)] if len(indices) else None
+
+    @property
+    def total_pontos(self) -> int:
+        return len(self._pontos)
+
+    @property
+    def total_bairros(self) -> int:
+        return len(self._bairros)
+
+
+_indice = {"atual": None}
+_trava_construcao = threading.Lock()
+
+
+def indice_espacial():
+    """ O índice em uso, ou None enquanto o primeiro ainda não foi construído. """
+    return _indice["atual"]
+
+
+def construir_indice():
+    """
+    Carrega os pontos e os bairros do banco e troca o índice em uso pelo novo.
+    As requisições continuam usando o índice anterior enquanto o novo é construído.
+    """
+    with _trava_construcao:
+        inicio = time.monotonic()
+        with sessao_leitura() as db:
+            pontos = get_pontos_ultimo_periodo(db)
+            bairros = get_poligonos_bairros(db)
+        indice = IndiceEspacial(pontos, bairros)
+        _indice["atual"] = indice
+        logger.info(
+            "Índice espacial construído em %.2fs: %d pontos, %d bairros",
+            time.monotonic() - inicio, indice.total_pontos, indice.total_bairros,
+        )
+
+
+def _construir_em_segundo_plano():
+    try:
+        construir_indice()
+    except Exception:
+        logger.exception("Falha ao construir o índice espacial")
+
+
+def iniciar_construcao_indice():
+    """ Constrói o índice em uma thread de fundo, sem bloquear quem chamou. """
+    threading.Thread(target=_construir_em_segundo_plano, name="indice-espacial", daemon=True).start()
+
+
+# Uma nova carga pode trazer um novo período de referência dos pontos
+ao_mudar_versao(lambda versao: iniciar_construcao_indice())
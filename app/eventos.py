@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+import threading
+
+from app.cache import ao_mudar_versao, versao_dados
+from app.database import sessao_leitura
+from app.periodos import PERIODOS_PADRAO, resolver_periodo
+from app.queries.versao import get_ultima_data_carregada
+from app.widgets import WIDGETS
+
+logger = logging.getLogger(__name__)
+
+# Conteúdo do evento 'painel': widgets recalculados para cada janela padrão a cada nova versão
+_WIDGETS_PAINEL = {
+    "kpis": ("geral/kpis", {}),
+    "ranking_linhas_passageiros": ("linhas/ranking", {"metrica": "passageiros"}),
+    "ranking_linhas_viagens": ("linhas/ranking", {"metrica": "viagens"}),
+    "ranking_linhas_ocorrencias": ("linhas/ranking", {"metrica": "ocorrencias"}),
+    "ranking_ocorrencias_justificativa": ("ocorrencias/ranking-por-justificativa", {}),
+    "ranking_ocorrencias_empresa": ("ocorrencias/ranking-por-entidade", {"entidade": "empresa"}),
+}
+
+# Fila de cada assinante; um assinante lento perde os eventos mais antigos, não trava os demais
+_TAMANHO_FILA = 32
+
+
+def formatar_evento(evento: str, dados: bytes, id_evento: str = None) -> bytes:
+    """ Monta uma mensagem Server-Sent Events; 'dados' deve ser JSON em uma única linha. """
+    mensagem = f"event: {evento}\n".encode("utf-8")
+    if id_evento is not None:
+        mensagem += f"id: {id_evento}\n".encode("utf-8")
+    return mensagem + b"data: " + dados + b"\n\n"
+
+
+class Difusor:
+    """
+    Distribui eventos já serializados para todos os assinantes conectados. Cada
+    evento é montado uma única vez, em qualquer thread, e entregue às filas
+    asyncio dos assinantes no event loop de cada uma. O último evento de cada
+    tipo fica guardado para ser enviado a quem assina depois.
+    """
+
+    def __init__(self):
+        self._assinantes = set()
+        self._ultimos = {}
+        self._trava = threading.Lock()
+
+    def assinar(self):
+        fila = asyncio.Queue(maxsize=_TAMANHO_FILA)
+        with self._trava:
+            self._assinantes.add((fila, asyncio.get_running_loop()))
+            ultimos = list(self._ultimos.values())
+        for mensagem in ultimos:
+            self._entregar(fila, mensagem)
+        return fila
+
+    def cancelar(self, fila):
+        with self._trava:
+            self._assinantes = {(f, loop) for f, loop in self._assinantes if f is not fila}
+
+    def publicar(self, chave: str, mensagem: bytes):
+        with self._trava:
+            self._ultimos[chave] = mensagem
+            assinantes = list(self._assinantes)
+        for fila, loop in assinantes:
+            loop.call_soon_threadsafe(self._entregar, fila, mensagem)
+
+    @property
+    def total_assinantes(self) -> int:
+        return len(self._assinantes)
+
+    @staticmethod
+    def _entregar(fila, mensagem: bytes):
+        if fila.full():
+            fila.get_nowait()
+        fila.put_nowait(mensagem)
+
+
+difusor = Difusor()
+_trava_publicacao = threading.Lock()
+
+
+def publicar_painel():
+    """
+    Publica a versão atual dos dados e, para cada janela padrão, os KPIs e rankings
+    recalculados. Os recálculos passam pelo cache e pela coalescência, então não
+    repetem o trabalho do aquecimento que roda ao mesmo tempo.
+    """
+    with _trava_publicacao:
+        with sessao_leitura() as db:
+            versao = versao_dados(db)
+            referencia = get_ultima_data_carregada(db)
+        difusor.publicar("versao", formatar_evento("versao", json.dumps({"versao": versao}).encode("utf-8"), versao))
+        if referencia is None:
+            return
+
+        for periodo in PERIODOS_PADRAO:
+            inicio, fim = resolver_periodo(periodo, referencia)
+            partes = [
+                json.dumps({"versao": versao, "periodo": periodo, "data_inicio": str(inicio), "data_fim": str(fim)})
+                .encode("utf-8")[:-1] + b',"widgets":{'
+            ]
+            with sessao_leitura() as db:
+                for indice, (chave, (rota, parametros)) in enumerate(_WIDGETS_PAINEL.items()):
+                    widget = WIDGETS[rota]
+                    corpo = widget.executar(db, widget.parametros(**parametros), inicio, fim, recalcular=True)
+                    partes.append((b"," if indice else b"") + json.dumps(chave).encode("utf-8") + b":" + corpo)
+            partes.append(b"}}")
+            difusor.publicar(f"painel:{periodo}", formatar_evento("painel", b"".join(partes), versao))
+        logger.info("Eventos: painel da versão %s publicado para %d assinantes", versao, difusor.total_assinantes)
+
+
+def _publicar_em_segundo_plano():
+    try:
+        publicar_painel()
+    except Exception:
+        logger.exception("Falha ao publicar o painel de eventos")
+
+
+def iniciar_publicacao():
+    """ Publica o painel em uma thread de fundo, sem bloquear quem chamou. """
+    threading.Thread(target=_publicar_em_segundo_plano, name="eventos-painel", daemon=True).start()
+
+
+# Cada nova carga de dados (mudança de versão) gera uma nova publicação, compartilhada por todos
+ao_mudar_versao(lambda versao: iniciar_publicacao())
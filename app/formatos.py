@@ -0,0 +1,216 @@
+import csv
+import io
+import typing
+from typing import Iterator, List, Optional, Sequence, Type
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+from sqlalchemy.engine import Result, Row
+
+MEDIA_TYPE_ARROW = "application/vnd.apache.arrow.stream"
+MEDIA_TYPE_ARROW_ARQUIVO = "application/vnd.apache.arrow.file"
+MEDIA_TYPE_MSGPACK = "application/msgpack"
+
+# Media types aceitos no cabeçalho Accept para cada formato colunar
+_FORMATOS_COLUNARES = {
+    MEDIA_TYPE_ARROW: "arrow",
+    MEDIA_TYPE_ARROW_ARQUIVO: "arrow-arquivo",
+    MEDIA_TYPE_MSGPACK: "msgpack",
+    "application/x-msgpack": "msgpack",
+}
+
+# Tipos do Postgres (OID) mapeados para nomes de tipos do Arrow usados no Parquet.
+# Colunas NUMERIC viram float64: a precisão exata não é necessária para análise.
+_TIPOS_ARROW_POR_OID = {
+    16: "bool",
+    20: "int64",
+    21: "int64",
+    23: "int64",
+    700: "float64",
+    701: "float64",
+    1700: "float64",
+    1082: "date32",
+    1114: "timestamp",
+    1184: "timestamp_tz",
+}
+
+
+def gerar_csv(resultado: Result) -> Iterator[bytes]:
+    """
+    Converte um resultado em CSV, um lote (partição) por vez, para ser enviado
+    em um StreamingResponse sem carregar o resultado inteiro em memória.
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(resultado.keys())
+    for particao in resultado.partitions():
+        escritor.writerows(particao)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ColetorBytes(io.RawIOBase):
+    """ Destino de escrita que acumula os bytes gerados até serem consumidos. """
+
+    def __init__(self):
+        self._partes = []
+        self._posicao = 0
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        self._partes.append(bytes(dados))
+        self._posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self._posicao
+
+    def consumir(self) -> bytes:
+        dados = b"".join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def _schema_arrow(resultado: Result):
+    import pyarrow as pa
+
+    tipos = {
+        "bool": pa.bool_(),
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "date32": pa.date32(),
+        "timestamp": pa.timestamp("us"),
+        "timestamp_tz": pa.timestamp("us", tz="UTC"),
+    }
+    campos = []
+    # cursor.description segue a DB-API: (name, type_code, ...)
+    for nome, type_code, *_ in resultado.context.cursor.description:
+        tipo = _TIPOS_ARROW_POR_OID.get(type_code)
+        campos.append(pa.field(nome, tipos[tipo] if tipo else pa.string()))
+    return pa.schema(campos)
+
+
+def _lote_arrow(particao, schema):
+    import pyarrow as pa
+
+    colunas = list(zip(*particao))
+    arrays = []
+    for indice, campo in enumerate(schema):
+        valores = colunas[indice]
+        if pa.types.is_string(campo.type):
+            valores = [None if valor is None else str(valor) for valor in valores]
+        arrays.append(pa.array(valores).cast(campo.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def gerar_parquet(resultado: Result) -> Iterator[bytes]:
+    """
+    Converte um resultado em Parquet, escrevendo cada partição do cursor como
+    um row group e enviando os bytes assim que o row group é fechado.
+    """
+    import pyarrow.parquet as pq
+
+    coletor = _ColetorBytes()
+    schema = _schema_arrow(resultado)
+    escritor = pq.ParquetWriter(coletor, schema, compression="snappy")
+    for particao in resultado.partitions():
+        escritor.write_table(_lote_arrow(particao, schema), row_group_size=len(particao))
+        yield coletor.consumir()
+    escritor.close()
+    yield coletor.consumir()
+
+
+def negociar_formato(accept: Optional[str]) -> Optional[str]:
+    """
+    Escolhe o formato da resposta a partir do cabeçalho Accept, respeitando os
+    pesos (q). Retorna 'arrow' (IPC stream), 'arrow-arquivo' (IPC file), 'msgpack'
+    ou None quando o melhor formato é JSON.
+    """
+    if not accept:
+        return None
+
+    melhor, melhor_peso = None, 0.0
+    for item in accept.split(","):
+        media_type, *parametros = [parte.strip().lower() for parte in item.split(";")]
+        peso = 1.0
+        for parametro in parametros:
+            if parametro.startswith("q="):
+                try:
+                    peso = float(parametro[2:])
+                except ValueError:
+                    peso = 0.0
+        formato = _FORMATOS_COLUNARES.get(media_type)
+        if media_type in ("application/json", "*/*", "application/*"):
+            formato = "json"
+        # Em caso de empate de peso, vale o primeiro tipo listado
+        if formato and peso > melhor_peso:
+            melhor, melhor_peso = formato, peso
+    return None if melhor == "json" else melhor
+
+
+def _tipo_arrow(anotacao):
+    import pyarrow as pa
+
+    # Optional[X] -> X
+    argumentos = [a for a in typing.get_args(anotacao) if a is not type(None)]
+    if argumentos:
+        anotacao = argumentos[0]
+    return {int: pa.int64(), float: pa.float64(), bool: pa.bool_()}.get(anotacao, pa.string())
+
+
+def tabela_arrow(linhas: Sequence[Row], schema: Type[BaseModel]):
+    """
+    Converte as linhas de uma consulta em uma tabela Arrow com as colunas e tipos
+    do schema Pydantic, coluna a coluna, sem instanciar um modelo por linha.
+    """
+    import pyarrow as pa
+
+    campos = schema.model_fields
+    colunas = dict(zip(linhas[0]._fields, zip(*linhas))) if linhas else {}
+    arrays, nomes = [], []
+    for nome, campo in campos.items():
+        tipo = _tipo_arrow(campo.annotation)
+        valores = colunas.get(nome, ())
+        if pa.types.is_string(tipo):
+            valores = [None if valor is None else str(valor) for valor in valores]
+        arrays.append(pa.array(valores).cast(tipo))
+        nomes.append(nome)
+    return pa.Table.from_arrays(arrays, names=nomes)
+
+
+def resposta_colunar(request: Request, response: Response, linhas: List[Row], schema: Type[BaseModel]):
+    """
+    Negocia o formato da resposta pelo cabeçalho Accept. Para Arrow IPC ou
+    MessagePack, devolve uma Response já serializada em colunas; caso contrário
+    devolve as próprias linhas, que seguem o caminho normal do response_model.
+    """
+    response.headers["Vary"] = "Accept"
+    formato = negociar_formato(request.headers.get("accept"))
+    if formato is None:
+        return linhas
+
+    tabela = tabela_arrow(linhas, schema)
+    if formato in ("arrow", "arrow-arquivo"):
+        import pyarrow as pa
+
+        # O formato de arquivo tem rodapé e acesso aleatório (pa.ipc.open_file); o stream, não
+        novo_escritor, media_type = (
+            (pa.ipc.new_stream, MEDIA_TYPE_ARROW) if formato == "arrow" else (pa.ipc.new_file, MEDIA_TYPE_ARROW_ARQUIVO)
+        )
+        sink = pa.BufferOutputStream()
+        with novo_escritor(sink, tabela.schema) as escritor:
+            escritor.write_table(tabela)
+        conteudo = sink.getvalue().to_pybytes()
+    else:
+        import msgpack
+
+        conteudo = msgpack.packb(tabela.to_pydict())
+        media_type = MEDIA_TYPE_MSGPACK
+    # Preserva os cabeçalhos já definidos pelo endpoint (ex.: cursor da próxima página)
+    cabecalhos = {nome: valor for nome, valor in response.headers.items() if nome != "content-length"}
+    return Response(content=conteudo, media_type=media_type, headers=cabecalhos)
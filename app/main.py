@@ -1,22 +1,77 @@
-from fastapi import FastAPI
-from app.routers import geral, linhas, estudos, ocorrencias, bairros, concessionarias, veiculos, empresas
+import threading
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import OperationalError
+from app.aquecimento import iniciar_aquecimento, monitorar_versao
+from app.compressao import CompressaoMiddleware
+from app.database import consulta_cancelada, roteador_leitura, settings
+from app.espacial import iniciar_construcao_indice
+from app.rotas import iniciar_construcao_rotas
+from app.eventos import iniciar_publicacao
+from app.prontidao import preparar, registrar_importacao
+from app.routers import (
+    geral, linhas, estudos, ocorrencias, bairros, concessionarias, veiculos, empresas, exportacao, saude, series,
+    paginas, eventos, pontos,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Aquece o cache em segundo plano e passa a acompanhar a versão dos dados
+    parar_monitor = threading.Event()
+    threading.Thread(target=preparar, args=(parar_monitor,), name="prontidao", daemon=True).start()
+    threading.Thread(target=monitorar_versao, args=(parar_monitor,), name="monitor-versao", daemon=True).start()
+    if roteador_leitura.replicas:
+        threading.Thread(
+            target=roteador_leitura.monitorar, args=(parar_monitor,), name="monitor-replicas", daemon=True
+        ).start()
+    iniciar_aquecimento()
+    iniciar_publicacao()
+    iniciar_construcao_indice()
+    iniciar_construcao_rotas()
+    yield
+    parar_monitor.set()
+
 
 app = FastAPI(
     title="DashMobi API",
     description="API para fornecer dados analíticos de mobilidade urbana de Belo Horizonte.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
+
+@app.exception_handler(OperationalError)
+async def tratar_consulta_cancelada(request: Request, exc: OperationalError):
+    # Consultas interrompidas pelo prazo do endpoint (ou porque o cliente desconectou)
+    if consulta_cancelada(exc):
+        return JSONResponse(status_code=504, content={"detail": "A consulta excedeu o prazo do endpoint."})
+    raise exc
+
+
+app.add_middleware(CompressaoMiddleware, minimo_bytes=settings.compressao_minimo_bytes)
+
 app.include_router(geral.router)
 app.include_router(linhas.router)
 app.include_router(ocorrencias.router)
 app.include_router(bairros.router)
+app.include_router(pontos.router)
 app.include_router(concessionarias.router)
 app.include_router(veiculos.router)
 app.include_router(empresas.router)
 app.include_router(estudos.router)
+app.include_router(exportacao.router)
+app.include_router(series.router)
+app.include_router(paginas.router)
+app.include_router(eventos.router)
+app.include_router(saude.router)
 
 
 @app.get("/")
 def read_root():
     return {"message": "Bem-vindo à DashMobi API!"}
+
+
+registrar_importacao()
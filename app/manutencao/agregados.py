@@ -0,0 +1,316 @@
+"""
+Atualização incremental das tabelas agregadas diárias a partir de fact_viagens.
+
+Em vez de reconstruir os agregados inteiros a cada carga, recalcula apenas os
+dias (id_data) recém-carregados:
+
+    python -m app.manutencao.agregados                  # dias ainda não agregados
+    python -m app.manutencao.agregados --id-data 20240501 20240502
+    python -m app.manutencao.agregados --todos          # todos os dias carregados
+    python -m app.manutencao.agregados --criar-sketches # uma vez: extensão hll e sketches de todos os dias
+
+Os sketches HyperLogLog (agg_hll_*) são opcionais: só são atualizados se a
+extensão hll e as tabelas existirem, o que --criar-sketches providencia.
+
+Os agregados dos dias são calculados em paralelo, cada um na sua conexão, em
+tabelas de preparação UNLOGGED (a parte cara: a varredura de fact_viagens).
+Depois, uma única transação troca os dias em todas as tabelas agregadas
+(DELETE dos dias + INSERT das linhas preparadas). Quem lê os agregados vê
+todos os dias antigos ou todos os novos, nunca uma mistura.
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List
+
+from sqlalchemy import text
+
+from app.database import engine, settings
+from app.queries.sketches import TABELAS_SKETCHES
+
+logger = logging.getLogger(__name__)
+
+_FATOS_DOS_DIAS = """
+        FROM fact_viagens f
+        JOIN dim_data d ON f.id_data = d.id_data"""
+
+
+# Definição de cada agregado: as colunas (aliases) são as mesmas da tabela de destino.
+# Todas restringem fact_viagens aos dias informados em :ids_data.
+AGREGADOS = {
+    "agg_metricas_linhas_diarias": f"""
+        SELECT
+            d.data_completa AS data,
+            f.id_linha,
+            f.id_empresa,
+            f.id_concessionaria,
+            SUM(f.passageiros) AS total_passageiros,
+            COUNT(f.id_fato_viagem) AS total_viagens,
+            SUM(f.flag_possui_ocorrencia) AS total_ocorrencias,
+            SUM(f.extensao_realizada_km) AS total_extensao_km,
+            SUM(f.duracao_minutos) AS total_duracao_minutos{_FATOS_DOS_DIAS}
+        WHERE f.id_data = ANY(:ids_data)
+        GROUP BY d.data_completa, f.id_linha, f.id_empresa, f.id_concessionaria
+    """,
+    "agg_metricas_veiculos_diarias": f"""
+        SELECT
+            d.data_completa AS data,
+            f.id_veiculo,
+            SUM(f.passageiros) AS total_passageiros,
+            COUNT(f.id_fato_viagem) AS total_viagens,
+            SUM(f.flag_possui_ocorrencia) AS total_ocorrencias,
+            SUM(f.extensao_realizada_km) AS total_extensao_km{_FATOS_DOS_DIAS}
+        WHERE f.id_data = ANY(:ids_data)
+        GROUP BY d.data_completa, f.id_veiculo
+    """,
+    "agg_metricas_bairros_diarias": f"""
+        SELECT
+            d.data_completa AS data,
+            blb.id_bairro,
+            SUM(f.passageiros) AS total_passageiros,
+            COUNT(f.id_fato_viagem) AS total_viagens,
+            SUM(f.flag_possui_ocorrencia) AS total_ocorrencias{_FATOS_DOS_DIAS}
+        JOIN bridge_linha_bairro blb ON f.id_linha = blb.id_linha
+        WHERE f.id_data = ANY(:ids_data)
+        GROUP BY d.data_completa, blb.id_bairro
+    """,
+    "agg_metricas_empresas_diarias": f"""
+        SELECT
+            d.data_completa AS data,
+            f.id_empresa,
+            SUM(f.passageiros) AS total_passageiros,
+            COUNT(f.id_fato_viagem) AS total_viagens,
+            SUM(f.flag_possui_ocorrencia) AS total_ocorrencias,
+            SUM(f.extensao_realizada_km) AS total_extensao_km{_FATOS_DOS_DIAS}
+        WHERE f.id_data = ANY(:ids_data)
+        GROUP BY d.data_completa, f.id_empresa
+    """,
+    "agg_metricas_concessionarias_diarias": f"""
+        SELECT
+            d.data_completa AS data,
+            f.id_concessionaria,
+            SUM(f.passageiros) AS total_passageiros,
+            COUNT(f.id_fato_viagem) AS total_viagens,
+            SUM(f.flag_possui_ocorrencia) AS total_ocorrencias,
+            SUM(f.extensao_realizada_km) AS total_extensao_km{_FATOS_DOS_DIAS}
+        WHERE f.id_data = ANY(:ids_data)
+        GROUP BY d.data_completa, f.id_concessionaria
+    """,
+    "agg_falhas_mecanicas_diarias": f"""
+        SELECT
+            d.data_completa AS data,
+            f.id_linha,
+            f.id_empresa,
+            f.id_veiculo,
+            f.id_justificativa,
+            COUNT(f.id_fato_viagem) AS total_falhas{_FATOS_DOS_DIAS}
+        WHERE f.id_data = ANY(:ids_data) AND f.id_justificativa = ANY(:ids_justificativa_falha)
+        GROUP BY d.data_completa, f.id_linha, f.id_empresa, f.id_veiculo, f.id_justificativa
+    """,
+    # Sketches HyperLogLog (extensão hll) diários, unidos no período para as contagens distintas aproximadas
+    "agg_hll_empresas_diarias": f"""
+        SELECT
+            d.data_completa AS data,
+            f.id_empresa,
+            hll_add_agg(hll_hash_integer(f.id_linha)) AS linhas{_FATOS_DOS_DIAS}
+        WHERE f.id_data = ANY(:ids_data)
+        GROUP BY d.data_completa, f.id_empresa
+    """,
+    "agg_hll_concessionarias_diarias": f"""
+        SELECT
+            d.data_completa AS data,
+            f.id_concessionaria,
+            hll_add_agg(hll_hash_integer(f.id_linha)) AS linhas{_FATOS_DOS_DIAS}
+        WHERE f.id_data = ANY(:ids_data)
+        GROUP BY d.data_completa, f.id_concessionaria
+    """,
+    "agg_hll_bairros_diarias": f"""
+        SELECT
+            d.data_completa AS data,
+            blb.id_bairro,
+            hll_add_agg(hll_hash_integer(f.id_empresa)) AS empresas,
+            hll_add_agg(hll_hash_integer(f.id_concessionaria)) AS concessionarias{_FATOS_DOS_DIAS}
+        JOIN bridge_linha_bairro blb ON f.id_linha = blb.id_linha
+        WHERE f.id_data = ANY(:ids_data)
+        GROUP BY d.data_completa, blb.id_bairro
+    """,
+}
+
+# Extensão e tabelas dos sketches, criadas uma única vez por --criar-sketches (as demais já vêm do ETL)
+_DDL_SKETCHES = (
+    "CREATE EXTENSION IF NOT EXISTS hll",
+    """CREATE TABLE IF NOT EXISTS agg_hll_empresas_diarias (
+        data DATE NOT NULL, id_empresa INTEGER NOT NULL, linhas hll NOT NULL, PRIMARY KEY (data, id_empresa))""",
+    """CREATE TABLE IF NOT EXISTS agg_hll_concessionarias_diarias (
+        data DATE NOT NULL, id_concessionaria INTEGER NOT NULL, linhas hll NOT NULL,
+        PRIMARY KEY (data, id_concessionaria))""",
+    """CREATE TABLE IF NOT EXISTS agg_hll_bairros_diarias (
+        data DATE NOT NULL, id_bairro INTEGER NOT NULL, empresas hll NOT NULL, concessionarias hll NOT NULL,
+        PRIMARY KEY (data, id_bairro))""",
+)
+
+# Agregado que só é atualizado com a definição de falha mecânica do ETL configurada
+_TABELA_FALHAS = "agg_falhas_mecanicas_diarias"
+
+# Evita que duas atualizações troquem os mesmos agregados ao mesmo tempo
+_CHAVE_TRAVA = "app.manutencao.agregados"
+
+
+def _tabela_preparacao(tabela: str) -> str:
+    return f"_incremental_{tabela}_{os.getpid()}"
+
+
+def _ids_justificativa_falha() -> List[int]:
+    return [int(id_) for id_ in settings.agregados_ids_justificativa_falha_mecanica.split(",") if id_.strip()]
+
+
+def _sketches_disponiveis() -> bool:
+    query = text(f"""
+        SELECT
+            EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'hll')
+            AND {" AND ".join(f"to_regclass('{tabela}') IS NOT NULL" for tabela in TABELAS_SKETCHES)};
+    """)
+    with engine.connect() as conexao:
+        return bool(conexao.execute(query).scalar())
+
+
+def _tabelas_atualizadas() -> List[str]:
+    """
+    Agregados recalculados na atualização. agg_falhas_mecanicas_diarias fica de fora
+    enquanto as justificativas que o ETL considera falha mecânica não estiverem
+    configuradas: sem elas, reescrever os dias mudaria os estudos de falhas. Os
+    sketches HyperLogLog ficam de fora se a extensão hll ou as tabelas não existirem.
+    """
+    tabelas = list(AGREGADOS)
+    if not _sketches_disponiveis():
+        logger.info("Agregados: extensão hll ou tabelas de sketches ausentes; sketches não serão atualizados")
+        tabelas = [tabela for tabela in tabelas if tabela not in TABELAS_SKETCHES]
+    if not _ids_justificativa_falha():
+        logger.warning(
+            "Agregados: %s não será atualizada (configure agregados_ids_justificativa_falha_mecanica)", _TABELA_FALHAS
+        )
+        tabelas.remove(_TABELA_FALHAS)
+    return tabelas
+
+
+def _preparar(tabela: str, ids_data: List[int]) -> int:
+    """ Calcula o agregado dos dias em uma tabela de preparação e devolve o número de linhas. """
+    preparacao = _tabela_preparacao(tabela)
+    parametros = {"ids_data": ids_data, "ids_justificativa_falha": _ids_justificativa_falha()}
+    with engine.begin() as conexao:
+        conexao.execute(text(f"DROP TABLE IF EXISTS {preparacao}"))
+        conexao.execute(text(f"CREATE UNLOGGED TABLE {preparacao} AS {AGREGADOS[tabela]}"), parametros)
+        return conexao.execute(text(f"SELECT COUNT(*) FROM {preparacao}")).scalar()
+
+
+def _remover_preparacao():
+    with engine.begin() as conexao:
+        for tabela in AGREGADOS:
+            conexao.execute(text(f"DROP TABLE IF EXISTS {_tabela_preparacao(tabela)}"))
+
+
+def dias_pendentes() -> List[int]:
+    """ Dias (id_data) com viagens em fact_viagens posteriores ao último dia já agregado. """
+    query = text("""
+        SELECT d.id_data
+        FROM dim_data d
+        WHERE d.data_completa > COALESCE((SELECT MAX(data) FROM agg_metricas_linhas_diarias), '-infinity'::DATE)
+          AND EXISTS (SELECT 1 FROM fact_viagens f WHERE f.id_data = d.id_data)
+        ORDER BY d.id_data;
+    """)
+    with engine.connect() as conexao:
+        return list(conexao.execute(query).scalars())
+
+
+def todos_os_dias() -> List[int]:
+    """ Todos os dias (id_data) com viagens em fact_viagens, para reconstruir os agregados inteiros. """
+    query = text("""
+        SELECT d.id_data
+        FROM dim_data d
+        WHERE EXISTS (SELECT 1 FROM fact_viagens f WHERE f.id_data = d.id_data)
+        ORDER BY d.id_data;
+    """)
+    with engine.connect() as conexao:
+        return list(conexao.execute(query).scalars())
+
+
+def criar_sketches():
+    """ Cria a extensão hll e as tabelas de sketches, e preenche os sketches de todos os dias carregados. """
+    with engine.begin() as conexao:
+        for ddl in _DDL_SKETCHES:
+            conexao.execute(text(ddl))
+    return atualizar_agregados(todos_os_dias(), tabelas=TABELAS_SKETCHES)
+
+
+def atualizar_agregados(ids_data: Iterable[int], concorrencia: int = None, tabelas: Iterable[str] = None):
+    """
+    Recalcula, para os dias informados, as tabelas agregadas diárias (todas as
+    disponíveis, ou só as 'tabelas' informadas). Retorna o número de linhas
+    gravadas por tabela.
+    """
+    ids_data = sorted(set(ids_data))
+    if not ids_data:
+        logger.info("Agregados: nenhum dia para atualizar")
+        return {}
+
+    inicio = time.monotonic()
+    tabelas = list(tabelas) if tabelas is not None else _tabelas_atualizadas()
+    try:
+        with ThreadPoolExecutor(
+            max_workers=concorrencia or settings.agregados_concorrencia, thread_name_prefix="agregados"
+        ) as executor:
+            linhas = dict(zip(tabelas, executor.map(lambda tabela: _preparar(tabela, ids_data), tabelas)))
+        logger.info("Agregados: %d dias calculados em %.1fs", len(ids_data), time.monotonic() - inicio)
+
+        with engine.begin() as conexao:
+            conexao.execute(text("SELECT pg_advisory_xact_lock(hashtext(:chave))"), {"chave": _CHAVE_TRAVA})
+            datas = list(conexao.execute(
+                text("SELECT data_completa FROM dim_data WHERE id_data = ANY(:ids_data)"), {"ids_data": ids_data}
+            ).scalars())
+            for tabela in tabelas:
+                preparacao = _tabela_preparacao(tabela)
+                colunas = ", ".join(conexao.execute(text(f"SELECT * FROM {preparacao} LIMIT 0")).keys())
+                conexao.execute(text(f"DELETE FROM {tabela} WHERE data = ANY(:datas)"), {"datas": datas})
+                conexao.execute(text(f"INSERT INTO {tabela} ({colunas}) SELECT {colunas} FROM {preparacao}"))
+    finally:
+        _remover_preparacao()
+
+    logger.info(
+        "Agregados: %d dias atualizados em %.1fs (%s)",
+        len(ids_data), time.monotonic() - inicio, ", ".join(f"{t}: {n}" for t, n in linhas.items()),
+    )
+    return linhas
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Atualiza as tabelas agregadas diárias dos dias recém-carregados.")
+    parser.add_argument(
+        "--id-data", type=int, nargs="+", dest="ids_data",
+        help="Dias (dim_data.id_data) a recalcular. Sem esta opção, usa os dias ainda não agregados.",
+    )
+    parser.add_argument(
+        "--todos", action="store_true",
+        help="Recalcula todos os dias carregados.",
+    )
+    parser.add_argument(
+        "--criar-sketches", action="store_true",
+        help="Cria a extensão hll e as tabelas de sketches HyperLogLog e as preenche com todos os dias carregados.",
+    )
+    parser.add_argument("--concorrencia", type=int, help="Agregados calculados em paralelo.")
+    opcoes = parser.parse_args(argumentos)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if opcoes.criar_sketches:
+        criar_sketches()
+        return
+    if opcoes.ids_data:
+        ids_data = opcoes.ids_data
+    else:
+        ids_data = todos_os_dias() if opcoes.todos else dias_pendentes()
+    atualizar_agregados(ids_data, opcoes.concorrencia)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Reconstrução da amostra estratificada de fact_viagens usada pelo modo
+aproximado (aproximado=true) das análises de ocorrências:
+
+    python -m app.manutencao.amostra
+
+Cada estrato é um par (dia, linha). De cada um são sorteadas
+max(amostra_minimo_estrato, ceil(N * amostra_fracao)) viagens (ou todas, se o
+estrato for menor). amostra_estratos guarda o tamanho N de cada estrato e o da
+amostra n, que as consultas usam para expandir os resultados (peso N/n) e
+calcular a variância. As tabelas são montadas ao lado das atuais e trocadas
+atomicamente; rode o comando após cada carga para incluir os dias novos.
+"""
+import argparse
+import logging
+import time
+
+from sqlalchemy import text
+
+from app.database import engine, settings
+from app.manutencao.tabelas import SUFIXO_NOVA, remover_tabelas_novas, trocar_tabelas
+
+logger = logging.getLogger(__name__)
+
+TABELAS = ("amostra_estratos", "amostra_fact_viagens")
+
+# Colunas de fact_viagens copiadas para a amostra (as usadas pelas análises)
+_COLUNAS = (
+    "id_fato_viagem", "id_data", "id_linha", "id_empresa", "id_concessionaria", "id_veiculo", "id_justificativa",
+    "passageiros", "extensao_realizada_km", "flag_possui_ocorrencia", "flag_viagem_interrompida",
+    "flag_viagem_nao_realizada",
+)
+
+
+def _montar(conexao, fracao: float, minimo: int):
+    for tabela in TABELAS:
+        conexao.execute(text(f"DROP TABLE IF EXISTS {tabela}{SUFIXO_NOVA}"))
+
+    conexao.execute(text(f"""
+        CREATE TABLE amostra_estratos{SUFIXO_NOVA} AS
+        SELECT
+            id_data,
+            id_linha,
+            COUNT(*) AS total_viagens,
+            LEAST(COUNT(*), GREATEST(:minimo, CEIL(COUNT(*) * :fracao)))::INTEGER AS total_amostra
+        FROM fact_viagens
+        GROUP BY id_data, id_linha;
+    """), {"fracao": fracao, "minimo": minimo})
+    conexao.execute(text(f"ALTER TABLE amostra_estratos{SUFIXO_NOVA} ADD PRIMARY KEY (id_data, id_linha)"))
+
+    colunas = ", ".join(_COLUNAS)
+    conexao.execute(text(f"""
+        CREATE TABLE amostra_fact_viagens{SUFIXO_NOVA} AS
+        SELECT {", ".join(f"s.{coluna}" for coluna in _COLUNAS)}
+        FROM (
+            SELECT {colunas}, ROW_NUMBER() OVER (PARTITION BY id_data, id_linha ORDER BY random()) AS ordem
+            FROM fact_viagens
+        ) s
+        JOIN amostra_estratos{SUFIXO_NOVA} e ON s.id_data = e.id_data AND s.id_linha = e.id_linha
+        WHERE s.ordem <= e.total_amostra;
+    """))
+    conexao.execute(text(f"CREATE INDEX ON amostra_fact_viagens{SUFIXO_NOVA} (id_data)"))
+    for tabela in TABELAS:
+        conexao.execute(text(f"ANALYZE {tabela}{SUFIXO_NOVA}"))
+    return {
+        tabela: conexao.execute(text(f"SELECT COUNT(*) FROM {tabela}{SUFIXO_NOVA}")).scalar() for tabela in TABELAS
+    }
+
+
+def reconstruir_amostra(fracao: float = None, minimo: int = None):
+    """ Sorteia uma nova amostra estratificada e a coloca em uso atomicamente. Retorna as contagens. """
+    inicio = time.monotonic()
+    try:
+        with engine.begin() as conexao:
+            contagens = _montar(
+                conexao,
+                settings.amostra_fracao if fracao is None else fracao,
+                settings.amostra_minimo_estrato if minimo is None else minimo,
+            )
+        trocar_tabelas(TABELAS)
+    except Exception:
+        remover_tabelas_novas(TABELAS)
+        raise
+
+    logger.info(
+        "Amostra reconstruída em %.1fs: %d estratos, %d viagens",
+        time.monotonic() - inicio, contagens["amostra_estratos"], contagens["amostra_fact_viagens"],
+    )
+    return contagens
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Reconstrói a amostra estratificada de fact_viagens.")
+    parser.add_argument("--fracao", type=float, help="Fração de viagens sorteada em cada estrato (dia x linha).")
+    parser.add_argument("--minimo", type=int, help="Mínimo de viagens sorteadas por estrato.")
+    opcoes = parser.parse_args(argumentos)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    reconstruir_amostra(opcoes.fracao, opcoes.minimo)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Reconstrução das tabelas ponte bridge_ponto_bairro e bridge_linha_bairro a
+partir dos pontos do período de referência mais recente:
+
+    python -m app.manutencao.pontes
+
+Os pontos são atribuídos aos bairros com um join espacial (ST_Contains) apoiado
+no índice GiST de dim_bairro.geom, em lotes de settings.pontes_tamanho_lote
+pontos, cada um na sua transação. A cobertura linha↔bairro é derivada do
+resultado: uma linha atende um bairro se para em algum ponto dele. As tabelas
+novas são montadas ao lado das atuais e trocadas por rename em uma única
+transação curta (app.manutencao.tabelas), de modo que os leitores nunca veem
+as pontes pela metade.
+"""
+import argparse
+import logging
+import time
+
+from sqlalchemy import text
+
+from app.database import engine, settings
+from app.manutencao.tabelas import SUFIXO_NOVA, remover_tabelas_novas, trocar_tabelas
+
+logger = logging.getLogger(__name__)
+
+PONTES = ("bridge_ponto_bairro", "bridge_linha_bairro")
+
+_PONTOS_ULTIMO_PERIODO = """
+        WITH ultimo_periodo AS (
+            SELECT
+                MAX(ano_referencia) AS ano,
+                MAX(mes_referencia) AS mes
+            FROM
+                staging_pontos_onibus_bh
+            WHERE
+                ano_referencia = (SELECT MAX(ano_referencia) FROM staging_pontos_onibus_bh)
+        ),
+        pontos AS (
+            SELECT p.*
+            FROM staging_pontos_onibus_bh p
+            JOIN ultimo_periodo up ON p.ano_referencia = up.ano AND p.mes_referencia = up.mes
+            WHERE p.geom IS NOT NULL
+        )"""
+
+
+def _criar_tabelas_novas(conexao):
+    conexao.execute(text("CREATE INDEX IF NOT EXISTS idx_dim_bairro_geom ON dim_bairro USING GIST (geom)"))
+    for ponte in PONTES:
+        conexao.execute(text(f"DROP TABLE IF EXISTS {ponte}{SUFIXO_NOVA}"))
+        conexao.execute(text(f"CREATE TABLE {ponte}{SUFIXO_NOVA} (LIKE {ponte} INCLUDING ALL)"))
+
+
+def _atribuir_pontos(tamanho_lote: int) -> int:
+    """ Preenche bridge_ponto_bairro_nova lote a lote e devolve o número de pontos processados. """
+    with engine.connect() as conexao:
+        identificadores = list(conexao.execute(text(
+            f"{_PONTOS_ULTIMO_PERIODO} SELECT DISTINCT identificador_ponto_onibus FROM pontos ORDER BY 1;"
+        )).scalars())
+
+    inserir = text(f"""
+        {_PONTOS_ULTIMO_PERIODO}
+        INSERT INTO bridge_ponto_bairro{SUFIXO_NOVA} (identificador_ponto_onibus, id_bairro)
+        SELECT DISTINCT p.identificador_ponto_onibus, b.id_bairro
+        FROM pontos p
+        JOIN dim_bairro b ON ST_Contains(b.geom, p.geom)
+        WHERE p.identificador_ponto_onibus = ANY(:identificadores);
+    """)
+    for inicio in range(0, len(identificadores), tamanho_lote):
+        lote = identificadores[inicio:inicio + tamanho_lote]
+        with engine.begin() as conexao:
+            conexao.execute(inserir, {"identificadores": lote})
+        logger.info("Pontes: %d/%d pontos atribuídos", inicio + len(lote), len(identificadores))
+    return len(identificadores)
+
+
+def _derivar_linhas(conexao):
+    conexao.execute(text(f"""
+        {_PONTOS_ULTIMO_PERIODO}
+        INSERT INTO bridge_linha_bairro{SUFIXO_NOVA} (id_linha, id_bairro)
+        SELECT DISTINCT l.id_linha, bpb.id_bairro
+        FROM pontos p
+        JOIN dim_linha l ON p.cod_linha = l.cod_linha
+        JOIN bridge_ponto_bairro{SUFIXO_NOVA} bpb ON p.identificador_ponto_onibus = bpb.identificador_ponto_onibus;
+    """))
+
+
+def reconstruir_pontes(tamanho_lote: int = None):
+    """ Reconstrói as duas tabelas ponte e as coloca em uso atomicamente. Retorna as contagens. """
+    inicio = time.monotonic()
+    with engine.begin() as conexao:
+        _criar_tabelas_novas(conexao)
+    try:
+        pontos = _atribuir_pontos(tamanho_lote or settings.pontes_tamanho_lote)
+        with engine.begin() as conexao:
+            _derivar_linhas(conexao)
+            for ponte in PONTES:
+                conexao.execute(text(f"ANALYZE {ponte}{SUFIXO_NOVA}"))
+            contagens = {
+                ponte: conexao.execute(text(f"SELECT COUNT(*) FROM {ponte}{SUFIXO_NOVA}")).scalar() for ponte in PONTES
+            }
+        trocar_tabelas(PONTES)
+    except Exception:
+        remover_tabelas_novas(PONTES)
+        raise
+
+    logger.info(
+        "Pontes reconstruídas em %.1fs: %d pontos, %s",
+        time.monotonic() - inicio, pontos, ", ".join(f"{t}: {n}" for t, n in contagens.items()),
+    )
+    return contagens
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Reconstrói bridge_ponto_bairro e bridge_linha_bairro.")
+    parser.add_argument("--tamanho-lote", type=int, help="Pontos processados por lote.")
+    opcoes = parser.parse_args(argumentos)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    reconstruir_pontes(opcoes.tamanho_lote)
+
+
+if __name__ == "__main__":
+    main()
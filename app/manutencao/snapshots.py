@@ -0,0 +1,105 @@
+"""
+Preenchimento do armazém de snapshots (app/snapshots.py) com os dashboards de
+todas as linhas, veículos e bairros em cada mês fechado:
+
+    python -m app.manutencao.snapshots                  # último mês fechado
+    python -m app.manutencao.snapshots --meses 12       # os 12 últimos meses fechados
+    python -m app.manutencao.snapshots --todos --tipos linha bairro
+
+Os snapshots são gravados com a versão atual dos dados; ao final, os de outras
+versões são removidos. Deve rodar depois de cada carga (junto com a atualização
+dos agregados), para que os workers reiniciados encontrem os dashboards prontos.
+"""
+import argparse
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List
+
+from app.cache import versao_dados
+from app.database import sessao_leitura, settings
+from app.periodos import meses_fechados
+from app.queries import bairros as queries_bairros, linhas as queries_linhas, veiculos as queries_veiculos
+from app.queries.versao import get_primeira_data_carregada, get_ultima_data_carregada
+from app.snapshots import armazem_snapshots, dashboards_com_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Como listar os ids de todas as entidades de cada tipo com snapshot
+_ENTIDADES = {
+    "linha": lambda db: [linha.id_linha for linha in queries_linhas.get_todas_as_linhas(db)],
+    "veiculo": lambda db: [veiculo.id_veiculo for veiculo in queries_veiculos.get_todos_os_veiculos(db)],
+    "bairro": lambda db: [bairro.id_bairro for bairro in queries_bairros.get_todos_os_bairros(db)],
+}
+
+# Snapshots gravados por transação no SQLite
+_TAMANHO_LOTE = 200
+
+
+def gerar_snapshots(meses: int = 1, tipos: Iterable[str] = None, concorrencia: int = None):
+    """
+    Calcula e grava os dashboards dos 'meses' meses fechados mais recentes (todos, se
+    meses for None) para todas as entidades dos tipos pedidos. Retorna quantos gravou.
+    """
+    if armazem_snapshots is None:
+        raise RuntimeError("Armazém de snapshots desativado (settings.snapshots_arquivo vazio).")
+    dashboards = dashboards_com_snapshot()
+    tipos = list(tipos or dashboards)
+
+    with sessao_leitura() as db:
+        versao = versao_dados(db)
+        primeira, ultima = get_primeira_data_carregada(db), get_ultima_data_carregada(db)
+        if ultima is None:
+            logger.info("Snapshots: nenhuma viagem carregada, nada a fazer")
+            return 0
+        periodos = meses_fechados(primeira, ultima)[:meses]
+        ids = {tipo: _ENTIDADES[tipo](db) for tipo in tipos}
+
+    tarefas = [
+        (tipo, id_entidade, inicio, fim) for inicio, fim in periodos for tipo in tipos for id_entidade in ids[tipo]
+    ]
+    logger.info("Snapshots: %d dashboards em %d meses (versão %s)", len(tarefas), len(periodos), versao)
+
+    def calcular(tarefa):
+        tipo, id_entidade, inicio, fim = tarefa
+        with sessao_leitura() as db:
+            return (tipo, id_entidade, inicio, fim, versao, dashboards[tipo](db, id_entidade, inicio, fim))
+
+    inicio_execucao = time.monotonic()
+    gravados = 0
+    lote: List[tuple] = []
+    with ThreadPoolExecutor(
+        max_workers=concorrencia or settings.snapshots_concorrencia, thread_name_prefix="snapshots"
+    ) as executor:
+        for registro in executor.map(calcular, tarefas):
+            lote.append(registro)
+            if len(lote) >= _TAMANHO_LOTE:
+                gravados += armazem_snapshots.gravar(lote)
+                lote = []
+                logger.info("Snapshots: %d/%d gravados", gravados, len(tarefas))
+    gravados += armazem_snapshots.gravar(lote)
+
+    removidos = armazem_snapshots.remover_outras_versoes(versao)
+    logger.info(
+        "Snapshots: %d gravados em %.1fs, %d de versões anteriores removidos",
+        gravados, time.monotonic() - inicio_execucao, removidos,
+    )
+    return gravados
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(
+        description="Pré-calcula os dashboards dos meses fechados no armazém de snapshots."
+    )
+    parser.add_argument("--meses", type=int, default=1, help="Quantidade de meses fechados, do mais recente para trás.")
+    parser.add_argument("--todos", action="store_true", help="Todos os meses fechados com dados carregados.")
+    parser.add_argument("--tipos", nargs="+", choices=sorted(_ENTIDADES), help="Tipos de entidade (padrão: todos).")
+    parser.add_argument("--concorrencia", type=int, help="Dashboards calculados em paralelo.")
+    opcoes = parser.parse_args(argumentos)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    gerar_snapshots(None if opcoes.todos else opcoes.meses, opcoes.tipos, opcoes.concorrencia)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Troca atômica de tabelas reconstruídas pelos comandos de manutenção: a versão
+nova é montada ao lado da atual (com o sufixo _nova) e colocada em uso por
+rename, em uma única transação curta.
+"""
+import logging
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+SUFIXO_NOVA = "_nova"
+_SUFIXO_ANTIGA = "_antiga"
+
+# A troca precisa de lock exclusivo por um instante: se uma leitura longa o segura,
+# desiste após o timeout (sem enfileirar os leitores seguintes) e tenta de novo
+_LOCK_TIMEOUT = "2s"
+_TENTATIVAS_TROCA = 5
+
+
+def trocar_tabelas(tabelas):
+    """
+    Coloca as tabelas <nome>_nova no lugar das atuais. Uma tabela que ainda não
+    existe (primeira execução) apenas recebe o nome definitivo.
+    """
+    for tentativa in range(1, _TENTATIVAS_TROCA + 1):
+        try:
+            with engine.begin() as conexao:
+                conexao.execute(text(f"SET LOCAL lock_timeout = '{_LOCK_TIMEOUT}'"))
+                for tabela in tabelas:
+                    conexao.execute(text(f"ALTER TABLE IF EXISTS {tabela} RENAME TO {tabela}{_SUFIXO_ANTIGA}"))
+                    conexao.execute(text(f"ALTER TABLE {tabela}{SUFIXO_NOVA} RENAME TO {tabela}"))
+                    conexao.execute(text(f"DROP TABLE IF EXISTS {tabela}{_SUFIXO_ANTIGA}"))
+            return
+        except OperationalError:
+            if tentativa == _TENTATIVAS_TROCA:
+                raise
+            logger.warning("Tabelas em uso, nova tentativa de troca (%d/%d)", tentativa, _TENTATIVAS_TROCA)
+            time.sleep(tentativa)
+
+
+def remover_tabelas_novas(tabelas):
+    """ Descarta as tabelas <nome>_nova de uma reconstrução que falhou. """
+    with engine.begin() as conexao:
+        for tabela in tabelas:
+            conexao.execute(text(f"DROP TABLE IF EXISTS {tabela}{SUFIXO_NOVA}"))
@@ -0,0 +1,179 @@
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+from typing import Callable, Dict, Optional
+
+from app.cache import CacheLRU
+from app.database import settings
+from app.diretorios import diretorio_privado
+
+try:
+    import fcntl
+except ImportError:  # Sem fcntl (ex.: Windows) cada worker pode acabar construindo o próprio segmento
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Cabeçalho do arquivo: marca, tamanho do índice (JSON) e, depois dele, os valores concatenados
+_MARCA = b"DMSEG001"
+_CABECALHO = struct.Struct(f"<{len(_MARCA)}sQ")
+# Nomes e versões viram nomes de arquivo; sem "-", o separador "--" nunca é ambíguo
+_CARACTERES_INVALIDOS = re.compile(r"[^\w.]")
+
+
+class Segmento:
+    """
+    Um conjunto de valores (bytes) por chave, lido de um buffer: um arquivo mapeado
+    em memória (mmap) compartilhado entre os workers ou, sem memória compartilhada,
+    os próprios bytes. get() devolve memoryviews sobre o buffer, sem cópia.
+    """
+
+    def __init__(self, versao: str, buffer):
+        self.versao = versao
+        self._buffer = memoryview(buffer)
+        try:
+            marca, tamanho_indice = _CABECALHO.unpack_from(self._buffer)
+            if marca != _MARCA:
+                raise ValueError("marca ausente")
+            inicio = _CABECALHO.size + tamanho_indice
+            self._indice = {
+                chave: (inicio + deslocamento, tamanho)
+                for chave, (deslocamento, tamanho) in json.loads(bytes(self._buffer[_CABECALHO.size:inicio])).items()
+            }
+            if any(posicao + tamanho > len(self._buffer) for posicao, tamanho in self._indice.values()):
+                raise ValueError("valores além do fim do segmento")
+        except (struct.error, ValueError, TypeError, AttributeError) as e:
+            # Arquivo truncado, de outro formato ou corrompido
+            raise ValueError(f"Segmento de memória compartilhada inválido: {e}") from e
+
+    def get(self, chave: str) -> Optional[memoryview]:
+        posicao = self._indice.get(chave)
+        if posicao is None:
+            return None
+        inicio, tamanho = posicao
+        return self._buffer[inicio:inicio + tamanho]
+
+    def chaves(self):
+        return self._indice.keys()
+
+
+def serializar_segmento(itens: Dict[str, bytes]) -> bytes:
+    indice, deslocamento = {}, 0
+    for chave, valor in itens.items():
+        indice[chave] = (deslocamento, len(valor))
+        deslocamento += len(valor)
+    indice = json.dumps(indice, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return b"".join([_CABECALHO.pack(_MARCA, len(indice)), indice, *itens.values()])
+
+
+def _diretorio():
+    # /dev/shm é um tmpfs: os arquivos ficam só na memória, sem ir ao disco
+    return diretorio_privado(
+        settings.memoria_compartilhada_dir, "dashmob-segmentos", (os.environ.get("XDG_RUNTIME_DIR"), "/dev/shm")
+    )
+
+
+def _nome_arquivo(nome: str, versao: str) -> str:
+    return f"{_CARACTERES_INVALIDOS.sub('_', nome)}--{_CARACTERES_INVALIDOS.sub('_', versao)}.seg"
+
+
+def _mapear(caminho: str, versao: str) -> Segmento:
+    with open(caminho, "rb") as arquivo:
+        # O mapeamento continua válido depois que o arquivo é fechado (ou removido por outro worker)
+        return Segmento(versao, mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def _remover_outras_versoes(diretorio: str, nome: str, atual: str):
+    prefixo = f"{_CARACTERES_INVALIDOS.sub('_', nome)}--"
+    for arquivo in os.listdir(diretorio):
+        if arquivo.startswith(prefixo) and arquivo.endswith(".seg") and arquivo != atual:
+            try:
+                os.remove(os.path.join(diretorio, arquivo))
+            except FileNotFoundError:
+                pass
+
+
+def _publicar(nome: str, versao: str, construir: Callable[[], Dict[str, bytes]]) -> Segmento:
+    """
+    Mapeia o segmento (nome, versão) se algum worker já o publicou; senão, constrói,
+    grava em um arquivo temporário e publica com os.replace, que é atômico: quem
+    abre o arquivo vê o segmento inteiro ou não o encontra. Uma trava de arquivo
+    por nome faz um único worker construir enquanto os demais esperam por ele.
+    Sem um diretório privado seguro, o segmento fica só na memória do processo.
+    """
+    diretorio = _diretorio()
+    if diretorio is None:
+        return Segmento(versao, serializar_segmento(construir()))
+    arquivo = _nome_arquivo(nome, versao)
+    caminho = os.path.join(diretorio, arquivo)
+
+    with open(os.path.join(diretorio, f"{_CARACTERES_INVALIDOS.sub('_', nome)}.lock"), "a+b") as trava:
+        if fcntl is not None:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+        try:
+            if os.path.exists(caminho):
+                try:
+                    return _mapear(caminho, versao)
+                except ValueError:
+                    # Sobra de uma versão anterior do formato ou arquivo corrompido: reconstrói
+                    logger.exception("Segmento %s inválido; reconstruindo", caminho)
+                    os.remove(caminho)
+
+            # Constrói antes de criar o temporário: uma falha em construir() não deixa arquivos para trás
+            conteudo = serializar_segmento(construir())
+            temporario = f"{caminho}.{os.getpid()}.tmp"
+            try:
+                with open(temporario, "wb") as saida:
+                    saida.write(conteudo)
+                os.replace(temporario, caminho)
+            except BaseException:
+                try:
+                    os.unlink(temporario)
+                except FileNotFoundError:
+                    pass
+                raise
+            _remover_outras_versoes(diretorio, nome, arquivo)
+            return _mapear(caminho, versao)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(trava, fcntl.LOCK_UN)
+
+
+# Segmentos mapeados, limitados como o cache de respostas; os descartados são desmapeados
+# quando o último leitor solta a referência
+_segmentos = CacheLRU(settings.cache_respostas_max_itens)
+# Travas de construção em faixas, por nome: a quantidade não cresce com os nomes usados
+_travas = [threading.Lock() for _ in range(64)]
+
+
+def segmento(nome: str, versao: str, construir: Callable[[], Dict[str, bytes]]) -> Segmento:
+    """
+    O segmento 'nome' na versão dos dados, compartilhado entre os workers da máquina.
+    'construir' produz os valores (bytes por chave) e só é chamada se nenhum worker
+    publicou essa versão ainda. Cada nome vira um arquivo: use só nomes de um
+    conjunto fixo, nunca derivados de parâmetros da requisição. Uma versão nova substitui a anterior de uma vez:
+    cada worker passa a mapear o arquivo novo na primeira leitura depois da troca.
+    """
+    atual = _segmentos.get(nome)
+    if atual is not None and atual.versao == versao:
+        return atual
+
+    with _travas[zlib.crc32(nome.encode("utf-8")) % len(_travas)]:
+        atual = _segmentos.get(nome)
+        if atual is not None and atual.versao == versao:
+            return atual
+        if settings.memoria_compartilhada:
+            try:
+                novo = _publicar(nome, versao, construir)
+            except OSError:
+                logger.exception("Falha no segmento compartilhado '%s'; usando memória do processo", nome)
+                novo = Segmento(versao, serializar_segmento(construir()))
+        else:
+            novo = Segmento(versao, serializar_segmento(construir()))
+        _segmentos.set(nome, novo)
+        return novo
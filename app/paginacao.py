@@ -0,0 +1,59 @@
+import base64
+import json
+from decimal import Decimal
+from typing import Callable, List, Optional, Tuple
+
+from fastapi import HTTPException, Response
+from sqlalchemy.engine import Row
+
+# Cabeçalho com o cursor opaco da próxima página (ausente na última página)
+CABECALHO_PROXIMO_CURSOR = "X-Proximo-Cursor"
+# Ids e métricas inteiras do cursor precisam caber em um BIGINT
+_LIMITE_BIGINT = 2 ** 63
+
+
+def codificar_cursor(valor, id_) -> str:
+    """
+    Codifica a chave (métrica, id) da última linha de uma página em um cursor opaco.
+    Valores decimais viram texto para não perder precisão no ida e volta.
+    """
+    bruto = json.dumps([valor, id_], default=str, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(bruto).decode("ascii").rstrip("=")
+
+
+def _componente(valor, tipo):
+    # Converte pelo texto, como o cursor foi gerado; bool, null e listas nunca são válidos
+    if valor is None or isinstance(valor, (bool, list, dict)):
+        raise ValueError(valor)
+    convertido = tipo(str(valor))
+    if isinstance(convertido, Decimal) and not convertido.is_finite():
+        raise ValueError(valor)
+    if isinstance(convertido, int) and not -_LIMITE_BIGINT <= convertido < _LIMITE_BIGINT:
+        raise ValueError(valor)
+    return convertido
+
+
+def decodificar_cursor(cursor: Optional[str], tipos: Tuple[type, type]) -> Optional[tuple]:
+    """
+    Decodifica um cursor gerado por codificar_cursor, convertendo (métrica, id) para
+    os tipos da chave do endpoint, ex.: (Decimal, int). Um cursor adulterado ou de
+    outro endpoint vira 400 aqui, em vez de chegar ao SQL.
+    """
+    if not cursor:
+        return None
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        valor, id_ = json.loads(bruto)
+        return _componente(valor, tipos[0]), _componente(id_, tipos[1])
+    except (ValueError, TypeError, ArithmeticError):
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido.")
+
+
+def definir_proximo_cursor(response: Response, linhas: List[Row], limite: Optional[int], chave: Callable):
+    """
+    Se a página veio cheia, publica no cabeçalho o cursor que continua a partir
+    da última linha. 'chave' extrai a tupla (métrica, id) de uma linha.
+    """
+    if limite and len(linhas) == limite:
+        response.headers[CABECALHO_PROXIMO_CURSOR] = codificar_cursor(*chave(linhas[-1]))
+    return linhas
@@ -0,0 +1,75 @@
+import calendar
+from datetime import date, timedelta
+from enum import Enum
+from typing import List, Tuple
+
+# Janelas em que os dashboards são abertos com mais frequência
+PERIODOS_PADRAO = ("ultimo_mes", "ano_corrente", "ultimos_12_meses")
+
+
+def resolver_periodo(nome: str, referencia: date) -> Tuple[date, date]:
+    """
+    Converte o nome de uma janela padrão em (data_inicio, data_fim), tomando como
+    referência a última data com dados carregados (e não a data de hoje).
+    - ultimo_mes: último mês fechado (o mês da referência, se ela for o último dia do mês)
+    - ano_corrente: de 1º de janeiro do ano da referência até a referência
+    - ultimos_12_meses: os 12 meses que terminam na referência
+    """
+    if nome == "ultimo_mes":
+        ultimo_dia = calendar.monthrange(referencia.year, referencia.month)[1]
+        if referencia.day != ultimo_dia:
+            referencia = referencia.replace(day=1) - timedelta(days=1)
+        return referencia.replace(day=1), referencia
+    if nome == "ano_corrente":
+        return date(referencia.year, 1, 1), referencia
+    if nome == "ultimos_12_meses":
+        dia = min(referencia.day, calendar.monthrange(referencia.year - 1, referencia.month)[1])
+        return date(referencia.year - 1, referencia.month, dia) + timedelta(days=1), referencia
+    raise ValueError(f"Período inválido. Use: {', '.join(PERIODOS_PADRAO)}.")
+
+
+class Comparacao(str, Enum):
+    periodo_anterior = "periodo_anterior"
+    ano_anterior = "ano_anterior"
+
+
+def _ano_anterior(dia: date) -> date:
+    # 29 de fevereiro vira 28 de fevereiro no ano anterior
+    return dia.replace(year=dia.year - 1, day=min(dia.day, calendar.monthrange(dia.year - 1, dia.month)[1]))
+
+
+def periodo_comparacao(comparacao: Comparacao, data_inicio: date, data_fim: date) -> Tuple[date, date]:
+    """
+    Janela usada na comparação com o período (data_inicio, data_fim):
+    - periodo_anterior: a janela de mesma duração que termina na véspera de data_inicio
+    - ano_anterior: as mesmas datas, um ano antes
+    """
+    if comparacao == Comparacao.periodo_anterior:
+        fim = data_inicio - timedelta(days=1)
+        return fim - (data_fim - data_inicio), fim
+    return _ano_anterior(data_inicio), _ano_anterior(data_fim)
+
+
+def mes_completo(data_inicio: date, data_fim: date) -> bool:
+    """ Indica se o período é exatamente um mês do calendário (do dia 1º ao último dia). """
+    return (
+        data_inicio.day == 1
+        and (data_fim.year, data_fim.month) == (data_inicio.year, data_inicio.month)
+        and data_fim.day == calendar.monthrange(data_fim.year, data_fim.month)[1]
+    )
+
+
+def meses_fechados(primeira_data: date, ultima_data: date) -> List[Tuple[date, date]]:
+    """
+    Meses completos (data_inicio, data_fim) entre as duas datas, do mais recente ao
+    mais antigo. Um mês está fechado quando a última data carregada alcança seu último dia.
+    """
+    meses = []
+    inicio = primeira_data.replace(day=1)
+    while True:
+        fim = inicio.replace(day=calendar.monthrange(inicio.year, inicio.month)[1])
+        if fim > ultima_data:
+            break
+        meses.append((inicio, fim))
+        inicio = fim + timedelta(days=1)
+    return meses[::-1]
@@ -0,0 +1,41 @@
+import asyncio
+
+from fastapi import Depends, Request
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.database import cancelar_consulta, get_db, settings
+
+
+async def _cancelar_ao_desconectar(request: Request, db: Session):
+    while True:
+        await asyncio.sleep(settings.desconexao_verificacao_intervalo_segundos)
+        if await request.is_disconnected():
+            # O cancelamento abre uma conexão própria com o servidor: não bloqueia o event loop
+            await run_in_threadpool(cancelar_consulta, db)
+            return
+
+
+def prazo_consulta(segundos: float):
+    """
+    Dependência que limita o tempo das consultas do endpoint a 'segundos'
+    (statement_timeout local à transação) e cancela a consulta em andamento
+    se o cliente desconectar, por exemplo quando o frontend aborta a
+    requisição anterior ao trocar o período. A sessão é a mesma de get_db.
+    """
+    async def dependencia(request: Request, db: Session = Depends(get_db)):
+        if segundos:
+            db.info["prazo_ms"] = int(segundos * 1000)
+        vigia = asyncio.create_task(_cancelar_ao_desconectar(request, db))
+        try:
+            yield
+        finally:
+            vigia.cancel()
+
+    return dependencia
+
+
+# Prazos de cada grupo de endpoints, para uso em dependencies=[...]
+prazo_kpis_rankings = Depends(prazo_consulta(settings.prazo_kpis_rankings_segundos))
+prazo_dashboards = Depends(prazo_consulta(settings.prazo_dashboards_segundos))
+prazo_estudos = Depends(prazo_consulta(settings.prazo_estudos_segundos))
@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from typing import List
+
+from sqlalchemy.exc import DBAPIError
+
+from app import INICIO_IMPORTACAO, schemas
+from app.catalogo import consultas_catalogo
+from app.compressao import preparar_resposta_pre_comprimida
+from app.database import roteador_leitura, sessao_leitura, settings
+from app.queries import (
+    bairros as queries_bairros,
+    concessionarias as queries_concessionarias,
+    empresas as queries_empresas,
+    linhas as queries_linhas,
+    veiculos as queries_veiculos,
+)
+
+logger = logging.getLogger(__name__)
+
+# Catálogos de dimensões usados nos filtros, com as mesmas chaves e modelos dos endpoints
+_CATALOGOS = {
+    "linhas:filtro": (List[schemas.LinhaParaFiltro], queries_linhas.get_todas_as_linhas),
+    "bairros:filtro": (List[schemas.BairroParaFiltro], queries_bairros.get_todos_os_bairros),
+    "empresas:filtro": (List[schemas.EmpresaParaFiltro], queries_empresas.get_todas_as_empresas),
+    "concessionarias:filtro": (
+        List[schemas.ConcessionariaParaFiltro], queries_concessionarias.get_todas_as_concessionarias
+    ),
+    "veiculos:filtro": (List[schemas.VeiculoParaFiltro], queries_veiculos.get_todos_os_veiculos),
+}
+
+estado = {
+    "pronto": False,
+    "status": "pendente",
+    "tentativas": 0,
+    "tempo_importacao_segundos": None,
+    "tempo_ate_pronto_segundos": None,
+    "alvo_inicializacao_segundos": settings.inicializacao_alvo_segundos,
+    "etapas": [],
+    "consultas_preparadas": 0,
+    "consultas_com_falha": [],
+    "ultimo_erro": None,
+}
+
+
+def registrar_importacao():
+    """ Registra quanto tempo a importação da aplicação levou (chamada ao final de app.main). """
+    duracao = round(time.perf_counter() - INICIO_IMPORTACAO, 3)
+    estado["tempo_importacao_segundos"] = duracao
+    if duracao > settings.inicializacao_alvo_segundos:
+        logger.warning(
+            "Importação da aplicação levou %.2fs (meta: %.1fs)", duracao, settings.inicializacao_alvo_segundos
+        )
+    else:
+        logger.info("Importação da aplicação levou %.2fs", duracao)
+
+
+def _consulta_opcional(nome: str) -> bool:
+    # Variantes aproximadas dependem da extensão hll e das tabelas de amostra, que podem não existir
+    return nome.endswith("_aproximado")
+
+
+def _aquecer_destino(destino):
+    """
+    Abre, ao mesmo tempo, as conexões mínimas do pool do destino e prepara nelas as
+    consultas do catálogo. Ao serem devolvidas, as conexões ficam no pool, já com os
+    prepared statements. Retorna (conexões, consultas preparadas, nomes das que falharam).
+    """
+    quantidade = settings.prontidao_conexoes_minimas
+    tamanho_pool = getattr(destino.engine.pool, "size", None)
+    if callable(tamanho_pool):
+        quantidade = min(quantidade, tamanho_pool())
+
+    preparar = settings.consultas_preparadas and destino.engine.dialect.name == "postgresql"
+    consultas = list(consultas_catalogo().values()) if preparar else []
+    falhas = set()
+    with ExitStack() as pilha:
+        for _ in range(quantidade):
+            # PREPARE não é transacional: em autocommit, uma falha não invalida as seguintes
+            conexao = pilha.enter_context(destino.engine.connect()).execution_options(isolation_level="AUTOCOMMIT")
+            conexao.exec_driver_sql("SELECT 1")
+            for consulta in consultas:
+                try:
+                    consulta.preparar(conexao)
+                except DBAPIError:
+                    falhas.add(consulta.nome)
+    return quantidade, len(consultas) - len(falhas), sorted(falhas)
+
+
+def _aquecer_pools():
+    conexoes, preparadas, falhas = _aquecer_destino(roteador_leitura.primario)
+    criticas = [nome for nome in falhas if not _consulta_opcional(nome)]
+    if criticas:
+        raise RuntimeError(f"Consultas do catálogo não preparadas: {', '.join(criticas)}")
+    estado.update(consultas_preparadas=preparadas, consultas_com_falha=falhas)
+    detalhes = [f"{roteador_leitura.primario.nome}: {conexoes} conexões, {preparadas} consultas preparadas"]
+
+    # Sem as réplicas, as leituras caem para o primário: uma réplica fora do ar não impede a prontidão
+    for replica in roteador_leitura.replicas:
+        try:
+            conexoes, preparadas, _ = _aquecer_destino(replica)
+            detalhes.append(f"{replica.nome}: {conexoes} conexões, {preparadas} consultas preparadas")
+        except Exception as e:
+            logger.warning("Prontidão: réplica %s não aquecida: %s", replica.nome, e)
+            detalhes.append(f"{replica.nome}: falhou")
+    return "; ".join(detalhes)
+
+
+def _carregar_catalogos():
+    with sessao_leitura() as db:
+        for chave, (modelo, funcao) in _CATALOGOS.items():
+            preparar_resposta_pre_comprimida(db, chave, modelo, lambda: funcao(db))
+    return f"{len(_CATALOGOS)} catálogos de dimensões"
+
+
+_ETAPAS = (
+    ("pool_e_consultas", _aquecer_pools),
+    ("catalogos", _carregar_catalogos),
+)
+
+
+def _preparar():
+    estado["etapas"] = []
+    for nome, etapa in _ETAPAS:
+        inicio = time.monotonic()
+        detalhe = etapa()
+        estado["etapas"].append(
+            {"nome": nome, "duracao_segundos": round(time.monotonic() - inicio, 3), "detalhe": detalhe}
+        )
+
+
+def preparar(parar: threading.Event):
+    """
+    Deixa o worker pronto para receber tráfego: aquece os pools de conexões, prepara
+    as consultas do catálogo e carrega os catálogos de dimensões. Em caso de falha
+    (ex.: banco ainda indisponível), tenta de novo a cada intervalo até conseguir
+    ou até 'parar' ser sinalizado.
+    """
+    while not parar.is_set():
+        estado["tentativas"] += 1
+        estado["status"] = "executando"
+        try:
+            _preparar()
+        except Exception as e:
+            estado.update(status="falhou", ultimo_erro=(str(e).splitlines() or [type(e).__name__])[0])
+            logger.exception("Prontidão: falha na tentativa %d", estado["tentativas"])
+            parar.wait(settings.prontidao_intervalo_tentativas_segundos)
+            continue
+
+        duracao = round(time.perf_counter() - INICIO_IMPORTACAO, 3)
+        estado.update(pronto=True, status="pronto", ultimo_erro=None, tempo_ate_pronto_segundos=duracao)
+        nivel = logging.WARNING if duracao > settings.inicializacao_alvo_segundos else logging.INFO
+        logger.log(nivel, "Worker pronto %.2fs após o início da importação (meta: %.1fs)",
+                   duracao, settings.inicializacao_alvo_segundos)
+        return
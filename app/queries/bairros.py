@@ -1,18 +1,46 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 from datetime import date
 
+from app.cache import cache_swr
+from app.catalogo import Consulta
+from app.queries.sketches import sketches_disponiveis
+from app.singleflight import coalescer
+from app.snapshots import snapshot_mensal
+
+
+_CONSULTA_TODOS_OS_BAIRROS = Consulta(
+    "todos_os_bairros", "SELECT id_bairro, nome_bairro FROM dim_bairro ORDER BY nome_bairro;"
+)
+
 
 def get_todos_os_bairros(db: Session):
     """ Busca todos os bairros para popular filtros. """
-    query = text("SELECT id_bairro, nome_bairro FROM dim_bairro ORDER BY nome_bairro;")
-    return db.execute(query).all()
+    return _CONSULTA_TODOS_OS_BAIRROS.executar(db).all()
 
 
-def get_ranking_bairros(db: Session, metrica: str, data_inicio: date, data_fim: date, limit: int):
-    """ Retorna rankings de bairros por linhas, ocorrências ou pontos. """
-    if metrica == 'linhas':
-        query = text("""
+_CONSULTA_GEOMETRIA_BAIRRO = Consulta("geometria_bairro", """
+        SELECT
+            json_build_object(
+                'type', 'FeatureCollection',
+                'features', json_build_array(json_build_object(
+                    'type', 'Feature',
+                    'geometry', ST_AsGeoJSON(geom)::json,
+                    'properties', json_build_object('id_bairro', id_bairro, 'nome_bairro', nome_bairro)
+                ))
+            ) AS geometria
+        FROM dim_bairro
+        WHERE id_bairro = :id_bairro AND geom IS NOT NULL;
+    """)
+
+
+def get_geometria_bairro(db: Session, id_bairro_req: int):
+    """ Busca o polígono de um bairro como uma FeatureCollection GeoJSON. """
+    return _CONSULTA_GEOMETRIA_BAIRRO.executar(db, {"id_bairro": id_bairro_req}).scalar()
+
+
+# Uma consulta por métrica; 'linhas' e 'pontos' não dependem do período
+_CONSULTAS_RANKING_BAIRROS = {
+    'linhas': Consulta("ranking_bairros_linhas", """
             SELECT
                 b.id_bairro as id,
                 b.id_bairro::TEXT as codigo, -- [CORREÇÃO] Adicionada a coluna 'codigo'
@@ -21,10 +49,8 @@ def get_ranking_bairros(db: Session, metrica: str, data_inicio: date, data_fim:
             FROM bridge_linha_bairro blb
             JOIN dim_bairro b ON blb.id_bairro = b.id_bairro
             GROUP BY b.id_bairro, b.nome_bairro ORDER BY valor DESC LIMIT :limit;
-        """)
-        return db.execute(query, {"limit": limit}).all()
-    elif metrica == 'ocorrencias':
-        query = text("""
+        """),
+    'ocorrencias': Consulta("ranking_bairros_ocorrencias", """
             SELECT
                 b.id_bairro as id,
                 b.id_bairro::TEXT as codigo, -- [CORREÇÃO] Adicionada a coluna 'codigo'
@@ -34,10 +60,8 @@ def get_ranking_bairros(db: Session, metrica: str, data_inicio: date, data_fim:
             JOIN dim_bairro b ON agg.id_bairro = b.id_bairro
             WHERE agg.data BETWEEN :data_inicio AND :data_fim
             GROUP BY b.id_bairro, b.nome_bairro ORDER BY valor DESC LIMIT :limit;
-        """)
-        return db.execute(query, {"data_inicio": data_inicio, "data_fim": data_fim, "limit": limit}).all()
-    elif metrica == 'pontos':
-        query = text("""
+        """),
+    'pontos': Consulta("ranking_bairros_pontos", """
             SELECT
                 b.id_bairro as id,
                 b.id_bairro::TEXT as codigo, -- [CORREÇÃO] Adicionada a coluna 'codigo'
@@ -46,18 +70,40 @@ def get_ranking_bairros(db: Session, metrica: str, data_inicio: date, data_fim:
             FROM bridge_ponto_bairro bpb
             JOIN dim_bairro b ON bpb.id_bairro = b.id_bairro
             GROUP BY b.id_bairro, b.nome_bairro ORDER BY valor DESC LIMIT :limit;
-        """)
-        return db.execute(query, {"limit": limit}).all()
-    else:
+        """),
+}
+
+
+@cache_swr
+@coalescer
+def get_ranking_bairros(db: Session, metrica: str, data_inicio: date, data_fim: date, limit: int):
+    """ Retorna rankings de bairros por linhas, ocorrências ou pontos. """
+    if metrica not in _CONSULTAS_RANKING_BAIRROS:
         raise ValueError("Métrica de ranking de bairro inválida.")
+    return _CONSULTAS_RANKING_BAIRROS[metrica].executar(
+        db, {"data_inicio": data_inicio, "data_fim": data_fim, "limit": limit}
+    ).all()
 
 
-def get_dashboard_bairro(db: Session, id_bairro_req: int, data_inicio: date, data_fim: date):
-    """
-    Busca todos os dados para o dashboard de um bairro específico, incluindo
-    as geometrias para o mapa.
-    """
-    query = text("""
+# Empresas e concessionárias distintas nas linhas do bairro: exatas ou pela união
+# dos sketches HyperLogLog diários de agg_hll_bairros_diarias
+_CONTAGEM_ENTIDADES_BAIRRO = {
+    True: """(SELECT COUNT(DISTINCT agg.id_empresa)
+                FROM agg_metricas_linhas_diarias agg JOIN bridge_linha_bairro blb ON agg.id_linha = blb.id_linha
+                WHERE blb.id_bairro = :id_bairro AND agg.data BETWEEN :data_inicio AND :data_fim) as qtd_empresas,
+            (SELECT COUNT(DISTINCT agg.id_concessionaria)
+                FROM agg_metricas_linhas_diarias agg JOIN bridge_linha_bairro blb ON agg.id_linha = blb.id_linha
+                WHERE blb.id_bairro = :id_bairro AND agg.data BETWEEN :data_inicio AND :data_fim)
+            as qtd_concessionarias""",
+    False: """(SELECT ROUND(hll_cardinality(hll_union_agg(empresas)))::BIGINT FROM agg_hll_bairros_diarias
+                WHERE id_bairro = :id_bairro AND data BETWEEN :data_inicio AND :data_fim) as qtd_empresas,
+            (SELECT ROUND(hll_cardinality(hll_union_agg(concessionarias)))::BIGINT FROM agg_hll_bairros_diarias
+                WHERE id_bairro = :id_bairro AND data BETWEEN :data_inicio AND :data_fim) as qtd_concessionarias""",
+}
+
+
+def _consulta_dashboard_bairro(exato: bool):
+    return Consulta("dashboard_bairro" if exato else "dashboard_bairro_aproximado", f"""
     WITH
     -- CTEs 1 a 4 (as mesmas de antes)
     metricas_bairro AS (
@@ -69,8 +115,7 @@ def get_dashboard_bairro(db: Session, id_bairro_req: int, data_inicio: date, dat
         SELECT
             (SELECT COUNT(*) FROM bridge_linha_bairro WHERE id_bairro = :id_bairro) as qtd_linhas,
             (SELECT COUNT(*) FROM bridge_ponto_bairro WHERE id_bairro = :id_bairro) as qtd_pontos,
-            (SELECT COUNT(DISTINCT agg.id_empresa) FROM agg_metricas_linhas_diarias agg JOIN bridge_linha_bairro blb ON agg.id_linha = blb.id_linha WHERE blb.id_bairro = :id_bairro AND agg.data BETWEEN :data_inicio AND :data_fim) as qtd_empresas,
-            (SELECT COUNT(DISTINCT agg.id_concessionaria) FROM agg_metricas_linhas_diarias agg JOIN bridge_linha_bairro blb ON agg.id_linha = blb.id_linha WHERE blb.id_bairro = :id_bairro AND agg.data BETWEEN :data_inicio AND :data_fim) as qtd_concessionarias
+            {_CONTAGEM_ENTIDADES_BAIRRO[exato]}
     ),
     linhas_mais_utilizadas AS (
         SELECT l.id_linha as id, l.cod_linha as codigo, l.nome_linha as nome, SUM(agg.total_passageiros) as valor
@@ -128,4 +173,21 @@ def get_dashboard_bairro(db: Session, id_bairro_req: int, data_inicio: date, dat
     WHERE b.id_bairro = :id_bairro;
     """)
 
-    return db.execute(query, {"id_bairro": id_bairro_req, "data_inicio": data_inicio, "data_fim": data_fim}).fetchone()
+
+_CONSULTAS_DASHBOARD_BAIRRO = {exato: _consulta_dashboard_bairro(exato) for exato in (True, False)}
+
+
+@cache_swr
+@coalescer
+@snapshot_mensal("bairro")
+def get_dashboard_bairro(db: Session, id_bairro_req: int, data_inicio: date, data_fim: date, exato: bool = True):
+    """
+    Busca todos os dados para o dashboard de um bairro específico, incluindo
+    as geometrias para o mapa. Com exato=False, as contagens de empresas e
+    concessionárias vêm dos sketches HyperLogLog diários (aproximadas), se existirem.
+    """
+
+    exato = exato or not sketches_disponiveis(db)
+    return _CONSULTAS_DASHBOARD_BAIRRO[exato].executar(
+        db, {"id_bairro": id_bairro_req, "data_inicio": data_inicio, "data_fim": data_fim}
+    ).fetchone()
@@ -1,22 +1,49 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 from datetime import date
 
+from app.cache import cache_swr
+from app.catalogo import Consulta
+from app.queries.sketches import sketches_disponiveis
+from app.singleflight import coalescer
 
-def get_todas_as_concessionarias(db: Session):
-    """ Busca todas as concessionárias para popular filtros. """
-    query = text("""
+
+_CONSULTA_TODAS_AS_CONCESSIONARIAS = Consulta("todas_as_concessionarias", """
         SELECT id_concessionaria, codigo_concessionaria, nome_concessionaria
         FROM dim_concessionaria
         WHERE codigo_concessionaria != 0
         ORDER BY nome_concessionaria;
     """)
-    return db.execute(query).all()
 
 
-def get_ranking_concessionarias(db: Session, data_inicio: date, data_fim: date):
-    """ Retorna os dados comparativos entre todas as concessionárias. """
-    query = text("""
+def get_todas_as_concessionarias(db: Session):
+    """ Busca todas as concessionárias para popular filtros. """
+    return _CONSULTA_TODAS_AS_CONCESSIONARIAS.executar(db).all()
+
+
+# Linhas distintas por concessionaria: exata (COUNT DISTINCT sobre os agregados diários) ou
+# aproximada, pela união dos sketches HyperLogLog diários de agg_hll_concessionarias_diarias
+_CONTAGEM_LINHAS = {
+    True: """
+            SELECT
+                agg.id_concessionaria,
+                COUNT(DISTINCT agg.id_linha) as total_linhas
+            FROM agg_metricas_linhas_diarias agg
+            WHERE agg.data BETWEEN :data_inicio AND :data_fim
+            GROUP BY agg.id_concessionaria
+        """,
+    False: """
+            SELECT
+                id_concessionaria,
+                ROUND(hll_cardinality(hll_union_agg(linhas)))::BIGINT as total_linhas
+            FROM agg_hll_concessionarias_diarias
+            WHERE data BETWEEN :data_inicio AND :data_fim
+            GROUP BY id_concessionaria
+        """,
+}
+
+
+def _consulta_ranking_concessionarias(exato: bool):
+    return Consulta("ranking_concessionarias" if exato else "ranking_concessionarias_aproximado", f"""
         WITH
         metricas_agregadas AS (
             SELECT
@@ -28,14 +55,7 @@ def get_ranking_concessionarias(db: Session, data_inicio: date, data_fim: date):
             WHERE data BETWEEN :data_inicio AND :data_fim
             GROUP BY id_concessionaria
         ),
-        contagem_linhas AS (
-            SELECT
-                agg.id_concessionaria,
-                COUNT(DISTINCT agg.id_linha) as total_linhas
-            FROM agg_metricas_linhas_diarias agg
-            WHERE agg.data BETWEEN :data_inicio AND :data_fim
-            GROUP BY agg.id_concessionaria
-        )
+        contagem_linhas AS ({_CONTAGEM_LINHAS[exato]})
         SELECT
             dc.id_concessionaria,
             dc.codigo_concessionaria,
@@ -49,12 +69,105 @@ def get_ranking_concessionarias(db: Session, data_inicio: date, data_fim: date):
         LEFT JOIN contagem_linhas cl ON dc.id_concessionaria = cl.id_concessionaria
         WHERE dc.codigo_concessionaria != 0;
     """)
-    return db.execute(query, {"data_inicio": data_inicio, "data_fim": data_fim}).all()
 
 
-def get_dashboard_concessionaria(db: Session, id_concessionaria_req: int, data_inicio: date, data_fim: date):
-    """ Busca todos os dados para o dashboard de uma concessionária específica. """
-    query = text("""
+_CONSULTAS_RANKING_CONCESSIONARIAS = {exato: _consulta_ranking_concessionarias(exato) for exato in (True, False)}
+
+
+@cache_swr
+@coalescer
+def get_ranking_concessionarias(db: Session, data_inicio: date, data_fim: date, exato: bool = True):
+    """
+    Retorna os dados comparativos entre todas as concessionárias. Com exato=False, a
+    contagem de linhas vem dos sketches HyperLogLog diários (aproximada), se existirem.
+    """
+    exato = exato or not sketches_disponiveis(db)
+    return _CONSULTAS_RANKING_CONCESSIONARIAS[exato].executar(
+        db, {"data_inicio": data_inicio, "data_fim": data_fim}
+    ).all()
+
+
+# Período e janela de comparação em uma única varredura de cada tabela (agregação condicional).
+# A posição é pelo total de passageiros no período.
+def _consulta_ranking_concessionarias_comparativo(exato: bool):
+    nome = "ranking_concessionarias_comparativo" if exato else "ranking_concessionarias_comparativo_aproximado"
+    return Consulta(nome, f"""
+        WITH
+        metricas_agregadas AS (
+            SELECT
+                id_concessionaria,
+                SUM(total_ocorrencias) FILTER (WHERE atual) as total_ocorrencias,
+                SUM(total_passageiros) FILTER (WHERE atual) as total_passageiros,
+                SUM(total_viagens) FILTER (WHERE atual) as total_viagens,
+                SUM(total_ocorrencias) FILTER (WHERE anterior) as total_ocorrencias_anterior,
+                SUM(total_passageiros) FILTER (WHERE anterior) as total_passageiros_anterior,
+                SUM(total_viagens) FILTER (WHERE anterior) as total_viagens_anterior
+            FROM agg_metricas_concessionarias_diarias
+            CROSS JOIN LATERAL (
+                SELECT
+                    data BETWEEN :data_inicio AND :data_fim AS atual,
+                    data BETWEEN :inicio_anterior AND :fim_anterior AS anterior
+            ) janela
+            WHERE data BETWEEN :data_inicio AND :data_fim OR data BETWEEN :inicio_anterior AND :fim_anterior
+            GROUP BY id_concessionaria
+        ),
+        contagem_linhas AS ({_CONTAGEM_LINHAS[exato]}),
+        comparativo AS (
+            SELECT
+                dc.id_concessionaria,
+                dc.codigo_concessionaria,
+                dc.nome_concessionaria,
+                COALESCE(cl.total_linhas, 0) as total_linhas,
+                COALESCE(ma.total_ocorrencias, 0) as total_ocorrencias,
+                COALESCE(ma.total_passageiros, 0) as total_passageiros,
+                COALESCE((ma.total_ocorrencias * 10000.0) / NULLIF(ma.total_viagens, 0), 0)
+                    as taxa_ocorrencias_por_10k_viagens,
+                ma.total_ocorrencias_anterior,
+                ma.total_passageiros_anterior,
+                (ma.total_ocorrencias_anterior * 10000.0)
+                    / NULLIF(ma.total_viagens_anterior, 0) as taxa_ocorrencias_por_10k_viagens_anterior,
+                (ma.total_passageiros - ma.total_passageiros_anterior) * 100.0
+                    / NULLIF(ma.total_passageiros_anterior, 0) as variacao_passageiros_percentual,
+                (ma.total_ocorrencias - ma.total_ocorrencias_anterior) * 100.0
+                    / NULLIF(ma.total_ocorrencias_anterior, 0) as variacao_ocorrencias_percentual,
+                RANK() OVER (ORDER BY COALESCE(ma.total_passageiros, 0) DESC) as posicao,
+                CASE WHEN ma.total_passageiros_anterior IS NOT NULL
+                    THEN RANK() OVER (ORDER BY ma.total_passageiros_anterior DESC NULLS LAST)
+                END as posicao_anterior
+            FROM dim_concessionaria dc
+            LEFT JOIN metricas_agregadas ma ON dc.id_concessionaria = ma.id_concessionaria
+            LEFT JOIN contagem_linhas cl ON dc.id_concessionaria = cl.id_concessionaria
+            WHERE dc.codigo_concessionaria != 0
+        )
+        SELECT *, posicao_anterior - posicao as variacao_posicao
+        FROM comparativo;
+    """)
+
+
+_CONSULTAS_RANKING_CONCESSIONARIAS_COMPARATIVO = {
+    exato: _consulta_ranking_concessionarias_comparativo(exato) for exato in (True, False)
+}
+
+
+@cache_swr
+@coalescer
+def get_ranking_concessionarias_comparativo(
+    db: Session, data_inicio: date, data_fim: date, inicio_anterior: date, fim_anterior: date, exato: bool = True
+):
+    """ Dados comparativos entre todas as concessionárias no período e na janela de comparação. """
+    exato = exato or not sketches_disponiveis(db)
+    return _CONSULTAS_RANKING_CONCESSIONARIAS_COMPARATIVO[exato].executar(
+        db,
+        {
+            "data_inicio": data_inicio,
+            "data_fim": data_fim,
+            "inicio_anterior": inicio_anterior,
+            "fim_anterior": fim_anterior,
+        },
+    ).all()
+
+
+_CONSULTA_DASHBOARD_CONCESSIONARIA = Consulta("dashboard_concessionaria", """
     WITH
     metricas_base AS (
         SELECT
@@ -86,4 +199,12 @@ def get_dashboard_concessionaria(db: Session, id_concessionaria_req: int, data_i
         (SELECT json_agg(lmu) FROM linhas_mais_utilizadas lmu) as grafico_linhas_mais_utilizadas,
         (SELECT json_agg(pds) FROM pass_dia_semana pds) as grafico_media_passageiros_dia_semana;
     """)
-    return db.execute(query, {"id_concessionaria": id_concessionaria_req, "data_inicio": data_inicio, "data_fim": data_fim}).fetchone()
+
+
+@cache_swr
+@coalescer
+def get_dashboard_concessionaria(db: Session, id_concessionaria_req: int, data_inicio: date, data_fim: date):
+    """ Busca todos os dados para o dashboard de uma concessionária específica. """
+    return _CONSULTA_DASHBOARD_CONCESSIONARIA.executar(
+        db, {"id_concessionaria": id_concessionaria_req, "data_inicio": data_inicio, "data_fim": data_fim}
+    ).fetchone()
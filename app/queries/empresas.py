@@ -1,22 +1,49 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 from datetime import date
 
+from app.cache import cache_swr
+from app.catalogo import Consulta
+from app.queries.sketches import sketches_disponiveis
+from app.singleflight import coalescer
 
-def get_todas_as_empresas(db: Session):
-    """ Busca todas as empresas para popular filtros. """
-    query = text("""
+
+_CONSULTA_TODAS_AS_EMPRESAS = Consulta("todas_as_empresas", """
         SELECT id_empresa, nome_empresa
         FROM dim_empresa
         WHERE codigo_empresa != 0
         ORDER BY nome_empresa;
     """)
-    return db.execute(query).all()
 
 
-def get_ranking_empresas(db: Session, data_inicio: date, data_fim: date):
-    """ Retorna os dados comparativos entre todas as empresas. """
-    query = text("""
+def get_todas_as_empresas(db: Session):
+    """ Busca todas as empresas para popular filtros. """
+    return _CONSULTA_TODAS_AS_EMPRESAS.executar(db).all()
+
+
+# Linhas distintas por empresa: exata (COUNT DISTINCT sobre os agregados diários) ou
+# aproximada, pela união dos sketches HyperLogLog diários de agg_hll_empresas_diarias
+_CONTAGEM_LINHAS = {
+    True: """
+            SELECT
+                agg.id_empresa,
+                COUNT(DISTINCT agg.id_linha) as total_linhas
+            FROM agg_metricas_linhas_diarias agg
+            WHERE agg.data BETWEEN :data_inicio AND :data_fim
+            GROUP BY agg.id_empresa
+        """,
+    False: """
+            SELECT
+                id_empresa,
+                ROUND(hll_cardinality(hll_union_agg(linhas)))::BIGINT as total_linhas
+            FROM agg_hll_empresas_diarias
+            WHERE data BETWEEN :data_inicio AND :data_fim
+            GROUP BY id_empresa
+        """,
+}
+
+
+def _consulta_ranking_empresas(exato: bool):
+    return Consulta("ranking_empresas" if exato else "ranking_empresas_aproximado", f"""
         WITH
         metricas_agregadas AS (
             SELECT
@@ -28,14 +55,7 @@ def get_ranking_empresas(db: Session, data_inicio: date, data_fim: date):
             WHERE data BETWEEN :data_inicio AND :data_fim
             GROUP BY id_empresa
         ),
-        contagem_linhas AS (
-            SELECT
-                agg.id_empresa,
-                COUNT(DISTINCT agg.id_linha) as total_linhas
-            FROM agg_metricas_linhas_diarias agg
-            WHERE agg.data BETWEEN :data_inicio AND :data_fim
-            GROUP BY agg.id_empresa
-        )
+        contagem_linhas AS ({_CONTAGEM_LINHAS[exato]})
         SELECT
             de.id_empresa,
             de.nome_empresa,
@@ -48,12 +68,112 @@ def get_ranking_empresas(db: Session, data_inicio: date, data_fim: date):
         LEFT JOIN contagem_linhas cl ON de.id_empresa = cl.id_empresa
         WHERE de.codigo_empresa != 0;
     """)
-    return db.execute(query, {"data_inicio": data_inicio, "data_fim": data_fim}).all()
 
 
-def get_dashboard_empresa(db: Session, id_empresa_req: int, data_inicio: date, data_fim: date):
-    """ Busca todos os dados para o dashboard de uma empresa específica. """
-    query = text("""
+_CONSULTAS_RANKING_EMPRESAS = {exato: _consulta_ranking_empresas(exato) for exato in (True, False)}
+
+
+@cache_swr
+@coalescer
+def get_ranking_empresas(db: Session, data_inicio: date, data_fim: date, exato: bool = True):
+    """
+    Retorna os dados comparativos entre todas as empresas. Com exato=False, a
+    contagem de linhas vem dos sketches HyperLogLog diários (aproximada), se existirem.
+    """
+    exato = exato or not sketches_disponiveis(db)
+    return _CONSULTAS_RANKING_EMPRESAS[exato].executar(db, {"data_inicio": data_inicio, "data_fim": data_fim}).all()
+
+
+# Período e janela de comparação em uma única varredura de cada tabela (agregação condicional).
+# A posição é pelo total de passageiros no período.
+def _consulta_ranking_empresas_comparativo(exato: bool):
+    nome = "ranking_empresas_comparativo" if exato else "ranking_empresas_comparativo_aproximado"
+    return Consulta(nome, f"""
+        WITH
+        metricas_agregadas AS (
+            SELECT
+                id_empresa,
+                SUM(total_ocorrencias) FILTER (WHERE atual) as total_ocorrencias,
+                SUM(total_passageiros) FILTER (WHERE atual) as total_passageiros,
+                SUM(total_viagens) FILTER (WHERE atual) as total_viagens,
+                SUM(total_ocorrencias) FILTER (WHERE anterior) as total_ocorrencias_anterior,
+                SUM(total_passageiros) FILTER (WHERE anterior) as total_passageiros_anterior,
+                SUM(total_viagens) FILTER (WHERE anterior) as total_viagens_anterior
+            FROM agg_metricas_empresas_diarias
+            CROSS JOIN LATERAL (
+                SELECT
+                    data BETWEEN :data_inicio AND :data_fim AS atual,
+                    data BETWEEN :inicio_anterior AND :fim_anterior AS anterior
+            ) janela
+            WHERE data BETWEEN :data_inicio AND :data_fim OR data BETWEEN :inicio_anterior AND :fim_anterior
+            GROUP BY id_empresa
+        ),
+        contagem_linhas AS ({_CONTAGEM_LINHAS[exato]}),
+        comparativo AS (
+            SELECT
+                de.id_empresa,
+                de.nome_empresa,
+                COALESCE(cl.total_linhas, 0) as total_linhas,
+                COALESCE(ma.total_ocorrencias, 0) as total_ocorrencias,
+                COALESCE(ma.total_passageiros, 0) as total_passageiros,
+                COALESCE((ma.total_ocorrencias * 10000.0) / NULLIF(ma.total_viagens, 0), 0)
+                    as taxa_ocorrencias_por_10k_viagens,
+                ma.total_ocorrencias_anterior,
+                ma.total_passageiros_anterior,
+                (ma.total_ocorrencias_anterior * 10000.0)
+                    / NULLIF(ma.total_viagens_anterior, 0) as taxa_ocorrencias_por_10k_viagens_anterior,
+                (ma.total_passageiros - ma.total_passageiros_anterior) * 100.0
+                    / NULLIF(ma.total_passageiros_anterior, 0) as variacao_passageiros_percentual,
+                (ma.total_ocorrencias - ma.total_ocorrencias_anterior) * 100.0
+                    / NULLIF(ma.total_ocorrencias_anterior, 0) as variacao_ocorrencias_percentual,
+                RANK() OVER (ORDER BY COALESCE(ma.total_passageiros, 0) DESC) as posicao,
+                CASE WHEN ma.total_passageiros_anterior IS NOT NULL
+                    THEN RANK() OVER (ORDER BY ma.total_passageiros_anterior DESC NULLS LAST)
+                END as posicao_anterior
+            FROM dim_empresa de
+            LEFT JOIN metricas_agregadas ma ON de.id_empresa = ma.id_empresa
+            LEFT JOIN contagem_linhas cl ON de.id_empresa = cl.id_empresa
+            WHERE de.codigo_empresa != 0
+        )
+        SELECT *, posicao_anterior - posicao as variacao_posicao
+        FROM comparativo;
+    """)
+
+
+_CONSULTAS_RANKING_EMPRESAS_COMPARATIVO = {
+    exato: _consulta_ranking_empresas_comparativo(exato) for exato in (True, False)
+}
+
+
+@cache_swr
+@coalescer
+def get_ranking_empresas_comparativo(
+    db: Session, data_inicio: date, data_fim: date, inicio_anterior: date, fim_anterior: date, exato: bool = True
+):
+    """ Dados comparativos entre todas as empresas no período e na janela de comparação. """
+    exato = exato or not sketches_disponiveis(db)
+    return _CONSULTAS_RANKING_EMPRESAS_COMPARATIVO[exato].executar(
+        db,
+        {
+            "data_inicio": data_inicio,
+            "data_fim": data_fim,
+            "inicio_anterior": inicio_anterior,
+            "fim_anterior": fim_anterior,
+        },
+    ).all()
+
+
+# Linhas distintas da empresa no dashboard: exata ou pela união dos sketches HyperLogLog
+_TOTAL_LINHAS_EMPRESA = {
+    True: """SELECT COUNT(DISTINCT id_linha) FROM agg_metricas_linhas_diarias
+        WHERE id_empresa = :id_empresa AND data BETWEEN :data_inicio AND :data_fim""",
+    False: """SELECT ROUND(hll_cardinality(hll_union_agg(linhas)))::BIGINT FROM agg_hll_empresas_diarias
+        WHERE id_empresa = :id_empresa AND data BETWEEN :data_inicio AND :data_fim""",
+}
+
+
+def _consulta_dashboard_empresa(exato: bool):
+    return Consulta("dashboard_empresa" if exato else "dashboard_empresa_aproximado", f"""
     WITH
     metricas_base AS (
         SELECT
@@ -98,7 +218,7 @@ def get_dashboard_empresa(db: Session, id_empresa_req: int, data_inicio: date, d
         (SELECT total_passageiros FROM metricas_base) as total_passageiros,
         (SELECT total_ocorrencias FROM metricas_base) as total_ocorrencias,
         (SELECT total_viagens FROM metricas_base) as total_viagens,
-        (SELECT COUNT(DISTINCT id_linha) FROM agg_metricas_linhas_diarias WHERE id_empresa = :id_empresa AND data BETWEEN :data_inicio AND :data_fim) as total_linhas,
+        ({_TOTAL_LINHAS_EMPRESA[exato]}) as total_linhas,
         (SELECT total_passageiros FROM metricas_base) / NULLIF((SELECT COUNT(DISTINCT date_trunc('month', data)) FROM agg_metricas_empresas_diarias WHERE id_empresa = :id_empresa AND data BETWEEN :data_inicio AND :data_fim), 0) as media_pass_mes,
         (SELECT total_passageiros FROM metricas_base) / NULLIF((SELECT COUNT(DISTINCT data) FROM agg_metricas_empresas_diarias WHERE id_empresa = :id_empresa AND data BETWEEN :data_inicio AND :data_fim), 0) as media_pass_dia,
         (SELECT total_passageiros FROM metricas_base) / NULLIF((SELECT total_viagens FROM metricas_base), 0) as media_pass_viagem,
@@ -107,4 +227,19 @@ def get_dashboard_empresa(db: Session, id_empresa_req: int, data_inicio: date, d
         (SELECT json_agg(pds) FROM pass_dia_semana pds) as grafico_media_passageiros_dia_semana,
         (SELECT json_agg(ep) FROM evolucao_passageiros ep) as grafico_evolucao_passageiros_ano;
     """)
-    return db.execute(query, {"id_empresa": id_empresa_req, "data_inicio": data_inicio, "data_fim": data_fim}).fetchone()
+
+
+_CONSULTAS_DASHBOARD_EMPRESA = {exato: _consulta_dashboard_empresa(exato) for exato in (True, False)}
+
+
+@cache_swr
+@coalescer
+def get_dashboard_empresa(db: Session, id_empresa_req: int, data_inicio: date, data_fim: date, exato: bool = True):
+    """
+    Busca todos os dados para o dashboard de uma empresa específica. Com exato=False,
+    o total de linhas vem dos sketches HyperLogLog diários (aproximado), se existirem.
+    """
+    exato = exato or not sketches_disponiveis(db)
+    return _CONSULTAS_DASHBOARD_EMPRESA[exato].executar(
+        db, {"id_empresa": id_empresa_req, "data_inicio": data_inicio, "data_fim": data_fim}
+    ).fetchone()
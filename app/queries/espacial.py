@@ -0,0 +1,52 @@
+from sqlalchemy.orm import Session
+
+from app.catalogo import Consulta
+
+
+_CONSULTA_PONTOS_ULTIMO_PERIODO = Consulta("pontos_ultimo_periodo", """
+        WITH ultimo_periodo AS (
+            SELECT
+                MAX(ano_referencia) AS ano,
+                MAX(mes_referencia) AS mes
+            FROM
+                staging_pontos_onibus_bh
+            WHERE
+                ano_referencia = (SELECT MAX(ano_referencia) FROM staging_pontos_onibus_bh)
+        )
+        SELECT
+            p.identificador_ponto_onibus,
+            AVG(ST_X(p.geom)) AS longitude,
+            AVG(ST_Y(p.geom)) AS latitude,
+            array_agg(DISTINCT p.cod_linha ORDER BY p.cod_linha) AS linhas
+        FROM
+            staging_pontos_onibus_bh p
+        JOIN
+            ultimo_periodo up ON p.ano_referencia = up.ano AND p.mes_referencia = up.mes
+        WHERE
+            p.geom IS NOT NULL
+        GROUP BY
+            p.identificador_ponto_onibus;
+    """)
+
+
+def get_pontos_ultimo_periodo(db: Session):
+    """
+    Retorna cada ponto de ônibus físico do mês de referência mais recente,
+    com as coordenadas e os códigos das linhas que param nele.
+    """
+    return _CONSULTA_PONTOS_ULTIMO_PERIODO.executar(db).all()
+
+
+_CONSULTA_POLIGONOS_BAIRROS = Consulta("poligonos_bairros", """
+        SELECT
+            id_bairro,
+            nome_bairro,
+            ST_AsBinary(geom) AS wkb
+        FROM dim_bairro
+        WHERE geom IS NOT NULL;
+    """)
+
+
+def get_poligonos_bairros(db: Session):
+    """ Retorna o polígono (WKB) de cada bairro com geometria. """
+    return _CONSULTA_POLIGONOS_BAIRROS.executar(db).all()
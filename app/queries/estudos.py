@@ -1,15 +1,30 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 from datetime import date
+from typing import Optional
 
+from app.catalogo import Consulta
 
-def get_analise_eficiencia_linhas(db: Session, data_inicio: date, data_fim: date):
+
+def _parametros_pagina(data_inicio: date, data_fim: date, limite: Optional[int], cursor: Optional[tuple]):
+    # LIMIT NULL no Postgres equivale a sem limite, preservando o comportamento sem paginação
+    parametros = {"data_inicio": data_inicio, "data_fim": data_fim, "limite": limite}
+    if cursor:
+        parametros["cursor_valor"], parametros["cursor_id"] = str(cursor[0]), cursor[1]
+    return parametros
+
+
+def _consultas_paginadas(nome: str, sql: str, filtro_cursor: str):
     """
-    Calcula as métricas de eficiência (passageiros/km e passageiros/minuto)
-    para todas as linhas em um determinado período, usando a tabela agregada.
-    [ESTA QUERY ESTÁ CORRETA - NENHUMA MUDANÇA NECESSÁRIA]
+    Compila as duas variantes de uma consulta paginada: sem cursor (primeira página)
+    e com o filtro do cursor no lugar de {filtro_cursor}. Indexadas por bool(cursor).
     """
-    query = text("""
+    return {
+        False: Consulta(nome, sql.replace("{filtro_cursor}", "")),
+        True: Consulta(f"{nome}_apos_cursor", sql.replace("{filtro_cursor}", filtro_cursor)),
+    }
+
+
+_CONSULTAS_ANALISE_EFICIENCIA_LINHAS = _consultas_paginadas("analise_eficiencia_linhas", """
         SELECT
             l.id_linha,
             l.cod_linha,
@@ -26,17 +41,30 @@ def get_analise_eficiencia_linhas(db: Session, data_inicio: date, data_fim: date
             AND agg.total_extensao_km > 0
             AND agg.total_duracao_minutos > 0
         GROUP BY
-            l.id_linha, l.cod_linha, l.nome_linha;
-    """)
-    return db.execute(query, {"data_inicio": data_inicio, "data_fim": data_fim}).all()
+            l.id_linha, l.cod_linha, l.nome_linha{filtro_cursor}
+        ORDER BY
+            passageiros_por_km DESC, l.id_linha DESC
+        LIMIT :limite;
+    """, """
+        HAVING
+            (COALESCE(SUM(agg.total_passageiros) / NULLIF(SUM(agg.total_extensao_km), 0), 0), l.id_linha)
+            < (CAST(:cursor_valor AS NUMERIC), :cursor_id)""")
 
 
-def get_taxa_falhas_por_empresa(db: Session, data_inicio: date, data_fim: date):
+def get_analise_eficiencia_linhas(
+    db: Session, data_inicio: date, data_fim: date, limite: Optional[int] = None, cursor: Optional[tuple] = None
+):
     """
-    Calcula a taxa de falhas mecânicas por 10.000 viagens para cada empresa.
-    [CORREÇÃO] Adicionada condição para excluir a empresa "Não Informado" do ranking.
+    Calcula as métricas de eficiência (passageiros/km e passageiros/minuto)
+    para todas as linhas em um determinado período, usando a tabela agregada.
+    Paginação por keyset: ordenado por passageiros_por_km e id_linha (decrescentes),
+    o cursor é o par (passageiros_por_km, id_linha) da última linha da página anterior.
     """
-    query = text("""
+    parametros = _parametros_pagina(data_inicio, data_fim, limite, cursor)
+    return _CONSULTAS_ANALISE_EFICIENCIA_LINHAS[bool(cursor)].executar(db, parametros).all()
+
+
+_CONSULTA_TAXA_FALHAS_POR_EMPRESA = Consulta("taxa_falhas_por_empresa", """
         WITH falhas AS (
             SELECT id_empresa, COUNT(*) as total_falhas
             FROM agg_falhas_mecanicas_diarias
@@ -62,15 +90,17 @@ def get_taxa_falhas_por_empresa(db: Session, data_inicio: date, data_fim: date):
             AND (v.total_viagens > 0 OR f.total_falhas > 0)
         ORDER BY taxa_falhas_por_10k_viagens DESC;
     """)
-    return db.execute(query, {"data_inicio": data_inicio, "data_fim": data_fim}).all()
 
 
-def get_ranking_justificativas_falhas(db: Session, data_inicio: date, data_fim: date):
+def get_taxa_falhas_por_empresa(db: Session, data_inicio: date, data_fim: date):
     """
-    Retorna as justificativas mais comuns para falhas mecânicas.
-    [ESTA QUERY ESTÁ CORRETA - NENHUMA MUDANÇA NECESSÁRIA]
+    Calcula a taxa de falhas mecânicas por 10.000 viagens para cada empresa.
+    [CORREÇÃO] Adicionada condição para excluir a empresa "Não Informado" do ranking.
     """
-    query = text("""
+    return _CONSULTA_TAXA_FALHAS_POR_EMPRESA.executar(db, {"data_inicio": data_inicio, "data_fim": data_fim}).all()
+
+
+_CONSULTA_RANKING_JUSTIFICATIVAS_FALHAS = Consulta("ranking_justificativas_falhas", """
         SELECT
             j.nome_justificativa,
             SUM(agg.total_falhas) AS total_falhas
@@ -80,15 +110,19 @@ def get_ranking_justificativas_falhas(db: Session, data_inicio: date, data_fim:
         GROUP BY j.nome_justificativa
         ORDER BY total_falhas DESC;
     """)
-    return db.execute(query, {"data_inicio": data_inicio, "data_fim": data_fim}).all()
 
 
-def get_correlacao_idade_falhas(db: Session, data_inicio: date, data_fim: date):
+def get_ranking_justificativas_falhas(db: Session, data_inicio: date, data_fim: date):
     """
-    Retorna dados para a análise de correlação entre idade do veículo e número de falhas.
-    [OTIMIZAÇÃO FINAL] A query agora usa uma VIEW MATERIALIZADA para obter a empresa do veículo.
+    Retorna as justificativas mais comuns para falhas mecânicas.
+    [ESTA QUERY ESTÁ CORRETA - NENHUMA MUDANÇA NECESSÁRIA]
     """
-    query = text("""
+    return _CONSULTA_RANKING_JUSTIFICATIVAS_FALHAS.executar(
+        db, {"data_inicio": data_inicio, "data_fim": data_fim}
+    ).all()
+
+
+_CONSULTAS_CORRELACAO_IDADE_FALHAS = _consultas_paginadas("correlacao_idade_falhas", """
         WITH
         -- A CTE de falhas continua a mesma, pois é rápida
         falhas_por_veiculo AS (
@@ -118,19 +152,27 @@ def get_correlacao_idade_falhas(db: Session, data_inicio: date, data_fim: date):
             falhas_por_veiculo fpv ON v.id_veiculo = fpv.id_veiculo
         WHERE
             -- Opcional: exclui veículos cuja empresa não foi identificada
-            e.codigo_empresa != 0
+            e.codigo_empresa != 0{filtro_cursor}
         ORDER BY
-            total_falhas DESC;
-    """)
-    return db.execute(query, {"data_inicio": data_inicio, "data_fim": data_fim}).all()
+            total_falhas DESC, v.id_veiculo DESC
+        LIMIT :limite;
+    """, """
+            AND (COALESCE(fpv.total_falhas, 0), v.id_veiculo) < (CAST(:cursor_valor AS NUMERIC), :cursor_id)""")
 
 
-def get_ranking_linhas_por_falhas(db: Session, data_inicio: date, data_fim: date):
+def get_correlacao_idade_falhas(
+    db: Session, data_inicio: date, data_fim: date, limite: Optional[int] = None, cursor: Optional[tuple] = None
+):
     """
-    Retorna o ranking de linhas com o maior número de falhas mecânicas.
-    [ESTA QUERY ESTÁ CORRETA - NENHUMA MUDANÇA NECESSÁRIA]
+    Retorna dados para a análise de correlação entre idade do veículo e número de falhas.
+    [OTIMIZAÇÃO FINAL] A query agora usa uma VIEW MATERIALIZADA para obter a empresa do veículo.
+    Paginação por keyset: o cursor é o par (total_falhas, id_veiculo) da última linha.
     """
-    query = text("""
+    parametros = _parametros_pagina(data_inicio, data_fim, limite, cursor)
+    return _CONSULTAS_CORRELACAO_IDADE_FALHAS[bool(cursor)].executar(db, parametros).all()
+
+
+_CONSULTAS_RANKING_LINHAS_POR_FALHAS = _consultas_paginadas("ranking_linhas_por_falhas", """
         SELECT
             l.id_linha,
             l.cod_linha,
@@ -139,7 +181,19 @@ def get_ranking_linhas_por_falhas(db: Session, data_inicio: date, data_fim: date
         FROM agg_falhas_mecanicas_diarias agg
         JOIN dim_linha l ON agg.id_linha = l.id_linha
         WHERE agg.data BETWEEN :data_inicio AND :data_fim
-        GROUP BY l.id_linha, l.cod_linha, l.nome_linha
-        ORDER BY total_falhas DESC;
-    """)
-    return db.execute(query, {"data_inicio": data_inicio, "data_fim": data_fim}).all()
+        GROUP BY l.id_linha, l.cod_linha, l.nome_linha{filtro_cursor}
+        ORDER BY total_falhas DESC, l.id_linha DESC
+        LIMIT :limite;
+    """, """
+        HAVING (SUM(agg.total_falhas), l.id_linha) < (CAST(:cursor_valor AS NUMERIC), :cursor_id)""")
+
+
+def get_ranking_linhas_por_falhas(
+    db: Session, data_inicio: date, data_fim: date, limite: Optional[int] = None, cursor: Optional[tuple] = None
+):
+    """
+    Retorna o ranking de linhas com o maior número de falhas mecânicas.
+    Paginação por keyset: o cursor é o par (total_falhas, id_linha) da última linha.
+    """
+    parametros = _parametros_pagina(data_inicio, data_fim, limite, cursor)
+    return _CONSULTAS_RANKING_LINHAS_POR_FALHAS[bool(cursor)].executar(db, parametros).all()
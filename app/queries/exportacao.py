@@ -0,0 +1,62 @@
+from sqlalchemy import text
+from datetime import date
+from typing import Dict
+
+# Colunas de entidade que podem ser usadas como filtro na exportação de viagens
+FILTROS_VIAGENS = ("id_linha", "id_empresa", "id_concessionaria", "id_veiculo")
+
+# Tabelas agregadas exportáveis e as colunas de entidade que cada uma aceita como filtro
+TABELAS_AGREGADAS = {
+    "linhas": ("agg_metricas_linhas_diarias", ("id_linha", "id_empresa", "id_concessionaria")),
+    "veiculos": ("agg_metricas_veiculos_diarias", ("id_veiculo",)),
+    "bairros": ("agg_metricas_bairros_diarias", ("id_bairro",)),
+    "empresas": ("agg_metricas_empresas_diarias", ("id_empresa",)),
+    "concessionarias": ("agg_metricas_concessionarias_diarias", ("id_concessionaria",)),
+    "falhas_mecanicas": ("agg_falhas_mecanicas_diarias", ("id_linha", "id_empresa", "id_veiculo")),
+}
+
+
+def _condicoes_filtro(alias: str, filtros: Dict[str, int], permitidos) -> str:
+    invalidos = set(filtros) - set(permitidos)
+    if invalidos:
+        raise ValueError(
+            f"Filtro(s) inválido(s): {', '.join(sorted(invalidos))}. Use: {', '.join(permitidos)}."
+        )
+    return "".join(f" AND {alias}.{coluna} = :{coluna}" for coluna in filtros)
+
+
+def montar_exportacao_viagens(data_inicio: date, data_fim: date, filtros: Dict[str, int]):
+    """
+    Monta a consulta de exportação das viagens (fact_viagens) de um período,
+    opcionalmente filtradas por linha, empresa, concessionária ou veículo.
+    A consulta não tem ORDER BY para que o Postgres possa entregar as linhas
+    à medida que as lê, sem precisar materializar e ordenar o resultado.
+    """
+    condicoes = _condicoes_filtro("f", filtros, FILTROS_VIAGENS)
+    query = text(f"""
+        SELECT
+            d.data_completa AS data,
+            f.*
+        FROM fact_viagens f
+        JOIN dim_data d ON f.id_data = d.id_data
+        WHERE d.data_completa BETWEEN :data_inicio AND :data_fim{condicoes};
+    """)
+    return query, {"data_inicio": data_inicio, "data_fim": data_fim, **filtros}
+
+
+def montar_exportacao_agregado(tabela: str, data_inicio: date, data_fim: date, filtros: Dict[str, int]):
+    """
+    Monta a consulta de exportação de uma das tabelas agregadas diárias
+    (agg_metricas_*_diarias ou agg_falhas_mecanicas_diarias) para um período.
+    """
+    if tabela not in TABELAS_AGREGADAS:
+        raise ValueError(f"Tabela inválida. Use: {', '.join(TABELAS_AGREGADAS)}.")
+
+    nome_tabela, permitidos = TABELAS_AGREGADAS[tabela]
+    condicoes = _condicoes_filtro("agg", filtros, permitidos)
+    query = text(f"""
+        SELECT agg.*
+        FROM {nome_tabela} agg
+        WHERE agg.data BETWEEN :data_inicio AND :data_fim{condicoes};
+    """)
+    return query, {"data_inicio": data_inicio, "data_fim": data_fim, **filtros}
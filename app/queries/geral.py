@@ -1,11 +1,12 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 from datetime import date
 
+from app.cache import cache_swr
+from app.catalogo import Consulta
+from app.singleflight import coalescer
 
-def get_kpis_gerais(db: Session, data_inicio: date, data_fim: date):
-    query = text(
-        """
+
+_CONSULTA_KPIS_GERAIS = Consulta("kpis_gerais", """
         SELECT
             COALESCE(SUM(f.passageiros), 0) AS total_passageiros,
             COALESCE(COUNT(f.id_fato_viagem), 0) AS total_viagens,
@@ -14,9 +15,85 @@ def get_kpis_gerais(db: Session, data_inicio: date, data_fim: date):
         FROM fact_viagens f
         JOIN dim_data d ON f.id_data = d.id_data
         WHERE d.data_completa BETWEEN :data_inicio AND :data_fim;
-    """
-    )
-    result = db.execute(
-        query, {"data_inicio": data_inicio, "data_fim": data_fim}
+    """)
+
+
+@cache_swr
+@coalescer
+def get_kpis_gerais(db: Session, data_inicio: date, data_fim: date):
+    result = _CONSULTA_KPIS_GERAIS.executar(
+        db, {"data_inicio": data_inicio, "data_fim": data_fim}
     ).fetchone()
     return result
+
+
+# Atual e anterior em uma única varredura: a agregação condicional (FILTER) separa as janelas,
+# que podem se sobrepor (ex.: ano_anterior de um período maior que um ano)
+_CONSULTA_KPIS_GERAIS_COMPARATIVO = Consulta("kpis_gerais_comparativo", """
+        WITH janelas AS (
+            SELECT
+                COALESCE(SUM(f.passageiros) FILTER (WHERE atual), 0) AS total_passageiros,
+                COUNT(f.id_fato_viagem) FILTER (WHERE atual) AS total_viagens,
+                COALESCE(SUM(f.flag_possui_ocorrencia) FILTER (WHERE atual), 0) AS total_ocorrencias,
+                SUM(f.extensao_realizada_km) FILTER (WHERE atual) AS total_km,
+                COALESCE(SUM(f.passageiros) FILTER (WHERE anterior), 0) AS total_passageiros_anterior,
+                COUNT(f.id_fato_viagem) FILTER (WHERE anterior) AS total_viagens_anterior,
+                COALESCE(SUM(f.flag_possui_ocorrencia) FILTER (WHERE anterior), 0) AS total_ocorrencias_anterior,
+                SUM(f.extensao_realizada_km) FILTER (WHERE anterior) AS total_km_anterior
+            FROM fact_viagens f
+            JOIN dim_data d ON f.id_data = d.id_data
+            CROSS JOIN LATERAL (
+                SELECT
+                    d.data_completa BETWEEN :data_inicio AND :data_fim AS atual,
+                    d.data_completa BETWEEN :inicio_anterior AND :fim_anterior AS anterior
+            ) janela
+            WHERE d.data_completa BETWEEN :data_inicio AND :data_fim
+               OR d.data_completa BETWEEN :inicio_anterior AND :fim_anterior
+        ),
+        kpis AS (
+            SELECT
+                *,
+                COALESCE(total_passageiros / NULLIF(total_km, 0), 0) AS eficiencia_passageiro_km,
+                COALESCE(total_passageiros_anterior / NULLIF(total_km_anterior, 0), 0)
+                    AS eficiencia_passageiro_km_anterior
+            FROM janelas
+        )
+        SELECT
+            total_passageiros,
+            total_viagens,
+            total_ocorrencias,
+            eficiencia_passageiro_km,
+            total_passageiros_anterior,
+            total_viagens_anterior,
+            total_ocorrencias_anterior,
+            eficiencia_passageiro_km_anterior,
+            (total_passageiros - total_passageiros_anterior) * 100.0
+                / NULLIF(total_passageiros_anterior, 0) AS variacao_passageiros_percentual,
+            (total_viagens - total_viagens_anterior) * 100.0
+                / NULLIF(total_viagens_anterior, 0) AS variacao_viagens_percentual,
+            (total_ocorrencias - total_ocorrencias_anterior) * 100.0
+                / NULLIF(total_ocorrencias_anterior, 0) AS variacao_ocorrencias_percentual,
+            (eficiencia_passageiro_km - eficiencia_passageiro_km_anterior) * 100.0
+                / NULLIF(eficiencia_passageiro_km_anterior, 0) AS variacao_eficiencia_percentual
+        FROM kpis;
+    """)
+
+
+@cache_swr
+@coalescer
+def get_kpis_gerais_comparativo(
+    db: Session, data_inicio: date, data_fim: date, inicio_anterior: date, fim_anterior: date
+):
+    """
+    KPIs do período e da janela de comparação, com as variações percentuais,
+    calculados em uma única varredura de fact_viagens.
+    """
+    return _CONSULTA_KPIS_GERAIS_COMPARATIVO.executar(
+        db,
+        {
+            "data_inicio": data_inicio,
+            "data_fim": data_fim,
+            "inicio_anterior": inicio_anterior,
+            "fim_anterior": fim_anterior,
+        },
+    ).fetchone()
@@ -1,41 +1,36 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 from datetime import date
 
+from app.cache import cache_swr
+from app.catalogo import Consulta
+from app.singleflight import coalescer
+from app.snapshots import snapshot_mensal
 
-def get_todas_as_linhas(db: Session):
-    """
-    Busca todas as linhas da tabela de dimensão para popular filtros.
-    """
-    query = text("""
+
+_CONSULTA_TODAS_AS_LINHAS = Consulta("todas_as_linhas", """
         SELECT id_linha, cod_linha, nome_linha
         FROM dim_linha
         ORDER BY cod_linha;
     """)
-    return db.execute(query).all()
 
 
-def get_ranking_linhas(
-    db: Session, metrica: str, data_inicio: date, data_fim: date, limit: int
-):
+def get_todas_as_linhas(db: Session):
     """
-    Busca o ranking de linhas por uma métrica específica (passageiros, viagens, ocorrências).
-    A consulta é feita na tabela agregada para alta performance.
+    Busca todas as linhas da tabela de dimensão para popular filtros.
     """
-    if metrica not in ["passageiros", "viagens", "ocorrencias"]:
-        raise ValueError(
-            "Métrica inválida. Use 'passageiros', 'viagens' ou 'ocorrencias'."
-        )
+    return _CONSULTA_TODAS_AS_LINHAS.executar(db).all()
 
-    coluna_soma = f"total_{metrica}"
 
-    query = text(
+# Uma variante da consulta por métrica, compiladas uma única vez
+_CONSULTAS_RANKING_LINHAS = {
+    metrica: Consulta(
+        f"ranking_linhas_{metrica}",
         f"""
         SELECT
             l.id_linha AS id,
             l.cod_linha AS codigo,
             l.nome_linha AS nome,
-            SUM(agg.{coluna_soma}) AS valor
+            SUM(agg.total_{metrica}) AS valor
         FROM
             agg_metricas_linhas_diarias agg
         JOIN
@@ -47,20 +42,120 @@ def get_ranking_linhas(
         ORDER BY
             valor DESC
         LIMIT :limit;
-    """
+    """,
     )
-    result = db.execute(
-        query, {"data_inicio": data_inicio, "data_fim": data_fim, "limit": limit}
+    for metrica in ("passageiros", "viagens", "ocorrencias")
+}
+
+
+@cache_swr
+@coalescer
+def get_ranking_linhas(
+    db: Session, metrica: str, data_inicio: date, data_fim: date, limit: int
+):
+    """
+    Busca o ranking de linhas por uma métrica específica (passageiros, viagens, ocorrências).
+    A consulta é feita na tabela agregada para alta performance.
+    """
+    if metrica not in _CONSULTAS_RANKING_LINHAS:
+        raise ValueError(
+            "Métrica inválida. Use 'passageiros', 'viagens' ou 'ocorrencias'."
+        )
+
+    result = _CONSULTAS_RANKING_LINHAS[metrica].executar(
+        db, {"data_inicio": data_inicio, "data_fim": data_fim, "limit": limit}
     ).all()
     return result
 
 
-def get_contagem_linhas_por_concessionaria(db: Session):
+# Ranking no período e na janela de comparação em uma única varredura (agregação condicional)
+_CONSULTAS_RANKING_LINHAS_COMPARATIVO = {
+    metrica: Consulta(
+        f"ranking_linhas_comparativo_{metrica}",
+        f"""
+        WITH metricas AS (
+            SELECT
+                agg.id_linha,
+                SUM(agg.total_{metrica}) FILTER (WHERE agg.data BETWEEN :data_inicio AND :data_fim) AS valor,
+                SUM(agg.total_{metrica}) FILTER (WHERE agg.data BETWEEN :inicio_anterior AND :fim_anterior)
+                    AS valor_anterior
+            FROM
+                agg_metricas_linhas_diarias agg
+            WHERE
+                agg.data BETWEEN :data_inicio AND :data_fim
+                OR agg.data BETWEEN :inicio_anterior AND :fim_anterior
+            GROUP BY
+                agg.id_linha
+        ),
+        posicoes AS (
+            SELECT
+                *,
+                RANK() OVER (ORDER BY valor DESC NULLS LAST) AS posicao,
+                CASE WHEN valor_anterior IS NOT NULL
+                    THEN RANK() OVER (ORDER BY valor_anterior DESC NULLS LAST)
+                END AS posicao_anterior
+            FROM metricas
+        )
+        SELECT
+            l.id_linha AS id,
+            l.cod_linha AS codigo,
+            l.nome_linha AS nome,
+            p.valor,
+            p.valor_anterior,
+            p.valor - COALESCE(p.valor_anterior, 0) AS variacao,
+            (p.valor - p.valor_anterior) * 100.0 / NULLIF(p.valor_anterior, 0) AS variacao_percentual,
+            p.posicao,
+            p.posicao_anterior,
+            p.posicao_anterior - p.posicao AS variacao_posicao
+        FROM
+            posicoes p
+        JOIN
+            dim_linha l ON p.id_linha = l.id_linha
+        WHERE
+            p.valor IS NOT NULL
+        ORDER BY
+            p.valor DESC
+        LIMIT :limit;
+    """,
+    )
+    for metrica in ("passageiros", "viagens", "ocorrencias")
+}
+
+
+@cache_swr
+@coalescer
+def get_ranking_linhas_comparativo(
+    db: Session,
+    metrica: str,
+    data_inicio: date,
+    data_fim: date,
+    limit: int,
+    inicio_anterior: date,
+    fim_anterior: date,
+):
     """
-    Conta o número de linhas distintas operadas por cada concessionária.
+    Ranking de linhas no período com o valor, a posição e as variações em relação
+    à janela de comparação (inicio_anterior, fim_anterior). Uma variacao_posicao
+    positiva indica que a linha subiu no ranking.
     """
-    query = text(
-        """
+    if metrica not in _CONSULTAS_RANKING_LINHAS_COMPARATIVO:
+        raise ValueError(
+            "Métrica inválida. Use 'passageiros', 'viagens' ou 'ocorrencias'."
+        )
+
+    return _CONSULTAS_RANKING_LINHAS_COMPARATIVO[metrica].executar(
+        db,
+        {
+            "data_inicio": data_inicio,
+            "data_fim": data_fim,
+            "inicio_anterior": inicio_anterior,
+            "fim_anterior": fim_anterior,
+            "limit": limit,
+        },
+    ).all()
+
+
+_CONSULTA_CONTAGEM_LINHAS_POR_CONCESSIONARIA = Consulta("contagem_linhas_por_concessionaria", """
         SELECT
             c.id_concessionaria AS id,
             c.nome_concessionaria AS nome,
@@ -74,17 +169,17 @@ def get_contagem_linhas_por_concessionaria(db: Session):
             c.id_concessionaria, c.nome_concessionaria
         ORDER BY
             quantidade_linhas DESC;
-    """
-    )
-    return db.execute(query).all()
+    """)
 
 
-def get_contagem_linhas_por_empresa(db: Session):
+def get_contagem_linhas_por_concessionaria(db: Session):
     """
-    Conta o número de linhas distintas operadas por cada empresa.
+    Conta o número de linhas distintas operadas por cada concessionária.
     """
-    query = text(
-        """
+    return _CONSULTA_CONTAGEM_LINHAS_POR_CONCESSIONARIA.executar(db).all()
+
+
+_CONSULTA_CONTAGEM_LINHAS_POR_EMPRESA = Consulta("contagem_linhas_por_empresa", """
         SELECT
             e.id_empresa AS id,
             e.nome_empresa AS nome,
@@ -98,18 +193,17 @@ def get_contagem_linhas_por_empresa(db: Session):
             e.id_empresa, e.nome_empresa
         ORDER BY
             quantidade_linhas DESC;
-    """
-    )
-    return db.execute(query).all()
+    """)
 
 
-def get_contagem_pontos_por_linha(db: Session, limit: int):
+def get_contagem_linhas_por_empresa(db: Session):
     """
-    Conta o número de pontos de parada distintos para cada linha,
-    considerando apenas o mês de referência mais recente.
+    Conta o número de linhas distintas operadas por cada empresa.
     """
-    query = text(
-        """
+    return _CONSULTA_CONTAGEM_LINHAS_POR_EMPRESA.executar(db).all()
+
+
+_CONSULTA_CONTAGEM_PONTOS_POR_LINHA = Consulta("contagem_pontos_por_linha", """
         WITH ultimo_periodo AS (
             SELECT
                 MAX(ano_referencia) AS ano,
@@ -135,17 +229,18 @@ def get_contagem_pontos_por_linha(db: Session, limit: int):
         ORDER BY
             valor DESC
         LIMIT :limit;
-    """
-    )
-    return db.execute(query, {"limit": limit}).all()
+    """)
 
 
-def get_contagem_linhas_por_bairro(db: Session, limit: int):
+def get_contagem_pontos_por_linha(db: Session, limit: int):
     """
-    Conta o número de linhas que passam em cada bairro.
+    Conta o número de pontos de parada distintos para cada linha,
+    considerando apenas o mês de referência mais recente.
     """
-    query = text(
-        """
+    return _CONSULTA_CONTAGEM_PONTOS_POR_LINHA.executar(db, {"limit": limit}).all()
+
+
+_CONSULTA_CONTAGEM_LINHAS_POR_BAIRRO = Consulta("contagem_linhas_por_bairro", """
         SELECT
             b.id_bairro AS id,
             b.nome_bairro AS nome,
@@ -159,9 +254,38 @@ def get_contagem_linhas_por_bairro(db: Session, limit: int):
         ORDER BY
             valor DESC
         LIMIT :limit;
+    """)
+
+
+def get_contagem_linhas_por_bairro(db: Session, limit: int):
     """
-    )
-    return db.execute(query, {"limit": limit}).all()
+    Conta o número de linhas que passam em cada bairro.
+    """
+    return _CONSULTA_CONTAGEM_LINHAS_POR_BAIRRO.executar(db, {"limit": limit}).all()
+
+
+_CONSULTA_GEOMETRIA_LINHA = Consulta("geometria_linha", """
+        WITH ultimo_periodo AS (
+            SELECT
+                MAX(ano_referencia) AS ano,
+                MAX(mes_referencia) AS mes
+            FROM
+                staging_pontos_onibus_bh
+            WHERE
+                ano_referencia = (SELECT MAX(ano_referencia) FROM staging_pontos_onibus_bh)
+        )
+        SELECT
+            ST_X(p.geom) AS longitude,
+            ST_Y(p.geom) AS latitude
+        FROM
+            staging_pontos_onibus_bh p
+        JOIN
+            ultimo_periodo up ON p.ano_referencia = up.ano AND p.mes_referencia = up.mes
+        WHERE
+            p.cod_linha = :cod_linha
+        ORDER BY
+            p.id_ponto_onibus_linha;
+    """)
 
 
 def get_geometria_linha(db: Session, cod_linha: str):
@@ -171,8 +295,11 @@ def get_geometria_linha(db: Session, cod_linha: str):
     A ordenação é feita pelo ID sequencial da tabela de origem,
     que é a melhor aproximação disponível para a sequência da rota.
     """
-    query = text(
-        """
+    result = _CONSULTA_GEOMETRIA_LINHA.executar(db, {"cod_linha": cod_linha}).all()
+    return [[row.longitude, row.latitude] for row in result]
+
+
+_CONSULTA_COORDENADAS_TODAS_LINHAS = Consulta("coordenadas_todas_linhas", """
         WITH ultimo_periodo AS (
             SELECT
                 MAX(ano_referencia) AS ano,
@@ -183,6 +310,7 @@ def get_geometria_linha(db: Session, cod_linha: str):
                 ano_referencia = (SELECT MAX(ano_referencia) FROM staging_pontos_onibus_bh)
         )
         SELECT
+            p.cod_linha,
             ST_X(p.geom) AS longitude,
             ST_Y(p.geom) AS latitude
         FROM
@@ -190,21 +318,21 @@ def get_geometria_linha(db: Session, cod_linha: str):
         JOIN
             ultimo_periodo up ON p.ano_referencia = up.ano AND p.mes_referencia = up.mes
         WHERE
-            p.cod_linha = :cod_linha
+            p.geom IS NOT NULL
         ORDER BY
-            p.id_ponto_onibus_linha;
-    """
-    )
-    result = db.execute(query, {"cod_linha": cod_linha}).all()
-    return [[row.longitude, row.latitude] for row in result]
+            p.cod_linha, p.id_ponto_onibus_linha;
+    """)
 
 
-def get_pontos_geometria_linha(db: Session, cod_linha: str):
+def get_coordenadas_todas_as_linhas(db: Session):
     """
-    Busca as coordenadas e os identificadores dos pontos de uma linha,
-    considerando apenas o mês de referência mais recente.
+    Busca, em uma única consulta, as coordenadas ordenadas dos pontos de todas as
+    linhas no mês de referência mais recente (mesma ordem de get_geometria_linha).
     """
-    query = text("""
+    return _CONSULTA_COORDENADAS_TODAS_LINHAS.executar(db).all()
+
+
+_CONSULTA_PONTOS_GEOMETRIA_LINHA = Consulta("pontos_geometria_linha", """
         WITH ultimo_periodo AS (
             SELECT
                 MAX(ano_referencia) AS ano,
@@ -225,16 +353,17 @@ def get_pontos_geometria_linha(db: Session, cod_linha: str):
         WHERE
             p.cod_linha = :cod_linha AND p.geom IS NOT NULL;
     """)
-    return db.execute(query, {"cod_linha": cod_linha}).all()
 
 
-def get_dashboard_linha(db: Session, id_linha_req: int, data_inicio: date, data_fim: date):
+def get_pontos_geometria_linha(db: Session, cod_linha: str):
     """
-    Busca todos os dados agregados, incluindo geometrias de pontos e bairros,
-    para o dashboard de uma linha específica.
-    [VERSÃO FINAL COM MAPA COMPLETO]
+    Busca as coordenadas e os identificadores dos pontos de uma linha,
+    considerando apenas o mês de referência mais recente.
     """
-    query = text("""
+    return _CONSULTA_PONTOS_GEOMETRIA_LINHA.executar(db, {"cod_linha": cod_linha}).all()
+
+
+_CONSULTA_DASHBOARD_LINHA = Consulta("dashboard_linha", """
     WITH
     -- CTEs 1 a 8 (as mesmas que já tínhamos)
     entidade_principal AS (
@@ -322,5 +451,18 @@ def get_dashboard_linha(db: Session, id_linha_req: int, data_inicio: date, data_
       -- [NOVA COLUNA] Agrega todas as features dos bairros em uma única FeatureCollection GeoJSON
       (SELECT json_build_object('type', 'FeatureCollection', 'features', COALESCE(json_agg(gb.feature), '[]'::json)) FROM geometrias_bairros gb) as mapa_bairros;
     """)
-    result = db.execute(query, {"id_linha": id_linha_req, "data_inicio": data_inicio, "data_fim": data_fim}).fetchone()
+
+
+@cache_swr
+@coalescer
+@snapshot_mensal("linha")
+def get_dashboard_linha(db: Session, id_linha_req: int, data_inicio: date, data_fim: date):
+    """
+    Busca todos os dados agregados, incluindo geometrias de pontos e bairros,
+    para o dashboard de uma linha específica.
+    [VERSÃO FINAL COM MAPA COMPLETO]
+    """
+    result = _CONSULTA_DASHBOARD_LINHA.executar(
+        db, {"id_linha": id_linha_req, "data_inicio": data_inicio, "data_fim": data_fim}
+    ).fetchone()
     return result
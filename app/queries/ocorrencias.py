@@ -1,13 +1,56 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 from datetime import date
 
+from app.cache import cache_swr
+from app.catalogo import Consulta
+from app.singleflight import coalescer
 
-def get_ranking_ocorrencias_por_justificativa(db: Session, data_inicio: date, data_fim: date, limit: int):
-    """
-    Retorna o ranking de ocorrências por justificativa.
-    """
-    query = text("""
+
+# Modo aproximado: as análises rodam sobre a amostra estratificada (dia x linha) de
+# fact_viagens (app.manutencao.amostra). O total de cada grupo é estimado expandindo a
+# soma amostral de cada estrato h por N_h/n_h, com variância
+# Σ N_h² (1 - n_h/N_h) s_h² / n_h; o intervalo é de 95% (aproximação normal).
+_Z_CONFIANCA = 1.96
+
+
+def _estimativas_amostrais(grupo: str, valor: str) -> str:
+    """ CTEs 'por_estrato' e 'estimativas' (grupo, estimativa, variancia) para uma consulta aproximada. """
+    return f"""
+        por_estrato AS (
+            SELECT
+                a.id_data,
+                a.id_linha,
+                {grupo} AS grupo,
+                SUM({valor}) AS soma,
+                SUM(({valor}) * ({valor})) AS soma_quadrados
+            FROM amostra_fact_viagens a
+            JOIN dim_data d ON a.id_data = d.id_data
+            WHERE d.data_completa BETWEEN :data_inicio AND :data_fim
+            GROUP BY a.id_data, a.id_linha, {grupo}
+        ),
+        estimativas AS (
+            SELECT
+                p.grupo,
+                SUM(e.total_viagens::FLOAT / e.total_amostra * p.soma) AS estimativa,
+                GREATEST(SUM(
+                    e.total_viagens::FLOAT * e.total_viagens * (1 - e.total_amostra::FLOAT / e.total_viagens)
+                    / e.total_amostra
+                    * COALESCE((p.soma_quadrados - p.soma::FLOAT * p.soma / e.total_amostra)
+                               / NULLIF(e.total_amostra - 1, 0), 0)
+                ), 0) AS variancia
+            FROM por_estrato p
+            JOIN amostra_estratos e ON p.id_data = e.id_data AND p.id_linha = e.id_linha
+            GROUP BY p.grupo
+        )"""
+
+
+def _intervalo(coluna: str) -> str:
+    return f"""ROUND(es.estimativa)::BIGINT as {coluna},
+            GREATEST(ROUND(es.estimativa - {_Z_CONFIANCA} * SQRT(es.variancia)), 0)::BIGINT as intervalo_inferior,
+            ROUND(es.estimativa + {_Z_CONFIANCA} * SQRT(es.variancia))::BIGINT as intervalo_superior"""
+
+
+_CONSULTA_RANKING_OCORRENCIAS_POR_JUSTIFICATIVA = Consulta("ranking_ocorrencias_por_justificativa", """
         SELECT
             j.id_justificativa as id,
             j.nome_justificativa as nome,
@@ -20,23 +63,48 @@ def get_ranking_ocorrencias_por_justificativa(db: Session, data_inicio: date, da
         ORDER BY total_ocorrencias DESC
         LIMIT :limit;
     """)
-    return db.execute(query, {"data_inicio": data_inicio, "data_fim": data_fim, "limit": limit}).all()
 
 
-def get_ranking_ocorrencias_por_entidade(db: Session, entidade: str, data_inicio: date, data_fim: date, limit: int):
+_CONSULTA_RANKING_OCORRENCIAS_POR_JUSTIFICATIVA_APROXIMADO = Consulta(
+    "ranking_ocorrencias_por_justificativa_aproximado", f"""
+        WITH {_estimativas_amostrais("a.id_justificativa", "1")}
+        SELECT
+            j.id_justificativa as id,
+            j.nome_justificativa as nome,
+            {_intervalo("total_ocorrencias")}
+        FROM estimativas es
+        JOIN dim_justificativa j ON es.grupo = j.id_justificativa
+        ORDER BY total_ocorrencias DESC
+        LIMIT :limit;
+    """)
+
+
+@cache_swr
+@coalescer
+def get_ranking_ocorrencias_por_justificativa(
+    db: Session, data_inicio: date, data_fim: date, limit: int, aproximado: bool = False
+):
     """
-    Função genérica para retornar o ranking de ocorrências por empresa, concessionária ou linha.
+    Retorna o ranking de ocorrências por justificativa. Com aproximado=True, estima
+    os totais a partir da amostra estratificada e inclui o intervalo de confiança.
     """
-    if entidade not in ['empresa', 'concessionaria', 'linha']:
-        raise ValueError("Entidade inválida. Use 'empresa', 'concessionaria' ou 'linha'.")
+    consulta = (
+        _CONSULTA_RANKING_OCORRENCIAS_POR_JUSTIFICATIVA_APROXIMADO if aproximado
+        else _CONSULTA_RANKING_OCORRENCIAS_POR_JUSTIFICATIVA
+    )
+    return consulta.executar(
+        db, {"data_inicio": data_inicio, "data_fim": data_fim, "limit": limit}
+    ).all()
 
+
+def _consulta_ranking_por_entidade(entidade: str):
     dim_tabela = f"dim_{entidade}"
     id_coluna = f"id_{entidade}"
     nome_coluna = f"nome_{entidade}"
     if entidade == 'linha':
         nome_coluna = 'cod_linha'  # Usamos o código da linha como nome no ranking
 
-    query = text(f"""
+    return Consulta(f"ranking_ocorrencias_por_{entidade}", f"""
         SELECT
             dim.{id_coluna} as id,
             dim.{nome_coluna} as nome,
@@ -48,14 +116,29 @@ def get_ranking_ocorrencias_por_entidade(db: Session, entidade: str, data_inicio
         ORDER BY total_ocorrencias DESC
         LIMIT :limit;
     """)
-    return db.execute(query, {"data_inicio": data_inicio, "data_fim": data_fim, "limit": limit}).all()
 
 
-def get_tendencia_temporal_ocorrencias(db: Session, data_inicio: date, data_fim: date):
+# Uma variante da consulta por entidade, compiladas uma única vez
+_CONSULTAS_RANKING_POR_ENTIDADE = {
+    entidade: _consulta_ranking_por_entidade(entidade) for entidade in ('empresa', 'concessionaria', 'linha')
+}
+
+
+@cache_swr
+@coalescer
+def get_ranking_ocorrencias_por_entidade(db: Session, entidade: str, data_inicio: date, data_fim: date, limit: int):
     """
-    Retorna a contagem de ocorrências agregada por mês.
+    Função genérica para retornar o ranking de ocorrências por empresa, concessionária ou linha.
     """
-    query = text("""
+    if entidade not in _CONSULTAS_RANKING_POR_ENTIDADE:
+        raise ValueError("Entidade inválida. Use 'empresa', 'concessionaria' ou 'linha'.")
+
+    return _CONSULTAS_RANKING_POR_ENTIDADE[entidade].executar(
+        db, {"data_inicio": data_inicio, "data_fim": data_fim, "limit": limit}
+    ).all()
+
+
+_CONSULTA_TENDENCIA_TEMPORAL_OCORRENCIAS = Consulta("tendencia_temporal_ocorrencias", """
         SELECT
             date_trunc('month', data)::date as periodo,
             SUM(total_ocorrencias) as total_ocorrencias
@@ -64,14 +147,18 @@ def get_tendencia_temporal_ocorrencias(db: Session, data_inicio: date, data_fim:
         GROUP BY periodo
         ORDER BY periodo;
     """)
-    return db.execute(query, {"data_inicio": data_inicio, "data_fim": data_fim}).all()
 
 
-def get_ocorrencias_por_tipo_dia(db: Session, data_inicio: date, data_fim: date):
+def get_tendencia_temporal_ocorrencias(db: Session, data_inicio: date, data_fim: date):
     """
-    Retorna a contagem de ocorrências por tipo de dia (útil, sábado, domingo/feriado).
+    Retorna a contagem de ocorrências agregada por mês.
     """
-    query = text("""
+    return _CONSULTA_TENDENCIA_TEMPORAL_OCORRENCIAS.executar(
+        db, {"data_inicio": data_inicio, "data_fim": data_fim}
+    ).all()
+
+
+_CONSULTA_OCORRENCIAS_POR_TIPO_DIA = Consulta("ocorrencias_por_tipo_dia", """
         SELECT
             d.tipo_dia,
             SUM(f.flag_possui_ocorrencia) as total_ocorrencias
@@ -81,14 +168,28 @@ def get_ocorrencias_por_tipo_dia(db: Session, data_inicio: date, data_fim: date)
         GROUP BY d.tipo_dia
         ORDER BY total_ocorrencias DESC;
     """)
-    return db.execute(query, {"data_inicio": data_inicio, "data_fim": data_fim}).all()
 
 
-def get_dashboard_justificativa(db: Session, id_justificativa_req: int, data_inicio: date, data_fim: date):
+_CONSULTA_OCORRENCIAS_POR_TIPO_DIA_APROXIMADO = Consulta("ocorrencias_por_tipo_dia_aproximado", f"""
+        WITH {_estimativas_amostrais("d.tipo_dia", "a.flag_possui_ocorrencia")}
+        SELECT
+            es.grupo as tipo_dia,
+            {_intervalo("total_ocorrencias")}
+        FROM estimativas es
+        ORDER BY total_ocorrencias DESC;
+    """)
+
+
+def get_ocorrencias_por_tipo_dia(db: Session, data_inicio: date, data_fim: date, aproximado: bool = False):
     """
-    Busca todos os dados agregados para o dashboard de uma justificativa de ocorrência específica.
+    Retorna a contagem de ocorrências por tipo de dia (útil, sábado, domingo/feriado).
+    Com aproximado=True, estima a partir da amostra estratificada, com intervalo de confiança.
     """
-    query = text("""
+    consulta = _CONSULTA_OCORRENCIAS_POR_TIPO_DIA_APROXIMADO if aproximado else _CONSULTA_OCORRENCIAS_POR_TIPO_DIA
+    return consulta.executar(db, {"data_inicio": data_inicio, "data_fim": data_fim}).all()
+
+
+_CONSULTA_DASHBOARD_JUSTIFICATIVA = Consulta("dashboard_justificativa", """
     WITH
     -- CTE 1: Filtra as viagens que tiveram a ocorrência específica no período
     viagens_com_ocorrencia AS (
@@ -150,8 +251,16 @@ def get_dashboard_justificativa(db: Session, id_justificativa_req: int, data_ini
         (SELECT json_agg(ods) FROM ocorrencias_dia_semana ods) as grafico_media_ocorrencias_dia_semana,
         (SELECT id FROM linhas_afetadas LIMIT 1) as id_linha_mais_afetada;
     """)
-    result = db.execute(
-        query,
+
+
+@cache_swr
+@coalescer
+def get_dashboard_justificativa(db: Session, id_justificativa_req: int, data_inicio: date, data_fim: date):
+    """
+    Busca todos os dados agregados para o dashboard de uma justificativa de ocorrência específica.
+    """
+    result = _CONSULTA_DASHBOARD_JUSTIFICATIVA.executar(
+        db,
         {
             "id_justificativa": id_justificativa_req,
             "data_inicio": data_inicio,
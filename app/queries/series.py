@@ -0,0 +1,85 @@
+from sqlalchemy.orm import Session
+from datetime import date
+from typing import Optional
+
+from app.cache import cache_swr
+from app.catalogo import Consulta
+from app.singleflight import coalescer
+
+# Coluna somada de cada métrica nas tabelas agregadas diárias
+COLUNAS_METRICAS = {
+    "passageiros": "total_passageiros",
+    "viagens": "total_viagens",
+    "ocorrencias": "total_ocorrencias",
+    "km_percorrido": "total_extensao_km",
+}
+
+# Tabela agregada usada por entidade; sem entidade, a série é da cidade inteira
+TABELAS_ENTIDADES = {
+    None: "agg_metricas_linhas_diarias",
+    "linha": "agg_metricas_linhas_diarias",
+    "empresa": "agg_metricas_linhas_diarias",
+    "concessionaria": "agg_metricas_linhas_diarias",
+    "veiculo": "agg_metricas_veiculos_diarias",
+}
+
+# Granularidades aceitas e o campo correspondente do date_trunc
+GRANULARIDADES = {"dia": "day", "semana": "week", "mes": "month", "ano": "year"}
+
+
+def _consulta_serie(metrica: str, entidade: Optional[str]):
+    filtro_entidade = f"AND agg.id_{entidade} = :id_entidade" if entidade else ""
+    return Consulta(f"serie_{metrica}_{entidade or 'geral'}", f"""
+        SELECT
+            date_trunc(:granularidade, agg.data::timestamp)::date AS periodo,
+            COALESCE(SUM(agg.{COLUNAS_METRICAS[metrica]}), 0) AS valor
+        FROM {TABELAS_ENTIDADES[entidade]} agg
+        WHERE agg.data BETWEEN :data_inicio AND :data_fim
+            {filtro_entidade}
+        GROUP BY periodo
+        ORDER BY periodo;
+    """)
+
+
+# Uma variante por métrica e entidade; a granularidade é parâmetro do date_trunc
+_CONSULTAS_SERIES = {
+    (metrica, entidade): _consulta_serie(metrica, entidade)
+    for metrica in COLUNAS_METRICAS
+    for entidade in TABELAS_ENTIDADES
+}
+
+
+@cache_swr
+@coalescer
+def get_serie_temporal(
+    db: Session,
+    metrica: str,
+    granularidade: str,
+    data_inicio: date,
+    data_fim: date,
+    entidade: Optional[str] = None,
+    id_entidade: Optional[int] = None,
+):
+    """
+    Retorna a série temporal de uma métrica (passageiros, viagens, ocorrências ou km
+    percorrido) agrupada por dia, semana, mês ou ano, para a cidade inteira ou para
+    uma linha, empresa, concessionária ou veículo, a partir das tabelas agregadas.
+    """
+    if metrica not in COLUNAS_METRICAS:
+        raise ValueError(f"Métrica inválida. Use: {', '.join(COLUNAS_METRICAS)}.")
+    if entidade not in TABELAS_ENTIDADES:
+        raise ValueError("Entidade inválida. Use 'linha', 'empresa', 'concessionaria' ou 'veiculo'.")
+    if granularidade not in GRANULARIDADES:
+        raise ValueError(f"Granularidade inválida. Use: {', '.join(GRANULARIDADES)}.")
+    if (entidade is None) != (id_entidade is None):
+        raise ValueError("Informe 'entidade' e 'id_entidade' juntos.")
+
+    return _CONSULTAS_SERIES[(metrica, entidade)].executar(
+        db,
+        {
+            "granularidade": GRANULARIDADES[granularidade],
+            "data_inicio": data_inicio,
+            "data_fim": data_fim,
+            "id_entidade": id_entidade,
+        },
+    ).all()
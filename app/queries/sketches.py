@@ -0,0 +1,37 @@
+import threading
+
+from sqlalchemy.orm import Session
+
+from app.cache import versao_dados
+from app.catalogo import Consulta
+
+# Tabelas de sketches HyperLogLog, criadas e preenchidas por
+# python -m app.manutencao.agregados --criar-sketches
+TABELAS_SKETCHES = ("agg_hll_empresas_diarias", "agg_hll_concessionarias_diarias", "agg_hll_bairros_diarias")
+
+_CONSULTA_SKETCHES_DISPONIVEIS = Consulta("sketches_hll_disponiveis", f"""
+        SELECT
+            EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'hll')
+            AND {" AND ".join(f"to_regclass('{tabela}') IS NOT NULL" for tabela in TABELAS_SKETCHES)};
+    """)
+
+_disponiveis = {"versao": None, "valor": False}
+_trava = threading.Lock()
+
+
+def sketches_disponiveis(db: Session) -> bool:
+    """
+    Indica se a extensão hll e as tabelas de sketches existem no banco. As consultas
+    com exato=False usam o caminho exato quando não existem. O resultado é
+    reaproveitado enquanto a versão dos dados não muda.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    versao = versao_dados(db)
+    with _trava:
+        if _disponiveis["versao"] == versao:
+            return _disponiveis["valor"]
+    valor = bool(_CONSULTA_SKETCHES_DISPONIVEIS.executar(db).scalar())
+    with _trava:
+        _disponiveis.update(versao=versao, valor=valor)
+    return valor
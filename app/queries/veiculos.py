@@ -1,30 +1,48 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import text
 from datetime import date
+from typing import Optional
 
+from app.cache import cache_swr
+from app.catalogo import Consulta
+from app.singleflight import coalescer
+from app.snapshots import snapshot_mensal
 
-def get_todos_os_veiculos(db: Session):
-    """ Busca todos os veículos para popular filtros. """
-    query = text("""
+
+def _consulta_veiculos(nome: str, filtro_cursor: str):
+    return Consulta(nome, f"""
         SELECT id_veiculo, identificador_veiculo
         FROM dim_veiculo
-        ORDER BY identificador_veiculo;
+        {filtro_cursor}
+        ORDER BY identificador_veiculo, id_veiculo
+        LIMIT :limite;
     """)
-    return db.execute(query).all()
 
 
-def get_ranking_veiculos(db: Session, metrica: str, data_inicio: date, data_fim: date, limit: int):
+_CONSULTA_VEICULOS = _consulta_veiculos("todos_os_veiculos", "")
+_CONSULTA_VEICULOS_APOS_CURSOR = _consulta_veiculos(
+    "todos_os_veiculos_apos_cursor", "WHERE (identificador_veiculo, id_veiculo) > (:cursor_valor, :cursor_id)"
+)
+
+
+def get_todos_os_veiculos(db: Session, limite: Optional[int] = None, cursor: Optional[tuple] = None):
     """
-    Retorna rankings de veículos por passageiros, ocorrências ou km percorrido.
+    Busca todos os veículos para popular filtros.
+    Paginação por keyset: o cursor é o par (identificador_veiculo, id_veiculo) da última
+    linha, e a busca avança pelo índice em vez de usar OFFSET.
     """
-    if metrica not in ['passageiros', 'ocorrencias', 'km_percorrido']:
-        raise ValueError("Métrica inválida.")
+    parametros = {"limite": limite}
+    if cursor:
+        parametros["cursor_valor"], parametros["cursor_id"] = cursor
+        return _CONSULTA_VEICULOS_APOS_CURSOR.executar(db, parametros).all()
+    return _CONSULTA_VEICULOS.executar(db, parametros).all()
 
+
+def _consulta_ranking_veiculos(metrica: str):
     coluna_soma = f"total_{metrica}"
     if metrica == 'km_percorrido':
         coluna_soma = 'total_extensao_km'
 
-    query = text(f"""
+    return Consulta(f"ranking_veiculos_{metrica}", f"""
         SELECT
             dv.id_veiculo,
             dv.identificador_veiculo,
@@ -40,12 +58,29 @@ def get_ranking_veiculos(db: Session, metrica: str, data_inicio: date, data_fim:
         ORDER BY valor DESC
         LIMIT :limit;
     """)
-    return db.execute(query, {"data_inicio": data_inicio, "data_fim": data_fim, "limit": limit}).all()
 
 
-def get_dashboard_veiculo(db: Session, id_veiculo_req: int, data_inicio: date, data_fim: date):
-    """ Busca todos os dados para o dashboard de um veículo específico. """
-    query = text("""
+# Uma variante da consulta por métrica, compiladas uma única vez
+_CONSULTAS_RANKING_VEICULOS = {
+    metrica: _consulta_ranking_veiculos(metrica) for metrica in ('passageiros', 'ocorrencias', 'km_percorrido')
+}
+
+
+@cache_swr
+@coalescer
+def get_ranking_veiculos(db: Session, metrica: str, data_inicio: date, data_fim: date, limit: int):
+    """
+    Retorna rankings de veículos por passageiros, ocorrências ou km percorrido.
+    """
+    if metrica not in _CONSULTAS_RANKING_VEICULOS:
+        raise ValueError("Métrica inválida.")
+
+    return _CONSULTAS_RANKING_VEICULOS[metrica].executar(
+        db, {"data_inicio": data_inicio, "data_fim": data_fim, "limit": limit}
+    ).all()
+
+
+_CONSULTA_DASHBOARD_VEICULO = Consulta("dashboard_veiculo", """
     WITH
     metricas_base AS (
         SELECT
@@ -98,4 +133,13 @@ def get_dashboard_veiculo(db: Session, id_veiculo_req: int, data_inicio: date, d
     FROM dim_veiculo dv
     WHERE dv.id_veiculo = :id_veiculo;
     """)
-    return db.execute(query, {"id_veiculo": id_veiculo_req, "data_inicio": data_inicio, "data_fim": data_fim}).fetchone()
+
+
+@cache_swr
+@coalescer
+@snapshot_mensal("veiculo")
+def get_dashboard_veiculo(db: Session, id_veiculo_req: int, data_inicio: date, data_fim: date):
+    """ Busca todos os dados para o dashboard de um veículo específico. """
+    return _CONSULTA_DASHBOARD_VEICULO.executar(
+        db, {"id_veiculo": id_veiculo_req, "data_inicio": data_inicio, "data_fim": data_fim}
+    ).fetchone()
@@ -0,0 +1,44 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+
+def get_versao_dados(db: Session):
+    """
+    Retorna os marcadores que identificam a versão atual dos dados: a última
+    data carregada em fact_viagens e o último período de referência dos pontos.
+    Ambos mudam a cada carga do ETL e são lidos por índice (MAX), sem varrer as tabelas.
+    """
+    query = text(
+        """
+        SELECT
+            (SELECT MAX(id_data) FROM fact_viagens) AS ultima_data,
+            (SELECT MAX(ano_referencia) FROM staging_pontos_onibus_bh) AS ano_pontos,
+            (SELECT MAX(mes_referencia) FROM staging_pontos_onibus_bh
+             WHERE ano_referencia = (SELECT MAX(ano_referencia) FROM staging_pontos_onibus_bh)) AS mes_pontos;
+    """
+    )
+    return db.execute(query).fetchone()
+
+
+def get_ultima_data_carregada(db: Session):
+    """ Retorna a data (dim_data.data_completa) da viagem mais recente carregada. """
+    query = text(
+        """
+        SELECT d.data_completa
+        FROM dim_data d
+        WHERE d.id_data = (SELECT MAX(id_data) FROM fact_viagens);
+    """
+    )
+    return db.execute(query).scalar()
+
+
+def get_primeira_data_carregada(db: Session):
+    """ Retorna a data (dim_data.data_completa) da viagem mais antiga carregada. """
+    query = text(
+        """
+        SELECT d.data_completa
+        FROM dim_data d
+        WHERE d.id_data = (SELECT MIN(id_data) FROM fact_viagens);
+    """
+    )
+    return db.execute(query).scalar()
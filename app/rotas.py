@@ -0,0 +1,147 @@
+import json
+import logging
+import threading
+import time
+from enum import Enum
+from itertools import groupby
+
+import numpy as np
+import shapely
+
+from app.cache import ao_mudar_versao, versao_dados
+from app.compressao import RespostaPreComprimida
+from app.database import sessao_leitura
+from app.espacial import escala_metrica
+from app.memoria_compartilhada import segmento
+from app.queries.linhas import get_coordenadas_todas_as_linhas
+
+logger = logging.getLogger(__name__)
+
+
+class NivelSimplificacao(str, Enum):
+    completo = "completo"
+    detalhado = "detalhado"
+    medio = "medio"
+    simples = "simples"
+
+
+# Tolerância de Douglas-Peucker, em metros, de cada nível
+TOLERANCIAS_METROS = {
+    NivelSimplificacao.completo: 0,
+    NivelSimplificacao.detalhado: 10,
+    NivelSimplificacao.medio: 50,
+    NivelSimplificacao.simples: 150,
+}
+
+# Casas decimais das coordenadas no GeoJSON (~0,1 m), para não inflar o corpo
+_CASAS_DECIMAIS = 6
+
+
+def _montar_rotas(linhas, versao: str):
+    """
+    Monta, para cada linha e nível, a Feature LineString da rota já serializada e
+    comprimida. A simplificação é feita em metros (escala_metrica) e preserva a
+    topologia da linha.
+    """
+    if not linhas:
+        return {}
+    escala = escala_metrica(float(np.mean([c[1] for pontos in linhas.values() for c in pontos])))
+
+    rotas = {}
+    for cod_linha, pontos in linhas.items():
+        if len(pontos) < 2:
+            continue
+        rota = shapely.linestrings(np.array(pontos) * escala)
+        for nivel, tolerancia in TOLERANCIAS_METROS.items():
+            simplificada = shapely.simplify(rota, tolerancia) if tolerancia else rota
+            coordenadas = np.round(shapely.get_coordinates(simplificada) / escala, _CASAS_DECIMAIS)
+            feature = {
+                "type": "Feature",
+                "geometry": {"type": "LineString", "coordinates": coordenadas.tolist()},
+                "properties": {
+                    "cod_linha": cod_linha,
+                    "nivel": nivel.value,
+                    "total_pontos": len(pontos),
+                    "total_vertices": len(coordenadas),
+                    "extensao_km": round(shapely.length(rota) / 1000, 2),
+                },
+            }
+            corpo = json.dumps(feature, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            rotas[(cod_linha, nivel)] = RespostaPreComprimida(versao, corpo)
+    return rotas
+
+
+_rotas = {"versao": None, "respostas": {}}
+_trava_construcao = threading.Lock()
+
+# Separador entre a linha, o nível e a variante nas chaves do segmento compartilhado
+_SEPARADOR = "\t"
+
+
+def _itens_rotas(db, versao: str):
+    linhas = {
+        cod_linha: [(c.longitude, c.latitude) for c in coordenadas]
+        for cod_linha, coordenadas in groupby(get_coordenadas_todas_as_linhas(db), key=lambda c: c.cod_linha)
+    }
+    itens = {}
+    for (cod_linha, nivel), resposta in _montar_rotas(linhas, versao).items():
+        itens.update(resposta.itens(f"{cod_linha}{_SEPARADOR}{nivel.value}{_SEPARADOR}"))
+    return itens
+
+
+def construir_rotas(db, versao: str):
+    """
+    Pré-calcula as rotas de todas as linhas para a versão dos dados, se ainda não
+    calculadas. As respostas ficam em um segmento de memória compartilhada: só o
+    primeiro worker a chegar calcula, os demais mapeiam o mesmo segmento.
+    """
+    with _trava_construcao:
+        if _rotas["versao"] == versao:
+            return
+        inicio = time.monotonic()
+        rotas = segmento("rotas", versao, lambda: _itens_rotas(db, versao))
+        respostas = {}
+        for chave in rotas.chaves():
+            cod_linha, nivel, variante = chave.split(_SEPARADOR)
+            if variante == "etag":
+                respostas[(cod_linha, NivelSimplificacao(nivel))] = RespostaPreComprimida.do_segmento(
+                    rotas, chave[:-len(variante)]
+                )
+        _rotas.update(versao=versao, respostas=respostas)
+        logger.info(
+            "Rotas: %d linhas disponíveis em %.1fs",
+            len({cod_linha for cod_linha, _ in respostas}), time.monotonic() - inicio,
+        )
+
+
+def rota_da_linha(db, cod_linha: str, nivel: NivelSimplificacao):
+    """
+    A rota pré-comprimida da linha no nível pedido, ou None se a linha não tem rota.
+    Só a primeira requisição do worker constrói as rotas; depois de uma troca de
+    versão, as requisições continuam usando as rotas anteriores enquanto as novas
+    são construídas em segundo plano (ao_mudar_versao).
+    """
+    versao = versao_dados(db)
+    if _rotas["versao"] is None:
+        construir_rotas(db, versao)
+    elif _rotas["versao"] != versao and not _trava_construcao.locked():
+        # A construção disparada pela troca de versão falhou ou ainda não começou: tenta de novo
+        iniciar_construcao_rotas()
+    return _rotas["respostas"].get((cod_linha, nivel))
+
+
+def _construir_em_segundo_plano():
+    try:
+        with sessao_leitura() as db:
+            construir_rotas(db, versao_dados(db))
+    except Exception:
+        logger.exception("Falha ao pré-calcular as rotas das linhas")
+
+
+def iniciar_construcao_rotas():
+    """ Pré-calcula as rotas em uma thread de fundo, sem bloquear quem chamou. """
+    threading.Thread(target=_construir_em_segundo_plano, name="rotas-linhas", daemon=True).start()
+
+
+# Um novo período de referência dos pontos muda as rotas
+ao_mudar_versao(lambda versao: iniciar_construcao_rotas())
@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Request
 from sqlalchemy.orm import Session
 from datetime import date
 from typing import List
 from enum import Enum
 
 from app import schemas
+from app.aquecimento import registrar_visualizacao
 from app.queries import bairros as queries_bairros
+from app.compressao import resposta_pre_comprimida
 from app.database import get_db
+from app.espacial import indice_espacial
+from app.prazos import prazo_dashboards, prazo_kpis_rankings
 
 router = APIRouter(
     prefix="/api/v1/bairros",
@@ -21,12 +25,14 @@ class MetricaRankingBairro(str, Enum):
 
 
 @router.get("/", response_model=List[schemas.BairroParaFiltro])
-def read_bairros_para_filtro(db: Session = Depends(get_db)):
+def read_bairros_para_filtro(request: Request, db: Session = Depends(get_db)):
     """ Retorna uma lista de todos os bairros para filtros. """
-    return queries_bairros.get_todos_os_bairros(db)
+    return resposta_pre_comprimida(
+        request, db, "bairros:filtro", List[schemas.BairroParaFiltro], lambda: queries_bairros.get_todos_os_bairros(db)
+    )
 
 
-@router.get("/ranking/{metrica}", response_model=List[schemas.RankingItem])
+@router.get("/ranking/{metrica}", response_model=List[schemas.RankingItem], dependencies=[prazo_kpis_rankings])
 def read_ranking_de_bairros(
     metrica: MetricaRankingBairro,
     data_inicio: date,
@@ -38,15 +44,43 @@ def read_ranking_de_bairros(
     return queries_bairros.get_ranking_bairros(db, metrica.value, data_inicio, data_fim, limit)
 
 
-@router.get("/{id_bairro}/dashboard", response_model=schemas.BairroDashboardResponse)
+@router.get("/por-ponto", response_model=schemas.BairroParaFiltro)
+def read_bairro_por_ponto(lat: float = Query(..., ge=-90, le=90), lon: float = Query(..., ge=-180, le=180)):
+    """ Retorna o bairro que contém a coordenada, consultando o índice espacial em memória. """
+    indice = indice_espacial()
+    if indice is None:
+        raise HTTPException(status_code=503, detail="Índice espacial ainda em construção.")
+    bairro = indice.bairro_do_ponto(lat, lon)
+    if bairro is None:
+        raise HTTPException(status_code=404, detail="Nenhum bairro contém a coordenada informada.")
+    return {"id_bairro": bairro.id_bairro, "nome_bairro": bairro.nome_bairro}
+
+
+@router.get("/{id_bairro}/geometria", response_model=schemas.GeoJSONFeatureCollection)
+def read_geometria_de_bairro(id_bairro: int, request: Request, db: Session = Depends(get_db)):
+    """ Retorna o polígono do bairro como GeoJSON, servido de um cache pré-comprimido. """
+    def buscar_geometria():
+        geometria = queries_bairros.get_geometria_bairro(db, id_bairro)
+        if not geometria:
+            raise HTTPException(status_code=404, detail="Bairro não encontrado ou sem geometria.")
+        return geometria
+
+    return resposta_pre_comprimida(
+        request, db, f"bairros:{id_bairro}:geometria", schemas.GeoJSONFeatureCollection, buscar_geometria
+    )
+
+
+@router.get("/{id_bairro}/dashboard", response_model=schemas.BairroDashboardResponse, dependencies=[prazo_dashboards])
 def read_dashboard_de_bairro(
     id_bairro: int,
     data_inicio: date,
     data_fim: date,
+    exato: bool = Query(True, description="Se falso, contagens distintas aproximadas (HyperLogLog), mais rápidas."),
     db: Session = Depends(get_db)
 ):
     """ Retorna todos os dados para o dashboard de um bairro individual, incluindo o mapa. """
-    dados = queries_bairros.get_dashboard_bairro(db, id_bairro, data_inicio, data_fim)
+    registrar_visualizacao("bairro", id_bairro)
+    dados = queries_bairros.get_dashboard_bairro(db, id_bairro, data_inicio, data_fim, exato)
     if not dados:
         raise HTTPException(status_code=404, detail="Bairro não encontrado ou sem dados no período.")
 
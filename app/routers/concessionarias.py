@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
 from datetime import date
-from typing import List
+from typing import List, Optional
 
 from app import schemas
+from app.aquecimento import registrar_visualizacao
 from app.queries import concessionarias as queries_concessionarias
+from app.compressao import resposta_pre_comprimida
 from app.database import get_db
+from app.periodos import Comparacao, periodo_comparacao
+from app.prazos import prazo_dashboards, prazo_kpis_rankings
 
 router = APIRouter(
     prefix="/api/v1/concessionarias",
@@ -14,22 +18,48 @@ router = APIRouter(
 
 
 @router.get("/", response_model=List[schemas.ConcessionariaParaFiltro])
-def read_concessionarias_para_filtro(db: Session = Depends(get_db)):
+def read_concessionarias_para_filtro(request: Request, db: Session = Depends(get_db)):
     """ Retorna uma lista de todas as concessionárias para filtros. """
-    return queries_concessionarias.get_todas_as_concessionarias(db)
+    return resposta_pre_comprimida(
+        request,
+        db,
+        "concessionarias:filtro",
+        List[schemas.ConcessionariaParaFiltro],
+        lambda: queries_concessionarias.get_todas_as_concessionarias(db),
+    )
 
 
-@router.get("/ranking-comparativo", response_model=List[schemas.RankingConcessionariaItem])
+@router.get(
+    "/ranking-comparativo",
+    response_model=List[schemas.RankingConcessionariaItem],
+    response_model_exclude_unset=True,
+    dependencies=[prazo_kpis_rankings],
+)
 def read_ranking_de_concessionarias(
     data_inicio: date,
     data_fim: date,
+    comparar_com: Optional[Comparacao] = None,
+    exato: bool = Query(True, description="Se falso, contagens distintas aproximadas (HyperLogLog), mais rápidas."),
     db: Session = Depends(get_db)
 ):
-    """ Retorna um ranking comparativo de todas as concessionárias. """
-    return queries_concessionarias.get_ranking_concessionarias(db, data_inicio, data_fim)
+    """
+    Retorna um ranking comparativo de todas as concessionárias. Com 'comparar_com', inclui
+    os totais da janela de comparação, as variações e a posição por passageiros.
+    Com exato=false, o total de linhas vem dos sketches HyperLogLog diários.
+    """
+    if comparar_com is not None:
+        inicio_anterior, fim_anterior = periodo_comparacao(comparar_com, data_inicio, data_fim)
+        return queries_concessionarias.get_ranking_concessionarias_comparativo(
+            db, data_inicio, data_fim, inicio_anterior, fim_anterior, exato
+        )
+    return queries_concessionarias.get_ranking_concessionarias(db, data_inicio, data_fim, exato)
 
 
-@router.get("/{id_concessionaria}/dashboard", response_model=schemas.ConcessionariaDashboardResponse)
+@router.get(
+    "/{id_concessionaria}/dashboard",
+    response_model=schemas.ConcessionariaDashboardResponse,
+    dependencies=[prazo_dashboards],
+)
 def read_dashboard_de_concessionaria(
     id_concessionaria: int,
     data_inicio: date,
@@ -37,6 +67,7 @@ def read_dashboard_de_concessionaria(
     db: Session = Depends(get_db)
 ):
     """ Retorna todos os dados para o dashboard de uma concessionária individual. """
+    registrar_visualizacao("concessionaria", id_concessionaria)
     dados = queries_concessionarias.get_dashboard_concessionaria(db, id_concessionaria, data_inicio, data_fim)
     if not dados:
         raise HTTPException(status_code=404, detail="Concessionária não encontrada ou sem dados no período.")
@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
 from datetime import date
-from typing import List
+from typing import List, Optional
 
 from app import schemas
+from app.aquecimento import registrar_visualizacao
 from app.queries import empresas as queries_empresas
+from app.compressao import resposta_pre_comprimida
 from app.database import get_db
+from app.periodos import Comparacao, periodo_comparacao
+from app.prazos import prazo_dashboards, prazo_kpis_rankings
 
 router = APIRouter(
     prefix="/api/v1/empresas",
@@ -14,30 +18,54 @@ router = APIRouter(
 
 
 @router.get("/", response_model=List[schemas.EmpresaParaFiltro])
-def read_empresas_para_filtro(db: Session = Depends(get_db)):
+def read_empresas_para_filtro(request: Request, db: Session = Depends(get_db)):
     """ Retorna uma lista de todas as empresas para filtros. """
-    return queries_empresas.get_todas_as_empresas(db)
+    return resposta_pre_comprimida(
+        request,
+        db,
+        "empresas:filtro",
+        List[schemas.EmpresaParaFiltro],
+        lambda: queries_empresas.get_todas_as_empresas(db),
+    )
 
 
-@router.get("/ranking-comparativo", response_model=List[schemas.RankingEmpresaItem])
+@router.get(
+    "/ranking-comparativo",
+    response_model=List[schemas.RankingEmpresaItem],
+    response_model_exclude_unset=True,
+    dependencies=[prazo_kpis_rankings],
+)
 def read_ranking_de_empresas(
     data_inicio: date,
     data_fim: date,
+    comparar_com: Optional[Comparacao] = None,
+    exato: bool = Query(True, description="Se falso, contagens distintas aproximadas (HyperLogLog), mais rápidas."),
     db: Session = Depends(get_db)
 ):
-    """ Retorna um ranking comparativo de todas as empresas. """
-    return queries_empresas.get_ranking_empresas(db, data_inicio, data_fim)
+    """
+    Retorna um ranking comparativo de todas as empresas. Com 'comparar_com', inclui
+    os totais da janela de comparação, as variações e a posição por passageiros.
+    Com exato=false, o total de linhas vem dos sketches HyperLogLog diários.
+    """
+    if comparar_com is not None:
+        inicio_anterior, fim_anterior = periodo_comparacao(comparar_com, data_inicio, data_fim)
+        return queries_empresas.get_ranking_empresas_comparativo(
+            db, data_inicio, data_fim, inicio_anterior, fim_anterior, exato
+        )
+    return queries_empresas.get_ranking_empresas(db, data_inicio, data_fim, exato)
 
 
-@router.get("/{id_empresa}/dashboard", response_model=schemas.EmpresaDashboardResponse)
+@router.get("/{id_empresa}/dashboard", response_model=schemas.EmpresaDashboardResponse, dependencies=[prazo_dashboards])
 def read_dashboard_de_empresa(
     id_empresa: int,
     data_inicio: date,
     data_fim: date,
+    exato: bool = Query(True, description="Se falso, contagens distintas aproximadas (HyperLogLog), mais rápidas."),
     db: Session = Depends(get_db)
 ):
     """ Retorna todos os dados para o dashboard de uma empresa individual. """
-    dados = queries_empresas.get_dashboard_empresa(db, id_empresa, data_inicio, data_fim)
+    registrar_visualizacao("empresa", id_empresa)
+    dados = queries_empresas.get_dashboard_empresa(db, id_empresa, data_inicio, data_fim, exato)
     if not dados:
         raise HTTPException(status_code=404, detail="Empresa não encontrada ou sem dados no período.")
 
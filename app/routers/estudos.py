@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 from datetime import date
-from typing import List
+from decimal import Decimal
+from typing import List, Optional, Union
+from enum import Enum
 
 from app import schemas
+from app.analise import classificar_eficiencia, resumir_idade_falhas
 from app.queries.estudos import (
     get_analise_eficiencia_linhas,
     get_taxa_falhas_por_empresa,
@@ -12,22 +15,72 @@ from app.queries.estudos import (
     get_ranking_linhas_por_falhas,
 )
 from app.database import get_db
+from app.prazos import prazo_estudos
+from app.formatos import MEDIA_TYPE_ARROW, MEDIA_TYPE_ARROW_ARQUIVO, MEDIA_TYPE_MSGPACK, resposta_colunar
+from app.paginacao import decodificar_cursor, definir_proximo_cursor
 
 
-router = APIRouter(prefix="/api/v1/estudos", tags=["Estudos de Caso"])
+router = APIRouter(prefix="/api/v1/estudos", tags=["Estudos de Caso"], dependencies=[prazo_estudos])
 
 
-@router.get("/analise-eficiencia", response_model=List[schemas.EficienciaLinha])
+class ModoEficiencia(str, Enum):
+    lista = "lista"
+    quadrantes = "quadrantes"
+    compacto = "compacto"
+
+
+class ModoCorrelacao(str, Enum):
+    lista = "lista"
+    estatisticas = "estatisticas"
+
+
+# Documenta no OpenAPI os formatos colunares negociados pelo cabeçalho Accept
+_RESPOSTAS_COLUNARES = {
+    200: {"content": {MEDIA_TYPE_ARROW: {}, MEDIA_TYPE_ARROW_ARQUIVO: {}, MEDIA_TYPE_MSGPACK: {}}},
+}
+
+
+@router.get(
+    "/analise-eficiencia",
+    response_model=Union[List[schemas.EficienciaLinha], schemas.EstatisticasEficiencia],
+    response_model_exclude_unset=True,
+    responses=_RESPOSTAS_COLUNARES,
+)
 def read_analise_de_eficiencia(
+    request: Request,
+    response: Response,
     data_inicio: date,
     data_fim: date,
+    modo: ModoEficiencia = ModoEficiencia.lista,
+    percentil_corte: float = Query(
+        50, gt=0, lt=100, description="Percentil que separa os quadrantes em cada métrica (50 = mediana)."
+    ),
+    limite: Optional[int] = Query(None, ge=1, le=5000),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
     """
     Retorna os dados de eficiência (passageiros por km e por minuto) para
     todas as linhas no período especificado, para ser usado em um gráfico de quadrantes.
+    Aceita também Arrow IPC ou MessagePack (colunar) via cabeçalho Accept.
+    Com 'limite', o cursor da próxima página vem no cabeçalho X-Proximo-Cursor.
+    No modo 'quadrantes', o servidor calcula os percentis de cada métrica, o quadrante
+    de cada linha (pelo percentil de corte) e o resumo por quadrante; no modo
+    'compacto', vem só o resumo e as linhas outliers, sem a lista completa.
     """
-    return get_analise_eficiencia_linhas(db, data_inicio, data_fim)
+    if modo != ModoEficiencia.lista:
+        if limite is not None or cursor is not None:
+            raise HTTPException(status_code=400, detail="'limite' e 'cursor' só se aplicam ao modo 'lista'.")
+        resumo, linhas = classificar_eficiencia(
+            get_analise_eficiencia_linhas(db, data_inicio, data_fim), percentil_corte
+        )
+        if modo == ModoEficiencia.quadrantes:
+            resumo["linhas"] = linhas
+        return resumo
+
+    dados = get_analise_eficiencia_linhas(db, data_inicio, data_fim, limite, decodificar_cursor(cursor, (Decimal, int)))
+    definir_proximo_cursor(response, dados, limite, lambda d: (d.passageiros_por_km, d.id_linha))
+    return resposta_colunar(request, response, dados, schemas.EficienciaLinha)
 
 
 @router.get("/falhas-mecanicas/taxa-por-empresa", response_model=List[schemas.TaxaFalhasEmpresa])
@@ -46,17 +99,60 @@ def read_ranking_justificativas_falhas(data_inicio: date, data_fim: date, db: Se
     return get_ranking_justificativas_falhas(db, data_inicio, data_fim)
 
 
-@router.get("/falhas-mecanicas/correlacao-idade-veiculo", response_model=List[schemas.CorrelacaoIdadeFalha])
-def read_correlacao_idade_falhas(data_inicio: date, data_fim: date, db: Session = Depends(get_db)):
+@router.get(
+    "/falhas-mecanicas/correlacao-idade-veiculo",
+    response_model=Union[List[schemas.CorrelacaoIdadeFalha], schemas.EstatisticasIdadeFalhas],
+    response_model_exclude_unset=True,
+    responses=_RESPOSTAS_COLUNARES,
+)
+def read_correlacao_idade_falhas(
+    request: Request,
+    response: Response,
+    data_inicio: date,
+    data_fim: date,
+    modo: ModoCorrelacao = ModoCorrelacao.lista,
+    largura_faixa: int = Query(
+        1, ge=1, le=10, description="Largura, em anos, das faixas de idade (modo estatisticas)."
+    ),
+    incluir_veiculos: bool = False,
+    limite: Optional[int] = Query(None, ge=1, le=5000),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """
     Retorna dados para a análise de correlação entre idade do veículo e número de falhas.
+    No modo 'lista', uma linha por veículo; aceita também Arrow IPC ou MessagePack
+    (colunar) via cabeçalho Accept e, com 'limite', o cursor da próxima página vem no
+    cabeçalho X-Proximo-Cursor. No modo 'estatisticas', o servidor calcula os
+    coeficientes de Pearson e Spearman, a reta de regressão e as falhas por faixa de
+    idade e empresa; a lista de veículos só vem com incluir_veiculos=true.
     """
-    return get_correlacao_idade_falhas(db, data_inicio, data_fim)
+    if modo == ModoCorrelacao.estatisticas:
+        if limite is not None or cursor is not None:
+            raise HTTPException(status_code=400, detail="'limite' e 'cursor' só se aplicam ao modo 'lista'.")
+        veiculos = get_correlacao_idade_falhas(db, data_inicio, data_fim)
+        estatisticas = resumir_idade_falhas(veiculos, largura_faixa)
+        if incluir_veiculos:
+            estatisticas["veiculos"] = veiculos
+        return estatisticas
+
+    dados = get_correlacao_idade_falhas(db, data_inicio, data_fim, limite, decodificar_cursor(cursor, (Decimal, int)))
+    definir_proximo_cursor(response, dados, limite, lambda d: (d.total_falhas, d.id_veiculo))
+    return resposta_colunar(request, response, dados, schemas.CorrelacaoIdadeFalha)
 
 
 @router.get("/falhas-mecanicas/ranking-linhas", response_model=List[schemas.RankingLinhasFalhas])
-def read_ranking_linhas_por_falhas(data_inicio: date, data_fim: date, db: Session = Depends(get_db)):
+def read_ranking_linhas_por_falhas(
+    response: Response,
+    data_inicio: date,
+    data_fim: date,
+    limite: Optional[int] = Query(None, ge=1, le=5000),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
     """
     Retorna o ranking de linhas com o maior número de falhas mecânicas.
+    Com 'limite', o cursor da próxima página vem no cabeçalho X-Proximo-Cursor.
     """
-    return get_ranking_linhas_por_falhas(db, data_inicio, data_fim)
+    dados = get_ranking_linhas_por_falhas(db, data_inicio, data_fim, limite, decodificar_cursor(cursor, (Decimal, int)))
+    return definir_proximo_cursor(response, dados, limite, lambda d: (d.total_falhas, d.id_linha))
@@ -0,0 +1,39 @@
+import asyncio
+
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+
+from app.database import settings
+from app.eventos import difusor
+
+router = APIRouter(
+    prefix="/api/v1/eventos",
+    tags=["Eventos"]
+)
+
+
+@router.get("/")
+async def assinar_eventos():
+    """
+    Canal Server-Sent Events para painéis em tela cheia, no lugar do polling.
+    Envia 'versao' quando uma nova carga de dados é detectada e, em seguida, um
+    evento 'painel' por janela padrão (ultimo_mes, ano_corrente, ultimos_12_meses)
+    com os KPIs e rankings recalculados. Ao conectar, o cliente recebe os últimos
+    eventos publicados. Comentários periódicos mantêm a conexão aberta em proxies.
+    """
+    async def gerar():
+        fila = difusor.assinar()
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(fila.get(), timeout=settings.eventos_heartbeat_segundos)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+        finally:
+            difusor.cancelar(fila)
+
+    return StreamingResponse(
+        gerar(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,112 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from datetime import date
+from typing import Optional
+from enum import Enum
+
+from app.database import sessao_leitura, settings
+from app.formatos import gerar_csv, gerar_parquet
+from app.queries.exportacao import montar_exportacao_viagens, montar_exportacao_agregado
+
+router = APIRouter(
+    prefix="/api/v1/exportacao",
+    tags=["Exportação"]
+)
+
+
+class FormatoExportacao(str, Enum):
+    csv = "csv"
+    parquet = "parquet"
+
+
+class TabelaAgregada(str, Enum):
+    linhas = "linhas"
+    veiculos = "veiculos"
+    bairros = "bairros"
+    empresas = "empresas"
+    concessionarias = "concessionarias"
+    falhas_mecanicas = "falhas_mecanicas"
+
+
+_MEDIA_TYPES = {
+    FormatoExportacao.csv: "text/csv; charset=utf-8",
+    FormatoExportacao.parquet: "application/vnd.apache.parquet",
+}
+
+
+def _transmitir(query, parametros, formato: FormatoExportacao, nome_arquivo: str):
+    """
+    Executa a consulta com um cursor no servidor (yield_per) e transmite o resultado
+    lote a lote. A sessão é aberta dentro do gerador, e não via Depends(get_db),
+    porque ela precisa continuar aberta enquanto a resposta está sendo enviada.
+    """
+    def gerar():
+        with sessao_leitura() as db:
+            resultado = db.execute(
+                query.execution_options(yield_per=settings.exportacao_tamanho_lote), parametros
+            )
+            if formato == FormatoExportacao.parquet:
+                yield from gerar_parquet(resultado)
+            else:
+                yield from gerar_csv(resultado)
+
+    return StreamingResponse(
+        gerar(),
+        media_type=_MEDIA_TYPES[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nome_arquivo}.{formato.value}"'},
+    )
+
+
+def _filtros(**filtros: Optional[int]):
+    return {coluna: valor for coluna, valor in filtros.items() if valor is not None}
+
+
+@router.get("/viagens")
+def exportar_viagens(
+    data_inicio: date,
+    data_fim: date,
+    formato: FormatoExportacao = FormatoExportacao.csv,
+    id_linha: Optional[int] = None,
+    id_empresa: Optional[int] = None,
+    id_concessionaria: Optional[int] = None,
+    id_veiculo: Optional[int] = None,
+):
+    """
+    Exporta as viagens (fact_viagens) do período em CSV ou Parquet,
+    opcionalmente filtradas por linha, empresa, concessionária ou veículo.
+    """
+    filtros = _filtros(
+        id_linha=id_linha, id_empresa=id_empresa, id_concessionaria=id_concessionaria, id_veiculo=id_veiculo
+    )
+    query, parametros = montar_exportacao_viagens(data_inicio, data_fim, filtros)
+    return _transmitir(query, parametros, formato, f"viagens_{data_inicio}_{data_fim}")
+
+
+@router.get("/agregados/{tabela}")
+def exportar_agregado(
+    tabela: TabelaAgregada,
+    data_inicio: date,
+    data_fim: date,
+    formato: FormatoExportacao = FormatoExportacao.csv,
+    id_linha: Optional[int] = None,
+    id_empresa: Optional[int] = None,
+    id_concessionaria: Optional[int] = None,
+    id_veiculo: Optional[int] = None,
+    id_bairro: Optional[int] = None,
+):
+    """
+    Exporta uma tabela agregada diária no período em CSV ou Parquet. Os filtros
+    de entidade aceitos dependem da tabela (ex.: id_bairro apenas para 'bairros').
+    """
+    filtros = _filtros(
+        id_linha=id_linha,
+        id_empresa=id_empresa,
+        id_concessionaria=id_concessionaria,
+        id_veiculo=id_veiculo,
+        id_bairro=id_bairro,
+    )
+    try:
+        query, parametros = montar_exportacao_agregado(tabela.value, data_inicio, data_fim, filtros)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _transmitir(query, parametros, formato, f"{tabela.value}_{data_inicio}_{data_fim}")
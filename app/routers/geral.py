@@ -1,18 +1,36 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 from datetime import date
+from typing import Optional
 
 from app import schemas
 from app.database import get_db
-from app.queries.geral import get_kpis_gerais
+from app.prazos import prazo_kpis_rankings
+from app.periodos import Comparacao, periodo_comparacao
+from app.queries.geral import get_kpis_gerais, get_kpis_gerais_comparativo
 
 router = APIRouter(prefix="/api/v1/geral", tags=["Visão Geral"])
 
 
-@router.get("/kpis", response_model=schemas.KpiGeral)
-def read_kpis_gerais(data_inicio: date, data_fim: date, db: Session = Depends(get_db)):
+@router.get(
+    "/kpis",
+    response_model=schemas.KpiGeral,
+    response_model_exclude_unset=True,
+    dependencies=[prazo_kpis_rankings],
+)
+def read_kpis_gerais(
+    data_inicio: date,
+    data_fim: date,
+    comparar_com: Optional[Comparacao] = None,
+    db: Session = Depends(get_db),
+):
     """
     Retorna os Indicadores-Chave de Desempenho (KPIs) para um determinado período.
+    Com 'comparar_com', inclui os valores do período anterior (ou do mesmo período
+    no ano anterior) e as variações percentuais.
     """
+    if comparar_com is not None:
+        inicio_anterior, fim_anterior = periodo_comparacao(comparar_com, data_inicio, data_fim)
+        return get_kpis_gerais_comparativo(db, data_inicio, data_fim, inicio_anterior, fim_anterior)
     kpis = get_kpis_gerais(db=db, data_inicio=data_inicio, data_fim=data_fim)
     return kpis
@@ -1,13 +1,19 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Request
 from sqlalchemy.orm import Session
 from datetime import date
-from typing import List
+from typing import List, Optional
 from enum import Enum
 
 from app import schemas
+from app.aquecimento import registrar_visualizacao
+from app.compressao import responder_pre_comprimida, resposta_pre_comprimida
 from app.database import get_db
+from app.periodos import Comparacao, periodo_comparacao
+from app.prazos import prazo_dashboards, prazo_kpis_rankings
+from app.rotas import NivelSimplificacao, rota_da_linha
 from app.queries.linhas import (
     get_ranking_linhas,
+    get_ranking_linhas_comparativo,
     get_contagem_linhas_por_concessionaria,
     get_contagem_linhas_por_empresa,
     get_contagem_pontos_por_linha,
@@ -27,31 +33,45 @@ class MetricaRanking(str, Enum):
 
 
 @router.get("/", response_model=List[schemas.LinhaParaFiltro])
-def read_todas_as_linhas_para_filtro(db: Session = Depends(get_db)):
+def read_todas_as_linhas_para_filtro(request: Request, db: Session = Depends(get_db)):
     """
     Retorna uma lista de todas as linhas de ônibus disponíveis para
     serem usadas em filtros de dropdown.
     """
-    linhas = get_todas_as_linhas(db)
-    return linhas
+    return resposta_pre_comprimida(
+        request, db, "linhas:filtro", List[schemas.LinhaParaFiltro], lambda: get_todas_as_linhas(db)
+    )
 
 
-@router.get("/ranking/{metrica}", response_model=schemas.RankingResponse)
+@router.get(
+    "/ranking/{metrica}",
+    response_model=schemas.RankingResponse,
+    response_model_exclude_unset=True,
+    dependencies=[prazo_kpis_rankings],
+)
 def read_ranking_de_linhas(
     metrica: MetricaRanking,
     data_inicio: date,
     data_fim: date,
     limit: int = Query(10, ge=1, le=50),
+    comparar_com: Optional[Comparacao] = None,
     db: Session = Depends(get_db),
 ):
     """
     Retorna um ranking das linhas por uma métrica específica (passageiros, viagens ou ocorrências)
-    para um determinado período.
+    para um determinado período. Com 'comparar_com', cada linha traz também o valor, a
+    posição e as variações em relação ao período anterior ou ao mesmo período do ano anterior.
     """
     try:
-        ranking_data = get_ranking_linhas(
-            db, metrica.value, data_inicio, data_fim, limit
-        )
+        if comparar_com is not None:
+            inicio_anterior, fim_anterior = periodo_comparacao(comparar_com, data_inicio, data_fim)
+            ranking_data = get_ranking_linhas_comparativo(
+                db, metrica.value, data_inicio, data_fim, limit, inicio_anterior, fim_anterior
+            )
+        else:
+            ranking_data = get_ranking_linhas(
+                db, metrica.value, data_inicio, data_fim, limit
+            )
         return {"metrica": metrica.value, "ranking": ranking_data}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -111,40 +131,63 @@ def read_contagem_linhas_por_bairro(
     response_model=schemas.GeoJSONFeatureCollection,
 )
 def read_geolocalizacao_dos_pontos_da_linha(
-    cod_linha: str, db: Session = Depends(get_db)
+    cod_linha: str, request: Request, db: Session = Depends(get_db)
 ):
     """
     Retorna uma coleção de Features GeoJSON, onde cada feature é um ponto de parada
     de uma linha específica.
     """
-    # Busca a lista de pontos (identificador, longitude, latitude) para a linha
-    pontos = get_pontos_geometria_linha(db, cod_linha)
-
-    if not pontos:
-        raise HTTPException(
-            status_code=404, detail="Nenhum ponto de ônibus encontrado para esta linha."
-        )
-
-    # Constrói a lista de "features", uma para cada ponto de ônibus
-    features = []
-    for ponto in pontos:
-        feature = {
-            "type": "Feature",
-            "geometry": {
-                "type": "Point",
-                "coordinates": [ponto.longitude, ponto.latitude],
-            },
-            "properties": {"identificador_ponto": ponto.identificador_ponto_onibus},
-        }
-        features.append(feature)
-
-    # Monta o objeto final GeoJSON FeatureCollection
-    feature_collection = {"type": "FeatureCollection", "features": features}
-
-    return feature_collection
+    def montar_feature_collection():
+        # Busca a lista de pontos (identificador, longitude, latitude) para a linha
+        pontos = get_pontos_geometria_linha(db, cod_linha)
+
+        if not pontos:
+            raise HTTPException(
+                status_code=404, detail="Nenhum ponto de ônibus encontrado para esta linha."
+            )
+
+        # Constrói a lista de "features", uma para cada ponto de ônibus
+        features = []
+        for ponto in pontos:
+            feature = {
+                "type": "Feature",
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [ponto.longitude, ponto.latitude],
+                },
+                "properties": {"identificador_ponto": ponto.identificador_ponto_onibus},
+            }
+            features.append(feature)
+
+        # Monta o objeto final GeoJSON FeatureCollection
+        return {"type": "FeatureCollection", "features": features}
+
+    # O mapa só muda quando um novo período de pontos é carregado: é comprimido uma vez por versão
+    return resposta_pre_comprimida(
+        request, db, f"linhas:{cod_linha}:pontos", schemas.GeoJSONFeatureCollection, montar_feature_collection
+    )
+
+
+@router.get("/{cod_linha}/rota", response_model=schemas.GeoJSONFeature)
+def read_rota_da_linha(
+    cod_linha: str,
+    request: Request,
+    nivel: NivelSimplificacao = NivelSimplificacao.completo,
+    db: Session = Depends(get_db),
+):
+    """
+    Retorna a rota da linha como uma Feature GeoJSON LineString, ligando os pontos
+    de parada em ordem (mês de referência mais recente). Os níveis 'detalhado',
+    'medio' e 'simples' simplificam o traçado com tolerâncias de 10, 50 e 150 m.
+    As rotas de todas as linhas são pré-calculadas e comprimidas por versão dos dados.
+    """
+    rota = rota_da_linha(db, cod_linha, nivel)
+    if rota is None:
+        raise HTTPException(status_code=404, detail="Nenhuma rota encontrada para esta linha.")
+    return responder_pre_comprimida(request, rota)
 
 
-@router.get("/{id_linha}/dashboard", response_model=schemas.LinhaDashboardResponse)
+@router.get("/{id_linha}/dashboard", response_model=schemas.LinhaDashboardResponse, dependencies=[prazo_dashboards])
 def read_dashboard_de_linha(
     id_linha: int,
     data_inicio: date,
@@ -155,6 +198,7 @@ def read_dashboard_de_linha(
     Retorna um objeto completo com todas as estatísticas e dados de gráficos
     para a página de análise de uma linha individual.
     """
+    registrar_visualizacao("linha", id_linha)
     dados_dashboard = get_dashboard_linha(db, id_linha, data_inicio, data_fim)
 
     if not dados_dashboard:
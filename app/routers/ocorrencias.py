@@ -5,8 +5,10 @@ from typing import List
 from enum import Enum
 
 from app import schemas
+from app.aquecimento import registrar_visualizacao
 from app.queries import ocorrencias as queries_ocorrencias
 from app.database import get_db
+from app.prazos import prazo_dashboards, prazo_kpis_rankings
 
 
 router = APIRouter(
@@ -21,20 +23,34 @@ class EntidadeRanking(str, Enum):
     linha = "linha"
 
 
-@router.get("/ranking-por-justificativa", response_model=List[schemas.RankingOcorrenciasItem])
+@router.get(
+    "/ranking-por-justificativa",
+    response_model=List[schemas.RankingOcorrenciasItem],
+    response_model_exclude_unset=True,
+    dependencies=[prazo_kpis_rankings],
+)
 def read_ranking_ocorrencias_justificativa(
     data_inicio: date,
     data_fim: date,
     limit: int = Query(10, ge=1, le=50),
+    aproximado: bool = Query(
+        False, description="Estima sobre a amostra estratificada, com intervalo de confiança de 95%."
+    ),
     db: Session = Depends(get_db)
 ):
     """
-    Retorna o ranking de ocorrências agrupadas por justificativa.
+    Retorna o ranking de ocorrências agrupadas por justificativa. Com aproximado=true,
+    os totais são estimados a partir da amostra estratificada de viagens, muito mais
+    rápido em períodos longos, e cada item traz o intervalo de confiança de 95%.
     """
-    return queries_ocorrencias.get_ranking_ocorrencias_por_justificativa(db, data_inicio, data_fim, limit)
+    return queries_ocorrencias.get_ranking_ocorrencias_por_justificativa(db, data_inicio, data_fim, limit, aproximado)
 
 
-@router.get("/ranking-por-entidade/{entidade}", response_model=List[schemas.RankingOcorrenciasItem])
+@router.get(
+    "/ranking-por-entidade/{entidade}",
+    response_model=List[schemas.RankingOcorrenciasItem],
+    dependencies=[prazo_kpis_rankings],
+)
 def read_ranking_ocorrencias_entidade(
     entidade: EntidadeRanking,
     data_inicio: date,
@@ -60,19 +76,29 @@ def read_tendencia_temporal(
     return queries_ocorrencias.get_tendencia_temporal_ocorrencias(db, data_inicio, data_fim)
 
 
-@router.get("/por-tipo-dia", response_model=List[schemas.OcorrenciasPorTipoDiaItem])
+@router.get(
+    "/por-tipo-dia", response_model=List[schemas.OcorrenciasPorTipoDiaItem], response_model_exclude_unset=True
+)
 def read_ocorrencias_por_tipo_dia(
     data_inicio: date,
     data_fim: date,
+    aproximado: bool = Query(
+        False, description="Estima sobre a amostra estratificada, com intervalo de confiança de 95%."
+    ),
     db: Session = Depends(get_db)
 ):
     """
-    Retorna a contagem de ocorrências para cada tipo de dia.
+    Retorna a contagem de ocorrências para cada tipo de dia. Com aproximado=true, a
+    contagem é estimada a partir da amostra estratificada, com intervalo de confiança de 95%.
     """
-    return queries_ocorrencias.get_ocorrencias_por_tipo_dia(db, data_inicio, data_fim)
+    return queries_ocorrencias.get_ocorrencias_por_tipo_dia(db, data_inicio, data_fim, aproximado)
 
 
-@router.get("/{id_justificativa}/dashboard", response_model=schemas.JustificativaDashboardResponse)
+@router.get(
+    "/{id_justificativa}/dashboard",
+    response_model=schemas.JustificativaDashboardResponse,
+    dependencies=[prazo_dashboards],
+)
 def read_dashboard_de_justificativa(
     id_justificativa: int,
     data_inicio: date,
@@ -83,6 +109,7 @@ def read_dashboard_de_justificativa(
     Retorna um objeto completo com todas as estatísticas e dados de gráficos
     para a página de análise de uma justificativa de ocorrência individual.
     """
+    registrar_visualizacao("justificativa", id_justificativa)
     dados = queries_ocorrencias.get_dashboard_justificativa(db, id_justificativa, data_inicio, data_fim)
 
     if not dados or not dados.total_ocorrencias:
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from app import schemas
+from app.database import cancelar_consulta, consulta_cancelada, get_db, sessao_leitura, settings
+from app.periodos import resolver_periodo
+from app.queries.versao import get_ultima_data_carregada
+from app.widgets import WIDGETS
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/api/v1/paginas",
+    tags=["Páginas"]
+)
+
+_executor_widgets = ThreadPoolExecutor(max_workers=settings.pagina_concorrencia, thread_name_prefix="widgets")
+
+
+def _resolver_datas(pagina: schemas.PaginaRequest, db: Session):
+    if pagina.periodo is not None:
+        referencia = get_ultima_data_carregada(db)
+        if referencia is None:
+            raise HTTPException(status_code=404, detail="Nenhum dado carregado para resolver o período.")
+        try:
+            return resolver_periodo(pagina.periodo, referencia)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if pagina.data_inicio is None or pagina.data_fim is None:
+        raise HTTPException(status_code=400, detail="Informe 'periodo' ou 'data_inicio' e 'data_fim'.")
+    return pagina.data_inicio, pagina.data_fim
+
+
+def _validar_widgets(pagina: schemas.PaginaRequest):
+    chaves = [spec.chave for spec in pagina.widgets]
+    if len(set(chaves)) != len(chaves):
+        raise HTTPException(status_code=400, detail="As chaves dos widgets devem ser únicas.")
+
+    validados = []
+    for spec in pagina.widgets:
+        widget = WIDGETS.get(spec.rota)
+        if widget is None:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Widget '{spec.chave}': rota inválida. Use: {', '.join(WIDGETS)}.",
+            )
+        try:
+            parametros = widget.parametros(**spec.parametros)
+        except ValidationError as e:
+            erros = "; ".join(f"{'.'.join(map(str, erro['loc']))}: {erro['msg']}" for erro in e.errors())
+            raise HTTPException(status_code=400, detail=f"Widget '{spec.chave}': {erros}")
+        validados.append((spec.chave, widget, parametros))
+    return validados
+
+
+def _executar_widget(chave, widget, parametros, data_inicio, data_fim, sessoes):
+    """ Executa um widget em uma sessão própria, com o prazo dos rankings. """
+    with sessao_leitura() as db:
+        if settings.prazo_kpis_rankings_segundos:
+            db.info["prazo_ms"] = int(settings.prazo_kpis_rankings_segundos * 1000)
+        sessoes[chave] = db
+        try:
+            corpo = widget.executar(db, parametros, data_inicio, data_fim)
+        except ValueError as e:
+            corpo = json.dumps({"erro": str(e)}).encode("utf-8")
+        except Exception as e:
+            if not consulta_cancelada(e):
+                logger.exception("Falha no widget '%s'", chave)
+            erro = "A consulta excedeu o prazo do widget." if consulta_cancelada(e) else "Erro ao executar o widget."
+            corpo = json.dumps({"erro": erro}).encode("utf-8")
+        finally:
+            sessoes.pop(chave, None)
+    return chave, corpo
+
+
+@router.post("/")
+def carregar_pagina(pagina: schemas.PaginaRequest, db: Session = Depends(get_db)):
+    """
+    Executa em paralelo os widgets de uma página (KPIs, rankings, séries, ...) sobre um
+    mesmo período e devolve um único documento JSON com o resultado de cada widget na
+    sua 'chave'. Os widgets são enviados à medida que terminam, de modo que a página
+    fica pronta no tempo do widget mais lento. Um widget que falha traz {"erro": ...}
+    sem afetar os demais.
+    """
+    data_inicio, data_fim = _resolver_datas(pagina, db)
+    widgets = _validar_widgets(pagina)
+
+    async def gerar():
+        sessoes = {}
+        futuros = [
+            asyncio.wrap_future(
+                _executor_widgets.submit(_executar_widget, chave, widget, parametros, data_inicio, data_fim, sessoes)
+            )
+            for chave, widget, parametros in widgets
+        ]
+        concluido = False
+        try:
+            periodo = json.dumps({"data_inicio": str(data_inicio), "data_fim": str(data_fim)})
+            yield periodo[:-1].encode("utf-8") + b',"widgets":{'
+            separador = b""
+            for proximo in asyncio.as_completed(futuros):
+                chave, corpo = await proximo
+                yield separador + json.dumps(chave).encode("utf-8") + b":" + corpo
+                separador = b","
+            yield b"}}"
+            concluido = True
+        finally:
+            if not concluido:
+                # Cliente desconectou: descarta os widgets na fila e cancela as consultas em andamento
+                for futuro in futuros:
+                    futuro.cancel()
+                loop = asyncio.get_running_loop()
+                for sessao in list(sessoes.values()):
+                    loop.run_in_executor(None, cancelar_consulta, sessao)
+
+    return StreamingResponse(gerar(), media_type="application/json")
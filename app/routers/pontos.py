@@ -0,0 +1,37 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import List
+
+from app import schemas
+from app.espacial import indice_espacial
+
+router = APIRouter(
+    prefix="/api/v1/pontos",
+    tags=["Pontos"]
+)
+
+
+@router.get("/proximos", response_model=List[schemas.PontoProximo])
+def read_pontos_proximos(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    raio: float = Query(500, gt=0, le=5000, description="Raio de busca, em metros."),
+    limit: int = Query(20, ge=1, le=200),
+):
+    """
+    Retorna os pontos de ônibus (mês de referência mais recente) a até 'raio' metros
+    da coordenada, do mais próximo ao mais distante, com as linhas que param em cada um.
+    A busca é feita no índice espacial em memória, sem consultar o banco.
+    """
+    indice = indice_espacial()
+    if indice is None:
+        raise HTTPException(status_code=503, detail="Índice espacial ainda em construção.")
+    return [
+        {
+            "identificador_ponto_onibus": ponto.identificador_ponto_onibus,
+            "latitude": ponto.latitude,
+            "longitude": ponto.longitude,
+            "distancia_metros": round(distancia, 1),
+            "linhas": ponto.linhas or [],
+        }
+        for ponto, distancia in indice.pontos_proximos(lat, lon, raio, limit)
+    ]
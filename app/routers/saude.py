@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Response
+from typing import List
+
+from app import schemas
+from app.database import roteador_leitura
+from app.prontidao import estado as estado_prontidao
+
+router = APIRouter(
+    prefix="/health",
+    tags=["Saúde"]
+)
+
+
+@router.get("/replicas", response_model=List[schemas.MetricasReplica])
+def read_metricas_replicas():
+    """
+    Retorna, para o primário e cada réplica de leitura, a disponibilidade, o atraso
+    de replicação medido na última verificação e os contadores de requisições.
+    """
+    return roteador_leitura.metricas()
+
+
+@router.get("/live")
+def read_vivo():
+    """
+    Liveness: responde enquanto o processo atende requisições, sem consultar o banco.
+    """
+    return {"status": "vivo"}
+
+
+@router.get("/ready", response_model=schemas.EstadoProntidao, responses={503: {"model": schemas.EstadoProntidao}})
+def read_pronto(response: Response):
+    """
+    Readiness: 200 só depois que o worker aqueceu o pool de conexões, preparou as
+    consultas do catálogo e carregou os catálogos de dimensões; antes disso, 503.
+    Traz também as durações de cada etapa e o tempo de importação da aplicação.
+    """
+    if not estado_prontidao["pronto"]:
+        response.status_code = 503
+    return estado_prontidao
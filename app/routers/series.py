@@ -0,0 +1,74 @@
+from fastapi import APIRouter, Depends, Query, HTTPException
+from sqlalchemy.orm import Session
+from datetime import date
+from typing import Optional
+from enum import Enum
+
+from app import schemas
+from app.analise import reduzir_serie
+from app.queries import series as queries_series
+from app.database import get_db
+from app.prazos import prazo_kpis_rankings
+
+router = APIRouter(
+    prefix="/api/v1/series",
+    tags=["Séries Temporais"]
+)
+
+
+class MetricaSerie(str, Enum):
+    passageiros = "passageiros"
+    viagens = "viagens"
+    ocorrencias = "ocorrencias"
+    km_percorrido = "km_percorrido"
+
+
+class Granularidade(str, Enum):
+    dia = "dia"
+    semana = "semana"
+    mes = "mes"
+    ano = "ano"
+
+
+class EntidadeSerie(str, Enum):
+    linha = "linha"
+    empresa = "empresa"
+    concessionaria = "concessionaria"
+    veiculo = "veiculo"
+
+
+@router.get("/{metrica}", response_model=schemas.SerieTemporalResponse, dependencies=[prazo_kpis_rankings])
+def read_serie_temporal(
+    metrica: MetricaSerie,
+    data_inicio: date,
+    data_fim: date,
+    granularidade: Granularidade = Granularidade.dia,
+    entidade: Optional[EntidadeSerie] = None,
+    id_entidade: Optional[int] = None,
+    max_pontos: Optional[int] = Query(None, ge=3, le=10000),
+    db: Session = Depends(get_db),
+):
+    """
+    Retorna a série temporal de uma métrica por dia, semana, mês ou ano, para a
+    cidade inteira ou para uma entidade (entidade + id_entidade). Com 'max_pontos',
+    séries maiores são reduzidas por LTTB, preservando picos e vales do gráfico.
+    """
+    try:
+        serie = queries_series.get_serie_temporal(
+            db,
+            metrica.value,
+            granularidade.value,
+            data_inicio,
+            data_fim,
+            entidade.value if entidade else None,
+            id_entidade,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "metrica": metrica.value,
+        "granularidade": granularidade.value,
+        "total_pontos": len(serie),
+        "serie": reduzir_serie(serie, max_pontos) if max_pontos else serie,
+    }
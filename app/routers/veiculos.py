@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, Response
 from sqlalchemy.orm import Session
 from datetime import date
-from typing import List
+from typing import List, Optional
 from enum import Enum
 
 from app import schemas
+from app.aquecimento import registrar_visualizacao
 from app.queries import veiculos as queries_veiculos
+from app.compressao import resposta_pre_comprimida
 from app.database import get_db
+from app.prazos import prazo_dashboards, prazo_kpis_rankings
+from app.paginacao import decodificar_cursor, definir_proximo_cursor
 
 router = APIRouter(
     prefix="/api/v1/veiculos",
@@ -21,12 +25,32 @@ class MetricaRankingVeiculo(str, Enum):
 
 
 @router.get("/", response_model=List[schemas.VeiculoParaFiltro])
-def read_veiculos_para_filtro(db: Session = Depends(get_db)):
-    """ Retorna uma lista de todos os veículos para filtros. """
-    return queries_veiculos.get_todos_os_veiculos(db)
+def read_veiculos_para_filtro(
+    request: Request,
+    response: Response,
+    limite: Optional[int] = Query(None, ge=1, le=5000),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Retorna uma lista de todos os veículos para filtros. Com 'limite', a lista é
+    paginada e o cursor da próxima página vem no cabeçalho X-Proximo-Cursor.
+    """
+    if limite is None and cursor is None:
+        return resposta_pre_comprimida(
+            request,
+            db,
+            "veiculos:filtro",
+            List[schemas.VeiculoParaFiltro],
+            lambda: queries_veiculos.get_todos_os_veiculos(db),
+        )
+    veiculos = queries_veiculos.get_todos_os_veiculos(db, limite, decodificar_cursor(cursor, (int, int)))
+    return definir_proximo_cursor(
+        response, veiculos, limite, lambda v: (v.identificador_veiculo, v.id_veiculo)
+    )
 
 
-@router.get("/ranking/{metrica}", response_model=List[schemas.RankingVeiculoItem])
+@router.get("/ranking/{metrica}", response_model=List[schemas.RankingVeiculoItem], dependencies=[prazo_kpis_rankings])
 def read_ranking_de_veiculos(
     metrica: MetricaRankingVeiculo,
     data_inicio: date,
@@ -38,7 +62,7 @@ def read_ranking_de_veiculos(
     return queries_veiculos.get_ranking_veiculos(db, metrica.value, data_inicio, data_fim, limit)
 
 
-@router.get("/{id_veiculo}/dashboard", response_model=schemas.VeiculoDashboardResponse)
+@router.get("/{id_veiculo}/dashboard", response_model=schemas.VeiculoDashboardResponse, dependencies=[prazo_dashboards])
 def read_dashboard_de_veiculo(
     id_veiculo: int,
     data_inicio: date,
@@ -46,6 +70,7 @@ def read_dashboard_de_veiculo(
     db: Session = Depends(get_db)
 ):
     """ Retorna todos os dados para o dashboard de um veículo individual. """
+    registrar_visualizacao("veiculo", id_veiculo)
     dados = queries_veiculos.get_dashboard_veiculo(db, id_veiculo, data_inicio, data_fim)
     if not dados:
         raise HTTPException(status_code=404, detail="Veículo não encontrado ou sem dados no período.")
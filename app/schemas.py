@@ -9,6 +9,15 @@ class KpiGeral(BaseModel):
     total_viagens: int
     total_ocorrencias: int
     eficiencia_passageiro_km: float
+    # Preenchidos apenas com comparar_com
+    total_passageiros_anterior: Optional[int] = None
+    total_viagens_anterior: Optional[int] = None
+    total_ocorrencias_anterior: Optional[int] = None
+    eficiencia_passageiro_km_anterior: Optional[float] = None
+    variacao_passageiros_percentual: Optional[float] = None
+    variacao_viagens_percentual: Optional[float] = None
+    variacao_ocorrencias_percentual: Optional[float] = None
+    variacao_eficiencia_percentual: Optional[float] = None
 
 
 # Schema para um item do ranking (usado para passageiros, viagens, etc.)
@@ -17,6 +26,13 @@ class RankingItem(BaseModel):
     codigo: str
     nome: Optional[str] = None
     valor: int
+    # Preenchidos apenas com comparar_com; variacao_posicao > 0 indica que subiu no ranking
+    valor_anterior: Optional[int] = None
+    variacao: Optional[int] = None
+    variacao_percentual: Optional[float] = None
+    posicao: Optional[int] = None
+    posicao_anterior: Optional[int] = None
+    variacao_posicao: Optional[int] = None
 
 
 # Schema para a resposta dos rankings (lista de itens)
@@ -54,6 +70,36 @@ class EficienciaLinha(BaseModel):
     total_passageiros: int
 
 
+class EficienciaLinhaClassificada(EficienciaLinha):
+    quadrante: str
+
+
+class PercentilEficiencia(BaseModel):
+    percentil: int
+    passageiros_por_km: float
+    passageiros_por_minuto: float
+
+
+class ResumoQuadranteEficiencia(BaseModel):
+    quadrante: str
+    total_linhas: int
+    total_passageiros: int
+    media_passageiros_por_km: float
+    media_passageiros_por_minuto: float
+
+
+# Schema dos modos 'quadrantes' e 'compacto' da análise de eficiência (calculado no servidor)
+class EstatisticasEficiencia(BaseModel):
+    total_linhas: int
+    percentil_corte: float
+    corte_passageiros_por_km: Optional[float] = None
+    corte_passageiros_por_minuto: Optional[float] = None
+    percentis: List[PercentilEficiencia]
+    quadrantes: List[ResumoQuadranteEficiencia]
+    outliers: List[EficienciaLinhaClassificada]
+    linhas: Optional[List[EficienciaLinhaClassificada]] = None
+
+
 class TaxaFalhasEmpresa(BaseModel):
     id_empresa: int
     nome_empresa: str
@@ -72,6 +118,31 @@ class CorrelacaoIdadeFalha(BaseModel):
     nome_empresa: str
 
 
+class RegressaoLinear(BaseModel):
+    inclinacao: float
+    intercepto: float
+    r2: float
+
+
+class FaixaIdadeFalhas(BaseModel):
+    idade_inicio: int
+    idade_fim: int
+    nome_empresa: str
+    total_veiculos: int
+    total_falhas: int
+    media_falhas: float
+
+
+# Schema do modo 'estatisticas' da correlação idade x falhas (calculado no servidor)
+class EstatisticasIdadeFalhas(BaseModel):
+    total_veiculos: int
+    pearson: Optional[float] = None
+    spearman: Optional[float] = None
+    regressao: Optional[RegressaoLinear] = None
+    faixas: List[FaixaIdadeFalhas]
+    veiculos: Optional[List[CorrelacaoIdadeFalha]] = None
+
+
 class RankingLinhasFalhas(BaseModel):
     id_linha: int
     cod_linha: str
@@ -111,6 +182,9 @@ class RankingOcorrenciasItem(BaseModel):
     id: int
     nome: str
     total_ocorrencias: int
+    # Limites do intervalo de confiança de 95%, apenas no modo aproximado
+    intervalo_inferior: Optional[int] = None
+    intervalo_superior: Optional[int] = None
 
 
 # Schema para a análise de tendência temporal
@@ -123,6 +197,8 @@ class TendenciaTemporalItem(BaseModel):
 class OcorrenciasPorTipoDiaItem(BaseModel):
     tipo_dia: str
     total_ocorrencias: int
+    intervalo_inferior: Optional[int] = None
+    intervalo_superior: Optional[int] = None
 
 
 # Schema para um item de ranking (pode ser usado para linhas ou veículos)
@@ -147,6 +223,15 @@ class BairroParaFiltro(BaseModel):
     nome_bairro: str
 
 
+# Schema para um ponto de ônibus encontrado na busca por proximidade
+class PontoProximo(BaseModel):
+    identificador_ponto_onibus: Union[int, str]
+    latitude: float
+    longitude: float
+    distancia_metros: float
+    linhas: List[str]
+
+
 # Schema para a resposta do dashboard de um bairro individual, agora com dados do mapa
 class BairroDashboardResponse(BaseModel):
     estatisticas_detalhadas: List[StatItem]
@@ -172,6 +257,15 @@ class RankingConcessionariaItem(BaseModel):
     total_ocorrencias: int
     total_passageiros: int
     taxa_ocorrencias_por_10k_viagens: float
+    # Preenchidos apenas com comparar_com; a posição é pelo total de passageiros
+    total_ocorrencias_anterior: Optional[int] = None
+    total_passageiros_anterior: Optional[int] = None
+    taxa_ocorrencias_por_10k_viagens_anterior: Optional[float] = None
+    variacao_passageiros_percentual: Optional[float] = None
+    variacao_ocorrencias_percentual: Optional[float] = None
+    posicao: Optional[int] = None
+    posicao_anterior: Optional[int] = None
+    variacao_posicao: Optional[int] = None
 
 
 # Schema para a resposta do dashboard de uma concessionária individual
@@ -218,6 +312,15 @@ class RankingEmpresaItem(BaseModel):
     total_ocorrencias: int
     total_passageiros: int
     taxa_ocorrencias_por_10k_viagens: float
+    # Preenchidos apenas com comparar_com; a posição é pelo total de passageiros
+    total_ocorrencias_anterior: Optional[int] = None
+    total_passageiros_anterior: Optional[int] = None
+    taxa_ocorrencias_por_10k_viagens_anterior: Optional[float] = None
+    variacao_passageiros_percentual: Optional[float] = None
+    variacao_ocorrencias_percentual: Optional[float] = None
+    posicao: Optional[int] = None
+    posicao_anterior: Optional[int] = None
+    variacao_posicao: Optional[int] = None
 
 
 # Schema para a resposta do dashboard de uma empresa individual
@@ -227,3 +330,64 @@ class EmpresaDashboardResponse(BaseModel):
     grafico_linhas_mais_utilizadas: List[RankingItem]
     grafico_media_passageiros_dia_semana: List[ChartDataItem]
     grafico_evolucao_passageiros_ano: List[ChartDataItem]
+
+
+# Schema para as métricas de um banco de leitura (primário ou réplica)
+class MetricasReplica(BaseModel):
+    nome: str
+    replica: bool
+    saudavel: bool
+    lag_segundos: Optional[float] = None
+    em_andamento: int
+    total_requisicoes: int
+    falhas_verificacao: int
+    ultima_verificacao: Optional[float] = None
+    ultimo_erro: Optional[str] = None
+
+
+class EtapaProntidao(BaseModel):
+    nome: str
+    duracao_segundos: float
+    detalhe: Optional[str] = None
+
+
+class EstadoProntidao(BaseModel):
+    pronto: bool
+    status: str
+    tentativas: int
+    tempo_importacao_segundos: Optional[float] = None
+    tempo_ate_pronto_segundos: Optional[float] = None
+    alvo_inicializacao_segundos: float
+    etapas: List[EtapaProntidao]
+    consultas_preparadas: int
+    consultas_com_falha: List[str]
+    ultimo_erro: Optional[str] = None
+
+
+# Schema para um ponto de uma série temporal
+class SerieTemporalItem(BaseModel):
+    periodo: date  # Primeiro dia do período (dia, semana, mês ou ano)
+    valor: float
+
+
+# Schema para a resposta de uma série temporal
+class SerieTemporalResponse(BaseModel):
+    metrica: str
+    granularidade: str
+    total_pontos: int  # Pontos da série antes da redução por max_pontos
+    serie: List[SerieTemporalItem]
+
+
+# Schema para um widget pedido no endpoint de página
+class WidgetPagina(BaseModel):
+    chave: str  # Nome do widget no documento de resposta
+    rota: str  # Ex.: "geral/kpis", "linhas/ranking"
+    parametros: Dict[str, Any] = {}
+
+
+# Schema para a requisição do endpoint de página: um período compartilhado e os widgets
+class PaginaRequest(BaseModel):
+    data_inicio: Optional[date] = None
+    data_fim: Optional[date] = None
+    periodo: Optional[str] = None  # Alternativa às datas: ultimo_mes, ano_corrente ou ultimos_12_meses
+    widgets: List[WidgetPagina] = Field(..., min_length=1, max_length=30)
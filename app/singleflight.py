@@ -0,0 +1,141 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import threading
+import time
+
+from app.cache import argumentos_normalizados
+from app.database import settings
+from app.diretorios import diretorio_privado
+
+try:
+    import fcntl
+except ImportError:  # Sem fcntl (ex.: Windows) a coalescência fica restrita ao processo
+    fcntl = None
+
+# Arquivos de resultado e de trava mais antigos que isso são removidos na limpeza
+_IDADE_MAXIMA_ARQUIVOS_SEGUNDOS = 3600
+
+
+class _Voo:
+    """ Uma execução em andamento, aguardada por todas as chamadas idênticas concorrentes. """
+
+    def __init__(self):
+        self.concluido = threading.Event()
+        self.resultado = None
+        self.erro = None
+        self.abandonado = False
+
+
+_voos = {}
+_trava_voos = threading.Lock()
+_ultima_limpeza = {"em": 0.0}
+
+
+def _diretorio():
+    return diretorio_privado(settings.singleflight_dir, "dashmob-singleflight")
+
+
+def _chave(nome: str, argumentos: tuple) -> str:
+    bruto = repr((nome, argumentos))
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+def _limpar_arquivos_antigos(diretorio: str):
+    agora = time.time()
+    if agora - _ultima_limpeza["em"] < 60:
+        return
+    _ultima_limpeza["em"] = agora
+    for nome in os.listdir(diretorio):
+        caminho = os.path.join(diretorio, nome)
+        try:
+            if agora - os.stat(caminho).st_mtime > _IDADE_MAXIMA_ARQUIVOS_SEGUNDOS:
+                os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+
+def _executar_entre_processos(chave: str, executar):
+    """
+    Coalesce entre workers da mesma máquina com uma trava de arquivo (flock) por chave.
+    Quem obtém a trava executa a consulta e publica o resultado em disco; os demais
+    esperam a trava e, se o resultado foi publicado depois que começaram a esperar,
+    reaproveitam-no em vez de repetir a consulta. Sem um diretório privado seguro,
+    a coalescência fica restrita ao processo.
+    """
+    diretorio = _diretorio()
+    if diretorio is None:
+        return executar()
+    caminho_resultado = os.path.join(diretorio, f"{chave}.pickle")
+    chegada = time.time()
+
+    with open(os.path.join(diretorio, f"{chave}.lock"), "a+b") as trava:
+        fcntl.flock(trava, fcntl.LOCK_EX)
+        try:
+            try:
+                if os.stat(caminho_resultado).st_mtime >= chegada:
+                    with open(caminho_resultado, "rb") as arquivo:
+                        return pickle.load(arquivo)
+            except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+                pass
+
+            resultado = executar()
+
+            temporario = f"{caminho_resultado}.{os.getpid()}.tmp"
+            with open(temporario, "wb") as arquivo:
+                pickle.dump(resultado, arquivo, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporario, caminho_resultado)
+            _limpar_arquivos_antigos(diretorio)
+            return resultado
+        finally:
+            fcntl.flock(trava, fcntl.LOCK_UN)
+
+
+def coalescer(funcao):
+    """
+    Decorator para funções de consulta no formato f(db, *parametros). Chamadas
+    concorrentes com o mesmo nome de consulta e os mesmos parâmetros esperam uma
+    única execução e compartilham o resultado, tanto entre threads do processo
+    quanto entre workers (quando singleflight_entre_processos está ativo).
+    A sessão 'db' não faz parte da chave: a execução usa a sessão do primeiro a chegar.
+    """
+    nome = f"{funcao.__module__}.{funcao.__name__}"
+    assinatura = inspect.signature(funcao)
+
+    @functools.wraps(funcao)
+    def wrapper(db, *args, **kwargs):
+        chave = _chave(nome, argumentos_normalizados(assinatura, db, args, kwargs))
+        with _trava_voos:
+            voo = _voos.get(chave)
+            lider = voo is None
+            if lider:
+                voo = _voos[chave] = _Voo()
+
+        if not lider:
+            voo.concluido.wait()
+            if voo.erro is not None:
+                if voo.abandonado:
+                    # A consulta do líder foi cancelada porque o cliente dele desconectou:
+                    # quem esperava refaz a consulta com a própria sessão.
+                    return wrapper(db, *args, **kwargs)
+                raise voo.erro
+            return voo.resultado
+
+        try:
+            if settings.singleflight_entre_processos and fcntl is not None:
+                voo.resultado = _executar_entre_processos(chave, lambda: funcao(db, *args, **kwargs))
+            else:
+                voo.resultado = funcao(db, *args, **kwargs)
+            return voo.resultado
+        except Exception as e:
+            voo.erro = e
+            voo.abandonado = db.info.get("cancelada_por_desconexao", False)
+            raise
+        finally:
+            with _trava_voos:
+                _voos.pop(chave, None)
+            voo.concluido.set()
+
+    return wrapper
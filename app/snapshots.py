@@ -0,0 +1,151 @@
+import functools
+import inspect
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import date
+from types import SimpleNamespace
+from typing import Iterable, Tuple
+
+from app.cache import argumentos_normalizados, versao_dados
+from app.database import settings
+from app.periodos import mes_completo
+
+logger = logging.getLogger(__name__)
+
+_ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS snapshots (
+        tipo TEXT NOT NULL,
+        id_entidade INTEGER NOT NULL,
+        data_inicio TEXT NOT NULL,
+        data_fim TEXT NOT NULL,
+        versao TEXT NOT NULL,
+        payload BLOB NOT NULL,
+        gerado_em REAL NOT NULL,
+        PRIMARY KEY (tipo, id_entidade, data_inicio, data_fim, versao)
+    ) WITHOUT ROWID
+"""
+
+
+def _valor_simples(valor):
+    # Row do SQLAlchemy -> dict; None (entidade sem dados) e outros valores ficam como estão
+    mapeamento = getattr(valor, "_mapping", None)
+    return dict(mapeamento) if mapeamento is not None else valor
+
+
+class ArmazemSnapshots:
+    """
+    Resultados de dashboards já serializados (pickle comprimido com zlib) em um arquivo
+    SQLite local, que sobrevive a deploys e reinícios dos workers. As linhas do
+    SQLAlchemy são gravadas como dicionários simples, para que o arquivo não dependa
+    da versão da biblioteca, e lidas de volta com acesso por atributo. A chave é
+    (tipo de entidade, id, período, versão dos dados): uma carga nova muda a versão e
+    os snapshots anteriores deixam de ser lidos. Cada thread usa a própria conexão; o
+    modo WAL deixa os workers lendo enquanto o job de preenchimento grava.
+    """
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._local = threading.local()
+
+    def _conexao(self) -> sqlite3.Connection:
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            diretorio = os.path.dirname(os.path.abspath(self.caminho))
+            os.makedirs(diretorio, exist_ok=True)
+            conexao = sqlite3.connect(self.caminho, timeout=30)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute("PRAGMA synchronous=NORMAL")
+            conexao.execute(_ESQUEMA)
+            conexao.commit()
+            self._local.conexao = conexao
+        return conexao
+
+    def ler(self, tipo: str, id_entidade: int, data_inicio: date, data_fim: date, versao: str):
+        """ Retorna (encontrado, valor). O valor guardado pode ser None (entidade sem dados no período). """
+        linha = self._conexao().execute(
+            "SELECT payload FROM snapshots"
+            " WHERE tipo = ? AND id_entidade = ? AND data_inicio = ? AND data_fim = ? AND versao = ?",
+            (tipo, id_entidade, data_inicio.isoformat(), data_fim.isoformat(), versao),
+        ).fetchone()
+        if linha is None:
+            return False, None
+        valor = pickle.loads(zlib.decompress(linha[0]))
+        return True, SimpleNamespace(**valor) if isinstance(valor, dict) else valor
+
+    def gravar(self, registros: Iterable[Tuple[str, int, date, date, str, object]]) -> int:
+        """ Grava, em uma única transação, os registros (tipo, id, data_inicio, data_fim, versão, valor). """
+        agora = time.time()
+        linhas = [
+            (
+                tipo, id_entidade, data_inicio.isoformat(), data_fim.isoformat(), versao,
+                zlib.compress(pickle.dumps(_valor_simples(valor), protocol=pickle.HIGHEST_PROTOCOL)), agora,
+            )
+            for tipo, id_entidade, data_inicio, data_fim, versao, valor in registros
+        ]
+        conexao = self._conexao()
+        with conexao:
+            conexao.executemany("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?)", linhas)
+        return len(linhas)
+
+    def remover_outras_versoes(self, versao: str) -> int:
+        """ Remove os snapshots de versões dos dados diferentes de 'versao'. Retorna quantos saíram. """
+        conexao = self._conexao()
+        with conexao:
+            removidos = conexao.execute("DELETE FROM snapshots WHERE versao != ?", (versao,)).rowcount
+        return removidos
+
+    def contagem(self, versao: str):
+        """ Quantidade de snapshots da versão, por tipo de entidade. """
+        return dict(self._conexao().execute(
+            "SELECT tipo, COUNT(*) FROM snapshots WHERE versao = ? GROUP BY tipo", (versao,)
+        ).fetchall())
+
+
+armazem_snapshots = ArmazemSnapshots(settings.snapshots_arquivo) if settings.snapshots_arquivo else None
+
+_dashboards = {}
+
+
+def snapshot_mensal(tipo: str):
+    """
+    Decorator para funções de dashboard no formato f(db, id_entidade, data_inicio,
+    data_fim, ...). Quando o período é um mês completo e os demais parâmetros estão
+    nos valores padrão, o resultado é lido do armazém de snapshots, se houver um
+    da versão atual dos dados; caso contrário, a consulta roda normalmente.
+    A função original fica registrada pelo tipo, para o job que preenche o armazém
+    (python -m app.manutencao.snapshots).
+    """
+    def decorator(funcao):
+        assinatura = inspect.signature(funcao)
+        padroes = tuple(parametro.default for parametro in list(assinatura.parameters.values())[4:])
+
+        @functools.wraps(funcao)
+        def wrapper(db, *args, **kwargs):
+            argumentos = argumentos_normalizados(assinatura, db, args, kwargs)
+            id_entidade, data_inicio, data_fim = argumentos[:3]
+            if armazem_snapshots is not None and argumentos[3:] == padroes and mes_completo(data_inicio, data_fim):
+                try:
+                    encontrado, valor = armazem_snapshots.ler(
+                        tipo, id_entidade, data_inicio, data_fim, versao_dados(db)
+                    )
+                    if encontrado:
+                        return valor
+                except Exception:
+                    # Snapshot ilegível (arquivo corrompido, formato antigo): a consulta roda normalmente
+                    logger.exception("Falha ao ler o snapshot de %s %s", tipo, id_entidade)
+            return funcao(db, *argumentos)
+
+        _dashboards[tipo] = funcao
+        return wrapper
+
+    return decorator
+
+
+def dashboards_com_snapshot():
+    """ As funções de dashboard (sem a leitura do armazém) registradas, por tipo de entidade. """
+    return dict(_dashboards)
@@ -0,0 +1,169 @@
+from datetime import date
+from functools import lru_cache
+from typing import Any, Callable, List, Literal, Optional, Type
+
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
+from sqlalchemy.orm import Session
+
+from app import schemas
+from app.analise import reduzir_serie
+from app.queries import (
+    bairros as queries_bairros,
+    concessionarias as queries_concessionarias,
+    empresas as queries_empresas,
+    geral as queries_geral,
+    linhas as queries_linhas,
+    ocorrencias as queries_ocorrencias,
+    series as queries_series,
+    veiculos as queries_veiculos,
+)
+
+
+class _SemParametros(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+
+class _ParametrosLimite(_SemParametros):
+    limit: int = Field(10, ge=1, le=50)
+
+
+class _ParametrosRankingLinhas(_ParametrosLimite):
+    metrica: Literal["passageiros", "viagens", "ocorrencias"]
+
+
+class _ParametrosRankingEntidade(_ParametrosLimite):
+    entidade: Literal["empresa", "concessionaria", "linha"]
+
+
+class _ParametrosRankingBairros(_ParametrosLimite):
+    metrica: Literal["linhas", "ocorrencias", "pontos"]
+
+
+class _ParametrosRankingVeiculos(_ParametrosLimite):
+    metrica: Literal["passageiros", "ocorrencias", "km_percorrido"]
+
+
+class _ParametrosSerie(_SemParametros):
+    metrica: Literal["passageiros", "viagens", "ocorrencias", "km_percorrido"]
+    granularidade: Literal["dia", "semana", "mes", "ano"] = "dia"
+    entidade: Optional[Literal["linha", "empresa", "concessionaria", "veiculo"]] = None
+    id_entidade: Optional[int] = None
+    max_pontos: Optional[int] = Field(None, ge=3, le=10000)
+
+
+class Widget:
+    """
+    Um widget que pode ser pedido no endpoint de página: a função de consulta,
+    o schema da resposta (o mesmo do endpoint equivalente), o modelo dos
+    parâmetros próprios do widget e como montar os argumentos a partir deles e
+    do período compartilhado pela página.
+    """
+
+    def __init__(
+        self,
+        funcao: Callable,
+        modelo: Any,
+        argumentos: Callable[[Any, date, date], tuple],
+        parametros: Type[_SemParametros] = _SemParametros,
+        formatar: Optional[Callable[[Any, Any], Any]] = None,
+    ):
+        self.funcao = funcao
+        self.modelo = modelo
+        self.argumentos = argumentos
+        self.parametros = parametros
+        self.formatar = formatar
+
+    def executar(
+        self, db: Session, parametros: _SemParametros, data_inicio: date, data_fim: date, recalcular: bool = False
+    ) -> bytes:
+        """
+        Executa a consulta e devolve o JSON do widget já serializado. Com 'recalcular',
+        ignora o resultado em cache (se a função tiver cache) e grava o novo valor.
+        """
+        funcao = getattr(self.funcao, "recalcular", self.funcao) if recalcular else self.funcao
+        resultado = funcao(db, *self.argumentos(parametros, data_inicio, data_fim))
+        if self.formatar is not None:
+            resultado = self.formatar(parametros, resultado)
+        adaptador = _adaptador(self.modelo)
+        # exclude_unset mantém o formato dos endpoints equivalentes (sem os campos de comparação)
+        return adaptador.dump_json(adaptador.validate_python(resultado, from_attributes=True), exclude_unset=True)
+
+
+@lru_cache(maxsize=None)
+def _adaptador(modelo) -> TypeAdapter:
+    return TypeAdapter(modelo)
+
+
+def _formatar_serie(p: _ParametrosSerie, serie):
+    return {
+        "metrica": p.metrica,
+        "granularidade": p.granularidade,
+        "total_pontos": len(serie),
+        "serie": reduzir_serie(serie, p.max_pontos) if p.max_pontos else serie,
+    }
+
+
+# Widgets disponíveis, pelo nome da rota equivalente na API
+WIDGETS = {
+    "geral/kpis": Widget(
+        queries_geral.get_kpis_gerais, schemas.KpiGeral, lambda p, inicio, fim: (inicio, fim)
+    ),
+    "linhas/ranking": Widget(
+        queries_linhas.get_ranking_linhas,
+        schemas.RankingResponse,
+        lambda p, inicio, fim: (p.metrica, inicio, fim, p.limit),
+        _ParametrosRankingLinhas,
+        lambda p, ranking: {"metrica": p.metrica, "ranking": ranking},
+    ),
+    "ocorrencias/ranking-por-justificativa": Widget(
+        queries_ocorrencias.get_ranking_ocorrencias_por_justificativa,
+        List[schemas.RankingOcorrenciasItem],
+        lambda p, inicio, fim: (inicio, fim, p.limit),
+        _ParametrosLimite,
+    ),
+    "ocorrencias/ranking-por-entidade": Widget(
+        queries_ocorrencias.get_ranking_ocorrencias_por_entidade,
+        List[schemas.RankingOcorrenciasItem],
+        lambda p, inicio, fim: (p.entidade, inicio, fim, p.limit),
+        _ParametrosRankingEntidade,
+    ),
+    "ocorrencias/tendencia-temporal": Widget(
+        queries_ocorrencias.get_tendencia_temporal_ocorrencias,
+        List[schemas.TendenciaTemporalItem],
+        lambda p, inicio, fim: (inicio, fim),
+    ),
+    "ocorrencias/por-tipo-dia": Widget(
+        queries_ocorrencias.get_ocorrencias_por_tipo_dia,
+        List[schemas.OcorrenciasPorTipoDiaItem],
+        lambda p, inicio, fim: (inicio, fim),
+    ),
+    "bairros/ranking": Widget(
+        queries_bairros.get_ranking_bairros,
+        List[schemas.RankingItem],
+        lambda p, inicio, fim: (p.metrica, inicio, fim, p.limit),
+        _ParametrosRankingBairros,
+    ),
+    "veiculos/ranking": Widget(
+        queries_veiculos.get_ranking_veiculos,
+        List[schemas.RankingVeiculoItem],
+        lambda p, inicio, fim: (p.metrica, inicio, fim, p.limit),
+        _ParametrosRankingVeiculos,
+    ),
+    "empresas/ranking-comparativo": Widget(
+        queries_empresas.get_ranking_empresas,
+        List[schemas.RankingEmpresaItem],
+        lambda p, inicio, fim: (inicio, fim),
+    ),
+    "concessionarias/ranking-comparativo": Widget(
+        queries_concessionarias.get_ranking_concessionarias,
+        List[schemas.RankingConcessionariaItem],
+        lambda p, inicio, fim: (inicio, fim),
+    ),
+    "series": Widget(
+        queries_series.get_serie_temporal,
+        schemas.SerieTemporalResponse,
+        lambda p, inicio, fim: (p.metrica, p.granularidade, inicio, fim, p.entidade, p.id_entidade),
+        _ParametrosSerie,
+        _formatar_serie,
+    ),
+}
@@ -0,0 +1,4 @@
+import os
+
+# app.database cria o engine na importação; os testes não abrem conexões com o banco
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
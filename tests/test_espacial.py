@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+import shapely
+
+from app.espacial import IndiceEspacial
+
+
+def _bairro(id_bairro, geometria):
+    # Como o psycopg2 devolve o bytea de ST_AsBinary(geom)
+    return SimpleNamespace(id_bairro=id_bairro, wkb=memoryview(shapely.to_wkb(geometria)))
+
+
+def test_indice_aceita_wkb_em_memoryview():
+    pontos = [
+        SimpleNamespace(id_ponto=1, latitude=-5.0900, longitude=-42.8000),
+        SimpleNamespace(id_ponto=2, latitude=-5.0950, longitude=-42.8050),
+    ]
+    bairros = [
+        _bairro(10, shapely.box(-42.81, -5.10, -42.80, -5.09)),
+        _bairro(20, shapely.box(-42.80, -5.09, -42.79, -5.08)),
+    ]
+
+    indice = IndiceEspacial(pontos, bairros)
+
+    assert indice.total_bairros == 2
+    assert indice.bairro_do_ponto(-5.095, -42.805).id_bairro == 10
+    assert indice.bairro_do_ponto(-5.085, -42.795).id_bairro == 20
+    assert indice.bairro_do_ponto(-5.0, -42.0) is None
+    assert [p.id_ponto for p, _ in indice.pontos_proximos(-5.0901, -42.8001, 100, 5)] == [1]
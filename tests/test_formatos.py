@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+import pyarrow as pa
+import pytest
+from fastapi import Response
+from pydantic import BaseModel
+
+from app.formatos import MEDIA_TYPE_ARROW, MEDIA_TYPE_ARROW_ARQUIVO, resposta_colunar
+
+
+class _Linha(BaseModel):
+    id_linha: int
+    nome: str
+
+
+class _Row(tuple):
+    _fields = ("id_linha", "nome")
+
+
+@pytest.mark.parametrize("media_type, abrir", [
+    (MEDIA_TYPE_ARROW, pa.ipc.open_stream),
+    (MEDIA_TYPE_ARROW_ARQUIVO, pa.ipc.open_file),
+])
+def test_arrow_no_formato_pedido(media_type, abrir):
+    request = SimpleNamespace(headers={"accept": media_type})
+    resposta = resposta_colunar(request, Response(), [_Row((1, "A")), _Row((2, "B"))], _Linha)
+
+    assert resposta.media_type == media_type
+    assert abrir(pa.BufferReader(resposta.body)).read_all().to_pydict() == {"id_linha": [1, 2], "nome": ["A", "B"]}
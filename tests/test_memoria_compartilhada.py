@@ -0,0 +1,43 @@
+import os
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import HTTPException
+
+from app import compressao, memoria_compartilhada
+from app.database import settings
+
+
+@pytest.fixture
+def diretorio(tmp_path, monkeypatch):
+    tmp_path.chmod(0o700)
+    monkeypatch.setattr(settings, "memoria_compartilhada", True)
+    monkeypatch.setattr(settings, "memoria_compartilhada_dir", str(tmp_path))
+    monkeypatch.setattr(compressao, "versao_dados", lambda db: "v1")
+    memoria_compartilhada._segmentos.limpar()
+    compressao.cache_respostas.limpar()
+    return tmp_path
+
+
+def _falhar():
+    raise HTTPException(status_code=404)
+
+
+def test_falha_ao_construir_nao_deixa_temporario(diretorio):
+    for _ in range(3):
+        with pytest.raises(HTTPException):
+            memoria_compartilhada.segmento("catalogo", "v1", _falhar)
+    assert [nome for nome in os.listdir(diretorio) if nome.endswith(".tmp")] == []
+
+    segmento = memoria_compartilhada.segmento("catalogo", "v1", lambda: {"a": b"ok"})
+    assert bytes(segmento.get("a")) == b"ok"
+
+
+def test_chaves_por_entidade_nao_usam_memoria_compartilhada(diretorio):
+    for cod_linha in ("1", "2", "3"):
+        with pytest.raises(HTTPException):
+            compressao.preparar_resposta_pre_comprimida(MagicMock(), f"linhas:{cod_linha}:pontos", dict, _falhar)
+    entrada = compressao.preparar_resposta_pre_comprimida(MagicMock(), "linhas:4:pontos", dict, lambda: {"a": 1})
+
+    assert entrada.corpos[None] == b'{"a":1}'
+    assert os.listdir(diretorio) == []